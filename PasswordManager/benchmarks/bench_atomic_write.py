@@ -0,0 +1,80 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/4 16:00
+@File: bench_atomic_write.py
+@Description: 快照写入管线的开销
+
+对比同样大小（默认 10 MB）的数据：
+    raw        直接覆盖写入
+    raw+fsync  直接覆盖写入并 fsync
+    atomic     utils.file_ops.atomic_write（临时文件 + fsync + 改名 + 目录 fsync）
+    atomic+bak 同上，另外轮换 3 份硬链接备份
+
+用法：python benchmarks/bench_atomic_write.py [--size-mb 10] [--rounds 20] [--dir 路径]
+--dir 应指向与保险库相同的文件系统，fsync 的代价与磁盘有关。
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from utils.file_ops import atomic_write  # noqa: E402
+
+
+def _raw(path, payload, sync):
+    with open(path, "wb") as f:
+        f.write(payload)
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def _atomic(path, payload, backups):
+    with atomic_write(path, backups=backups) as f:
+        f.write(payload)
+
+
+def measure(fn, rounds):
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), min(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="快照写入管线的开销")
+    parser.add_argument("--size-mb", type=float, default=10)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--dir", default=None)
+    args = parser.parse_args()
+
+    payload = os.urandom(int(args.size_mb * 1024 * 1024))
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        path = os.path.join(tmp, "passwords.dat")
+        cases = [
+            ("raw", lambda: _raw(path, payload, False)),
+            ("raw+fsync", lambda: _raw(path, payload, True)),
+            ("atomic", lambda: _atomic(path, payload, 0)),
+            ("atomic+bak", lambda: _atomic(path, payload, 3)),
+        ]
+        results = {}
+        for name, fn in cases:
+            fn()  # 预热，确保文件和备份都已存在
+            results[name] = measure(fn, args.rounds)
+
+    base = results["raw+fsync"][0]
+    print(f"{args.size_mb:g} MB x {args.rounds} 次（中位数 / 最小值，毫秒）")
+    for name, (median, best) in results.items():
+        extra = f"  相对 raw+fsync {median - base:+.2f}" if name.startswith("atomic") else ""
+        print(f"  {name:<11} {median:8.2f} / {best:8.2f}{extra}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/13 14:30
+@File: bench_vault.py
+@Description: 保险库和 Qt 模型的压测
+
+对每个规模（默认 1k、10k、100k 条）用 vault_gen.py 生成合成保险库，然后测量：
+    file_kb            数据文件（快照）的大小
+    unlock_ms          SecureStorage.unlock（密钥派生 + 校验）
+    load_ms            解锁后第一次 load_data（读取快照、解密全部条目）
+    load_rss_mb        load_data 期间常驻内存的增量
+    save_ms            改一个条目后 save_data（追加一帧日志）的中位数
+    compact_ms         日志折叠回快照（重写整个数据文件）
+    table_model_ms     PasswordTableModel 构造
+    category_model_ms  CategoryTreeModel 构造（含各分类的条目数）
+    window_ms          MainWindow 构造（含建立搜索索引）
+    search_ms          SearchIndex.search 的中位数 / search_max_ms 最大值
+    filter_ms          MainWindow._load_password_data 按搜索结果过滤表格的中位数
+    peak_rss_mb        整个测量进程的内存峰值
+
+每个规模的生成和测量分别在单独的进程中进行，内存峰值互不影响；Qt 使用 offscreen 平台。
+结果以 JSON 输出，给出 --baseline 时逐项与基线比较，超出容差的项视为退化，退出码为 1，
+可以直接用于 CI 门禁。所有指标都是越小越好。
+
+用法：
+    python benchmarks/bench_vault.py [--sizes 1000,10000,100000] [--output results.json]
+                                     [--baseline baseline.json] [--tolerance 0.25]
+                                     [--workdir DIR] [--kdf scrypt] [--rounds 5]
+--sizes 1000000 测 100 万条：生成约需两分钟，内存需要数 GB。--workdir 指定后保留生成的
+保险库，参数相同时下次直接复用；不指定时使用临时目录，结束后删除。
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from vault_gen import MASTER_PASSWORD, VaultSpec, generate_vault, open_storage  # noqa: E402
+
+SCHEMA_VERSION = 1
+DEFAULT_SIZES = "1000,10000,100000"
+# 比较基线时忽略的绝对差值，避免小规模下的计时抖动被当成退化
+NOISE_FLOOR = {"_ms": 2.0, "_mb": 8.0}
+
+
+def _elapsed_ms(started) -> float:
+    return round((time.perf_counter() - started) * 1000, 3)
+
+
+def _rss_mb():
+    """进程至今的常驻内存峰值（MB）；没有 resource 模块的平台（Windows）返回 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _queries(entries):
+    """从数据中取几类有代表性的查询：英文前缀、中文、网址、不存在的词"""
+    queries = ["zzqx"]
+    for entry in entries:
+        if len(queries) == 1 and len(entry.username) >= 3:
+            queries.append(entry.username[:3])
+        cjk = [ch for ch in entry.name if ord(ch) > 0x2E80]
+        if len(queries) == 2 and len(cjk) >= 2:
+            queries.append("".join(cjk[:2]))
+        if len(queries) == 3:
+            break
+    queries.append("^" + entries[0].url.split("//")[1][:4] if entries else "example")
+    return queries
+
+
+def measure(directory, kdf, rounds) -> dict:
+    """在已生成的保险库上测量各项指标（在单独的进程中调用）"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    results = {}
+    base_rss = _rss_mb()
+
+    storage = open_storage(directory, kdf)
+    results["file_kb"] = round(os.path.getsize(storage.config.data_path) / 1024, 1)
+    started = time.perf_counter()
+    if not storage.unlock(MASTER_PASSWORD):
+        raise RuntimeError("无法解锁生成的保险库")
+    results["unlock_ms"] = _elapsed_ms(started)
+
+    started = time.perf_counter()
+    data = storage.load_data()
+    results["load_ms"] = _elapsed_ms(started)
+    if base_rss is not None:
+        results["load_rss_mb"] = round(_rss_mb() - base_rss, 1)
+
+    entries = data["passwords"]
+    samples = []
+    for i in range(rounds):
+        row = i % len(entries)
+        with storage.lock:
+            entries[row] = entries[row].replace(notes=f"bench {i}")
+        storage.session.mark_dirty()
+        started = time.perf_counter()
+        storage.save_data(data)
+        samples.append(_elapsed_ms(started))
+    results["save_ms"] = statistics.median(samples)
+
+    started = time.perf_counter()
+    storage.compact(wait=True)
+    results["compact_ms"] = _elapsed_ms(started)
+
+    from PyQt6.QtWidgets import QApplication
+    from core.category_index import CategoryIndex
+    from core.models import CategoryTreeModel, PasswordTableModel
+    from core.repository import PasswordRepository
+    from ui.main_window import MainWindow
+
+    app = QApplication.instance() or QApplication([])
+    repository = PasswordRepository(entries)
+    category_index = CategoryIndex(data["categories"])
+
+    started = time.perf_counter()
+    PasswordTableModel(repository, category_index)
+    results["table_model_ms"] = _elapsed_ms(started)
+
+    def count(category_id):
+        if category_id is None:
+            return len(repository)
+        return sum(len(repository.ids_in_category(c)) for c in category_index.subtree(category_id))
+
+    started = time.perf_counter()
+    CategoryTreeModel(category_index, count)
+    results["category_model_ms"] = _elapsed_ms(started)
+
+    started = time.perf_counter()
+    window = MainWindow(storage, storage.config)
+    results["window_ms"] = _elapsed_ms(started)
+
+    search_samples, filter_samples = [], []
+    for query in _queries(entries):
+        for _ in range(rounds):
+            started = time.perf_counter()
+            matches = window.search_index.search(query)
+            search_samples.append(_elapsed_ms(started))
+
+            started = time.perf_counter()
+            window._search_matches = matches
+            window._load_password_data()
+            window.password_proxy.rowCount()
+            filter_samples.append(_elapsed_ms(started))
+
+            window._search_matches = None
+            window._load_password_data()
+    results["search_ms"] = statistics.median(search_samples)
+    results["search_max_ms"] = max(search_samples)
+    results["filter_ms"] = statistics.median(filter_samples)
+
+    window.autosave.flush()
+    window.deleteLater()
+    app.processEvents()
+    storage.close_session()
+    if base_rss is not None:
+        results["peak_rss_mb"] = _rss_mb()
+    return results
+
+
+def compare(baseline, current, tolerance):
+    """逐项比较，返回 [(规模, 指标, 基线, 当前, 是否退化)]"""
+    rows = []
+    for size, metrics in current["results"].items():
+        base_metrics = baseline.get("results", {}).get(size, {})
+        for name, value in metrics.items():
+            base = base_metrics.get(name)
+            if base is None or value is None:
+                continue
+            floor = next((v for suffix, v in NOISE_FLOOR.items() if name.endswith(suffix)), 0)
+            regressed = value > base * (1 + tolerance) and value - base > floor
+            rows.append((size, name, base, value, regressed))
+    return rows
+
+
+def _run_phase(phase, size, directory, args):
+    """在子进程中生成或测量，返回测量结果；保险库本身的日志输出不显示"""
+    with tempfile.NamedTemporaryFile("r", suffix=".json", delete=False) as out:
+        result_path = out.name
+    command = [sys.executable, os.path.abspath(__file__), "--phase", phase, "--size", str(size),
+               "--dir", directory, "--result", result_path, "--rounds", str(args.rounds)]
+    if args.kdf:
+        command += ["--kdf", args.kdf]
+    try:
+        proc = subprocess.run(command, stdout=None if args.verbose else subprocess.DEVNULL,
+                              stderr=subprocess.PIPE, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"{phase} {size} 失败:\n{proc.stderr}")
+        with open(result_path, encoding="utf-8") as f:
+            return json.load(f)
+    finally:
+        os.remove(result_path)
+
+
+def _prepare_vault(size, workdir, args):
+    """生成（或复用）指定规模的保险库，返回所在目录"""
+    directory = os.path.join(workdir, f"vault-{size}")
+    spec = dict(VaultSpec(entries=size).to_dict(), kdf=args.kdf)
+    spec_path = os.path.join(directory, "spec.json")
+    if os.path.exists(spec_path):
+        with open(spec_path, encoding="utf-8") as f:
+            if json.load(f) == spec:
+                return directory
+        shutil.rmtree(directory)
+
+    os.makedirs(directory)
+    started = time.perf_counter()
+    _run_phase("generate", size, directory, args)
+    print(f"  已生成 {size} 条（{time.perf_counter() - started:.1f} 秒）", flush=True)
+    with open(spec_path, "w", encoding="utf-8") as f:
+        json.dump(spec, f)
+    return directory
+
+
+def _print_results(results):
+    names = list(next(iter(results.values())))
+    sizes = list(results)
+    print(f"{'指标':<18}" + "".join(f"{size:>12}" for size in sizes))
+    for name in names:
+        cells = "".join(
+            f"{results[size][name]:>12.2f}" if results[size].get(name) is not None else f"{'-':>12}"
+            for size in sizes
+        )
+        print(f"{name:<18}{cells}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="保险库和 Qt 模型的压测")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="逗号分隔的条目数")
+    parser.add_argument("--output", help="结果写入的 JSON 文件")
+    parser.add_argument("--baseline", help="用于比较的基线 JSON（以前的 --output）")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="允许比基线慢/大的比例")
+    parser.add_argument("--workdir", help="保留生成的保险库的目录")
+    parser.add_argument("--kdf", default=None, help="密钥派生算法，默认使用配置中的算法")
+    parser.add_argument("--rounds", type=int, default=5, help="保存、搜索等重复测量的次数")
+    parser.add_argument("--verbose", action="store_true", help="显示保险库的日志输出")
+    # 以下参数由主进程传给子进程
+    parser.add_argument("--phase", choices=("generate", "measure"), help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--dir", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.phase is not None:
+        if args.phase == "generate":
+            generate_vault(open_storage(args.dir, args.kdf), VaultSpec(entries=args.size))
+            result = {}
+        else:
+            result = measure(args.dir, args.kdf, args.rounds)
+        with open(args.result, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    report = {
+        "schema": SCHEMA_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "kdf": args.kdf,
+        },
+        "spec": {k: v for k, v in VaultSpec().to_dict().items() if k != "entries"},
+        "results": {},
+    }
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="pm-bench-")
+    try:
+        for size in sizes:
+            print(f"{size} 条:", flush=True)
+            directory = _prepare_vault(size, workdir, args)
+            # 测量会修改保险库（保存、压缩），在副本上进行，保留的保险库下次还是同样的状态
+            scratch = os.path.join(workdir, "scratch")
+            shutil.rmtree(scratch, ignore_errors=True)
+            shutil.copytree(directory, scratch)
+            try:
+                report["results"][str(size)] = _run_phase("measure", size, scratch, args)
+            finally:
+                shutil.rmtree(scratch, ignore_errors=True)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    _print_results(report["results"])
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare(baseline, report, args.tolerance)
+        regressions = [row for row in rows if row[4]]
+        print(f"\n与基线 {args.baseline} 比较（容差 {args.tolerance:.0%}）:")
+        for size, name, base, value, regressed in rows:
+            change = (value - base) / base if base else 0.0
+            mark = "  ← 退化" if regressed else ""
+            print(f"  {size:>8} {name:<18} {base:>10.2f} -> {value:>10.2f} ({change:+.1%}){mark}")
+        if regressions:
+            print(f"{len(regressions)} 项超出容差")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/13 10:10
+@File: vault_gen.py
+@Description: 生成用于压测的合成保险库
+
+条目数、各字段长度、中文字符所占比例、分类树的数量和深度都可以调整；同样的参数和
+随机种子总是生成同样的内容（条目 ID 和密文除外）。生成的保险库与正常使用时的格式
+完全相同：密码逐条用数据密钥加密，整体通过 SecureStorage.save_data 写成快照。
+
+可以单独运行，在指定目录下生成保险库（配置目录即该目录）：
+    python benchmarks/vault_gen.py DIR --entries 100000 [--cjk-ratio 0.3] [--depth 3]
+bench_vault.py 通过 generate_vault() 调用。
+"""
+
+import argparse
+import os
+import random
+import string
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from core.record import PasswordRecord  # noqa: E402
+from core.repository import new_entry_id  # noqa: E402
+from core.session import VaultSession  # noqa: E402
+
+# 生成的保险库统一使用的主密码
+MASTER_PASSWORD = "benchmark"
+
+_ASCII = string.ascii_lowercase + string.digits
+_PASSWORD_CHARS = string.ascii_letters + string.digits + "!@#$%^&*()-_=+"
+# 常用汉字，覆盖搜索索引按单字切分的情形
+_CJK = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处队南给色光门即保治北造百规热领七海口东导器压志世金增争济阶油思术极交受联什认六共权收证改清己美再采转更单风切打白教速花带安场身车例真务具万每目至达走积示议声报斗完类八离华名确才科张信马节话米整空元况今集温传土许步群广石记需段研界拉林律叫且究观越织装影算低持音众书布复容儿须际商非验连断深难近矿千周委素技备半办青省列习响约支般史感劳便团往酸历市克何除消构府称太准精值号率族维划选标写存候毛亲快效斯院查江型眼王按格养易置派层片始却专状育厂京识适属圆包火住调满县局照参红细引听该铁价严龙飞"
+
+
+class VaultSpec:
+    """合成保险库的参数"""
+
+    def __init__(self, entries=1000, categories=40, depth=3, cjk_ratio=0.3,
+                 name_len=(4, 16), username_len=(6, 20), notes_len=(0, 80), password_len=16, seed=0):
+        self.entries = entries
+        self.categories = categories
+        # 分类树的最大层数，1 表示没有子分类
+        self.depth = depth
+        # 名称、备注中中文字符的比例（0 ~ 1）
+        self.cjk_ratio = cjk_ratio
+        self.name_len = name_len
+        self.username_len = username_len
+        self.notes_len = notes_len
+        self.password_len = password_len
+        self.seed = seed
+
+    def to_dict(self) -> dict:
+        return {
+            "entries": self.entries,
+            "categories": self.categories,
+            "depth": self.depth,
+            "cjk_ratio": self.cjk_ratio,
+            "name_len": list(self.name_len),
+            "username_len": list(self.username_len),
+            "notes_len": list(self.notes_len),
+            "password_len": self.password_len,
+            "seed": self.seed,
+        }
+
+
+def _text(rng, length_range, cjk_ratio):
+    length = rng.randint(*length_range)
+    return "".join(
+        rng.choice(_CJK) if rng.random() < cjk_ratio else rng.choice(_ASCII)
+        for _ in range(length)
+    )
+
+
+def make_categories(rng, spec):
+    """按最大深度随机挂接的分类表，格式同 data["categories"]"""
+    categories = []
+    depth_of = {}
+    for cat_id in range(1, spec.categories + 1):
+        parents = [c for c in depth_of if depth_of[c] < spec.depth]
+        # 约三分之一放在顶层，保证树既有宽度也有深度
+        parent_id = rng.choice(parents) if parents and rng.random() > 0.3 else None
+        depth_of[cat_id] = 1 if parent_id is None else depth_of[parent_id] + 1
+        categories.append({"id": cat_id, "name": _text(rng, (2, 8), spec.cjk_ratio), "parent_id": parent_id})
+    return categories
+
+
+def make_entries(storage, rng, spec, category_ids, progress=None):
+    """生成条目；密码用 storage 的数据密钥逐条加密"""
+    entries = []
+    step = max(1, spec.entries // 100)
+    for i in range(spec.entries):
+        entry_id = new_entry_id()
+        host = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 12)))
+        password = "".join(rng.choice(_PASSWORD_CHARS) for _ in range(spec.password_len))
+        entries.append(PasswordRecord(
+            id=entry_id,
+            name=_text(rng, spec.name_len, spec.cjk_ratio),
+            url=f"https://{host}.example.com/login",
+            username=_text(rng, spec.username_len, 0) + "@example.com",
+            encrypted_password=storage.encrypt_secret(entry_id, password),
+            notes=_text(rng, spec.notes_len, spec.cjk_ratio),
+            category_id=rng.choice(category_ids) if category_ids and rng.random() > 0.1 else None
+        ))
+        if progress is not None and (i + 1) % step == 0:
+            progress(i + 1, spec.entries)
+    return entries
+
+
+def generate_vault(storage, spec, progress=None) -> dict:
+    """在 storage（尚未设置主密码）中生成并保存保险库，返回写入的数据"""
+    rng = random.Random(spec.seed)
+    salt = storage.initialize_master_key(MASTER_PASSWORD)
+    categories = make_categories(rng, spec)
+    data = {"passwords": [], "categories": categories, "master_salt": salt.hex()}
+    # 先建会话，加密密码时才能生成数据密钥；之后的第一次保存整体写成快照
+    storage.session = VaultSession(data)
+    data["passwords"] = make_entries(storage, rng, spec, [c["id"] for c in categories], progress)
+    storage.save_data(data)
+    return data
+
+
+def open_storage(directory, kdf=None):
+    """以 directory 为配置目录创建 SecureStorage，不碰用户真正的保险库"""
+    from config.app_config import AppConfig
+    from core.secure_storage import SecureStorage
+
+    class BenchConfig(AppConfig):
+        def _get_config_path(self):
+            return Path(directory).resolve()
+
+    config = BenchConfig()
+    if kdf is not None:
+        config.kdf_algorithm = kdf
+    return SecureStorage(config)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成用于压测的合成保险库")
+    parser.add_argument("directory", help="保险库所在的配置目录（不能已有保险库）")
+    parser.add_argument("--entries", type=int, default=1000)
+    parser.add_argument("--categories", type=int, default=40)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--cjk-ratio", type=float, default=0.3)
+    parser.add_argument("--notes-max", type=int, default=80, help="备注最大长度")
+    parser.add_argument("--kdf", default=None, help="密钥派生算法，默认使用配置中的算法")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    spec = VaultSpec(entries=args.entries, categories=args.categories, depth=args.depth,
+                     cjk_ratio=args.cjk_ratio, notes_len=(0, args.notes_max), seed=args.seed)
+    storage = open_storage(args.directory, args.kdf)
+    if storage.is_master_password_set():
+        parser.error(f"{args.directory} 中已有保险库")
+    started = time.perf_counter()
+    generate_vault(storage, spec)
+    print(f"已生成 {args.entries} 条，用时 {time.perf_counter() - started:.1f} 秒，主密码: {MASTER_PASSWORD}")
+
+
+if __name__ == "__main__":
+    main()
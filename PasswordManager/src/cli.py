@@ -0,0 +1,238 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/10 14:00
+@File: cli.py
+@Description: 命令行接口
+
+不依赖 PyQt6，供脚本在没有图形界面的环境中读取和修改保险库（在 src 目录下运行）：
+
+    python -m cli list --category 工作
+    python -m cli get github --field password
+    python -m cli add --name GitHub --url https://github.com --username me --password-stdin
+    python -m cli batch < ops.jsonl
+
+结果以 JSON 输出到 stdout，日志和提示都写到 stderr。主密码依次取自 --password-file、
+环境变量 PM_PASSWORD，都没有时在终端中询问。每次运行只解锁一次（密钥派生本身就要
+几百毫秒），batch 从 stdin 逐行读取 {"op": "get", "entry": "..."} 形式的操作，
+同样只解锁一次、最后统一保存，适合大量调用。
+
+    python -m cli agent start &
+    python -m cli get github --field password
+
+agent start 解锁后在前台运行本地代理（见 core/agent.py），之后的 list/get/search
+直接向代理查询，不再询问主密码；代理没有运行、指定了 --vault 或 --no-agent 时照常解锁。
+
+退出码：0 成功，1 操作失败，2 参数错误，3 主密码错误。
+"""
+
+import argparse
+import csv
+import getpass
+import json
+import os
+import sys
+
+from config.app_config import AppConfig
+from core.agent import QUERY_OPS, AgentClient, AgentServer, agent_running
+from core.commands import CommandError, VaultCommands
+from core.secure_storage import SecureStorage
+from utils import trace
+
+EXIT_ERROR = 1
+EXIT_USAGE = 2
+EXIT_AUTH = 3
+
+
+class CliError(Exception):
+    def __init__(self, message, code=EXIT_ERROR):
+        super().__init__(message)
+        self.code = code
+
+
+# ---------------------------------------------------------------- 入口
+
+
+def _read_master_password(args):
+    if args.password_file:
+        with open(args.password_file, "r", encoding="utf-8") as f:
+            return f.readline().rstrip("\r\n")
+    password = os.getenv("PM_PASSWORD")
+    if password:
+        return password
+    if not sys.stdin.isatty() or args.command == "batch":
+        raise CliError("没有提供主密码（--password-file 或环境变量 PM_PASSWORD）", EXIT_AUTH)
+    return getpass.getpass("主密码: ", stream=sys.stderr)
+
+
+def _open_vault(args, config):
+    if args.vault:
+        config.data_path = os.path.abspath(args.vault)
+    storage = SecureStorage(config)
+    if not storage.is_master_password_set():
+        raise CliError(f"保险库不存在: {config.data_path}")
+    if not storage.unlock(_read_master_password(args)):
+        raise CliError("主密码错误", EXIT_AUTH)
+    return storage
+
+
+def _command_kwargs(args):
+    """把命令行参数转换为操作参数"""
+    kwargs = {k: v for k, v in vars(args).items() if k not in _GLOBAL_ARGS and k != "password_stdin"}
+    if getattr(args, "password_stdin", False):
+        kwargs["password"] = sys.stdin.readline().rstrip("\r\n")
+    if "export_password" in kwargs and kwargs["export_password"] is None and os.getenv("PM_EXPORT_PASSWORD"):
+        kwargs["export_password"] = os.getenv("PM_EXPORT_PASSWORD")
+    return kwargs
+
+
+def _run_batch(commands, out):
+    """逐行执行 stdin 中的操作，每个操作输出一行结果；返回失败的个数"""
+    failures = 0
+    for line_no, line in enumerate(sys.stdin, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = json.loads(line)
+            op = request.pop("op")
+            result = {"ok": True, "result": commands.run(op, **request)}
+        except (CommandError, ValueError, KeyError, OSError, csv.Error) as e:
+            failures += 1
+            result = {"ok": False, "line": line_no, "error": str(e) or type(e).__name__}
+        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+    commands.save()
+    return failures
+
+
+def _query_agent(args, config):
+    """向正在运行的代理查询；代理不可用时返回 None，由调用方自行解锁"""
+    if args.no_agent or args.vault or args.command not in QUERY_OPS:
+        return None
+    try:
+        with AgentClient(config.agent_socket_path) as agent:
+            return agent.request(args.command, **_command_kwargs(args))
+    except OSError:
+        return None
+
+
+def _run_agent(args, config):
+    path = config.agent_socket_path
+    if args.action == "status":
+        if not agent_running(path):
+            raise CliError("代理没有运行")
+        with AgentClient(path) as agent:
+            return agent.request("status")
+    if args.action == "stop":
+        if not agent_running(path):
+            raise CliError("代理没有运行")
+        with AgentClient(path) as agent:
+            return agent.request("lock")
+
+    if agent_running(path):
+        raise CliError(f"代理已在运行: {path}")
+    storage = _open_vault(args, config)
+    server = AgentServer(VaultCommands(storage), path, args.idle or config.agent_idle_timeout,
+                         on_lock=storage.close_session)
+    server.run()
+    return "locked"
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m cli", description="密码管理器命令行")
+    parser.add_argument("--vault", help="保险库文件路径（默认为配置目录中的 passwords.dat）")
+    parser.add_argument("--password-file", help="从文件第一行读取主密码")
+    parser.add_argument("--pretty", action="store_true", help="缩进输出 JSON")
+    parser.add_argument("--no-agent", action="store_true", help="不使用本地代理，直接解锁保险库")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("list", help="列出条目（不含密码）")
+    p.add_argument("--category", help="只列出该分类（含子分类），路径以 / 分隔")
+
+    p = sub.add_parser("get", help="显示条目及其密码")
+    p.add_argument("entry", help="条目 ID 或名称")
+    p.add_argument("--field", help="只输出一个字段，例如 password")
+
+    p = sub.add_parser("search", help="搜索名称、网址、账号和备注")
+    p.add_argument("query")
+
+    for name in ("add", "edit"):
+        p = sub.add_parser(name, help="添加条目" if name == "add" else "修改条目")
+        if name == "edit":
+            p.add_argument("entry", help="条目 ID 或名称")
+        p.add_argument("--name", required=name == "add")
+        p.add_argument("--url")
+        p.add_argument("--username")
+        p.add_argument("--notes")
+        p.add_argument("--category", help="分类路径，不存在时自动创建")
+        group = p.add_mutually_exclusive_group()
+        group.add_argument("--password", help="注意：命令行参数可能被其他用户看到，建议用 --password-stdin")
+        group.add_argument("--password-stdin", action="store_true", help="从 stdin 第一行读取密码")
+
+    p = sub.add_parser("delete", help="删除条目")
+    p.add_argument("entry", help="条目 ID 或名称")
+
+    p = sub.add_parser("import", help="合并导入 CSV 或 .pmx 文件")
+    p.add_argument("path")
+    p.add_argument("--format", help="文件格式，默认按扩展名和表头识别")
+    p.add_argument("--export-password", help="导入 .pmx 的密码，也可用环境变量 PM_EXPORT_PASSWORD")
+
+    p = sub.add_parser("export", help="导出为 .pmx（加密）或 CSV（明文）")
+    p.add_argument("path")
+    p.add_argument("--format", default="pmx", choices=["pmx", "csv"])
+    p.add_argument("--export-password", help="加密导出的密码，也可用环境变量 PM_EXPORT_PASSWORD")
+
+    sub.add_parser("batch", help="从 stdin 逐行读取 JSON 操作并执行")
+
+    p = sub.add_parser("agent", help="本地代理：start 解锁后在前台运行，stop 锁定，status 查看状态")
+    p.add_argument("action", choices=["start", "stop", "status"])
+    p.add_argument("--idle", type=int, help="空闲多少秒后自动锁定（默认取配置）")
+    return parser
+
+
+_GLOBAL_ARGS = {"vault", "password_file", "pretty", "no_agent", "command"}
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    out = sys.stdout
+    # 存储层等模块的日志（trace.log）全部改到 stderr，stdout 只留给 JSON 结果
+    sys.stdout = sys.stderr
+    try:
+        config = AppConfig()
+        if config.trace_path:
+            trace.enable(config.trace_path)
+        if args.command == "agent":
+            result = _run_agent(args, config)
+        else:
+            result = _query_agent(args, config)
+        if result is None:
+            storage = _open_vault(args, config)
+            commands = VaultCommands(storage)
+            if args.command == "batch":
+                return EXIT_ERROR if _run_batch(commands, out) else 0
+
+            result = commands.run(args.command, **_command_kwargs(args))
+            commands.save()
+    except CliError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return e.code
+    except CommandError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return EXIT_USAGE if e.usage else EXIT_ERROR
+    except (ValueError, OSError, csv.Error) as e:
+        # csv.Error：导入的 CSV 格式有误（例如引号不配对、字段过长）
+        print(f"错误: {e}", file=sys.stderr)
+        return EXIT_ERROR
+    finally:
+        sys.stdout = out
+
+    if isinstance(result, str):
+        # 单个字段直接输出原文，便于在 shell 中使用 $(...)
+        out.write(result + "\n")
+    else:
+        out.write(json.dumps(result, ensure_ascii=False, indent=2 if args.pretty else None) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,10 +8,40 @@
 import os
 from pathlib import Path
 
+from utils import trace
+
 class AppConfig:
     def __init__(self):
         self.config_dir = self._get_config_path()
         self.data_path = self.config_dir / "passwords.dat"
+        # 新建保险库时的密钥派生算法（pbkdf2-sha256 / scrypt / argon2id）及目标解锁耗时（毫秒）
+        self.kdf_algorithm = "scrypt"
+        self.kdf_target_ms = 300
+        # 登录时把密钥派生算法与 kdf_algorithm 不一致的旧保险库整体重新加密；
+        # 默认关闭，只在修改主密码时顺带升级
+        self.kdf_auto_upgrade = False
+        # 搜索框停止输入多久后开始查询（毫秒）
+        self.search_debounce_ms = 150
+        # 最多缓存多少个已解密的密码，以及每个缓存多久（秒）
+        self.secret_cache_size = 32
+        self.secret_cache_ttl = 60
+        # 写快照时保留的旧版本个数（passwords.dat.bak.1 ~ .bak.N），0 表示不保留
+        self.backup_count = 3
+        # 自动保存：停止修改多久后保存，以及第一次修改后最多等待多久（毫秒）
+        self.autosave_quiet_ms = 1000
+        self.autosave_max_delay_ms = 5000
+        # 写快照、更换主密码时并行加密使用的进程数
+        self.crypto_workers = os.cpu_count() or 1
+        # 调试模式：状态栏显示搜索延迟等统计，设置环境变量 PM_DEBUG=1 开启
+        self.debug = os.getenv("PM_DEBUG") == "1"
+        # 性能跟踪（utils/trace.py）：PM_TRACE 为文件路径时记录各操作的耗时，退出时写成 Chrome 跟踪格式；
+        # 调试模式下也会记录，并在状态栏显示最近几次操作的耗时
+        self.trace_path = os.getenv("PM_TRACE") or None
+        self.trace_overlay_size = 5
+        # 本地代理（core/agent.py）：套接字路径、空闲多久后自动锁定（秒）、主窗口解锁期间是否托管代理
+        self.agent_socket_path = Path(os.getenv("PM_AGENT_SOCK") or self.config_dir / "agent" / "vault.sock")
+        self.agent_idle_timeout = 900
+        self.agent_enabled = False
         self._ensure_directory()
 
     def _get_config_path(self):
@@ -24,4 +54,4 @@ class AppConfig:
     def _ensure_directory(self):
         """确保配置目录存在"""
         os.makedirs(self.config_dir, exist_ok=True)
-        print(f"配置目录: {self.config_dir}")
+        trace.log(f"配置目录: {self.config_dir}")
@@ -2,14 +2,34 @@
 @Author: Chan Sheen
 @Date: 2025/4/15 16:21
 @File: styles.py
-@Description: 
+@Description: 样式表等资源文件的定位与加载
+
+资源路径不依赖当前工作目录：开发时相对于项目根目录（src 的上一级），
+PyInstaller 打包后相对于解包目录 sys._MEIPASS（见 build.spec 中的 datas）。
 """
 
+import os
+import sys
+from functools import lru_cache
+
+from utils import trace
+
+
+def resource_path(*parts) -> str:
+    """resources 目录下文件的绝对路径"""
+    base = getattr(sys, "_MEIPASS", None)
+    if base is None:
+        base = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return os.path.join(base, "resources", *parts)
+
 
-# 加载并应用样式表
-def load_stylesheet():
+# 加载并应用样式表；整个程序只读取一次，之后的窗口和对话框复用同一份文本
+@lru_cache(maxsize=None)
+def load_stylesheet() -> str:
+    path = resource_path("qss", "main.qss")
     try:
-        with open("../resources/qss/main.qss", "r", encoding="utf-8") as style_file:
+        with open(path, "r", encoding="utf-8") as style_file:
             return style_file.read()
     except FileNotFoundError:
+        trace.log(f"样式表未找到: {path}")
         return ""  # 如果找不到样式表，返回空样式
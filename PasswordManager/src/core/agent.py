@@ -0,0 +1,290 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/11 15:30
+@File: agent.py
+@Description: 本地保险库代理
+
+类似 ssh-agent：解锁一次后常驻内存，通过 Unix 域套接字为脚本提供查询，每次查询
+不再需要密钥派生和解密整个保险库。代理可以由命令行单独启动（python -m cli agent start），
+也可以由主窗口在解锁期间托管（配置 agent_enabled）。
+
+协议为每行一个 JSON：请求 {"op": "get", "entry": "github", "field": "password"}，
+响应 {"ok": true, "result": ...} 或 {"ok": false, "error": "..."}，同一连接可以连续发送
+多个请求。操作有 list、get、search（参数同 core/commands.py）以及 ping、status、
+lock（锁定并停止代理）。代理只返回请求的条目，不提供主密钥或数据密钥。
+
+请求在线程池中处理（查询要等存储锁，见 _dispatch），慢请求不会阻塞其他连接和空闲计时；
+处理中的任何异常都作为错误响应返回给客户端，连接保持可用。
+
+访问控制：套接字放在权限 0700 的目录中，本身权限 0600；Linux 上还通过 SO_PEERCRED
+拒绝其他用户的连接。空闲 idle_timeout 秒没有请求时自动锁定。
+没有 AF_UNIX 的平台（旧版 Windows）上 AGENT_SUPPORTED 为 False。
+"""
+
+import asyncio
+import json
+import os
+import signal
+import socket
+import struct
+import threading
+import time
+
+from core.commands import CommandError
+from utils import trace
+
+AGENT_SUPPORTED = hasattr(socket, "AF_UNIX")
+# 代理只提供查询，修改仍通过命令行或界面完成
+QUERY_OPS = {"list", "get", "search"}
+
+
+class AgentServer:
+    def __init__(self, commands, socket_path, idle_timeout=900, on_lock=None):
+        """commands 为 VaultCommands；on_lock() 在代理停止时于代理线程中调用"""
+        self.commands = commands
+        self.socket_path = os.fspath(socket_path)
+        self.idle_timeout = idle_timeout
+        self.on_lock = on_lock
+        self._loop = None
+        self._stopped = None
+        self._stop_requested = False
+        self._last_used = time.monotonic()
+        self._thread = None
+        # 正在处理的连接，停止时先关闭它们，再结束事件循环
+        self._connections = {}
+
+    async def serve(self):
+        """监听套接字，直到空闲超时、收到 lock 请求或调用 stop()"""
+        if not AGENT_SUPPORTED:
+            raise RuntimeError("当前平台不支持 Unix 域套接字")
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        if self._stop_requested:
+            return
+
+        self._prepare_path()
+        # 创建套接字文件时就只有本人可读写，避免 bind 与 chmod 之间的空档
+        old_umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        finally:
+            os.umask(old_umask)
+        self._touch()
+        watchdog = asyncio.create_task(self._watch_idle())
+        trace.log(f"正在监听 {self.socket_path}，空闲 {self.idle_timeout} 秒后自动锁定", "代理")
+        try:
+            await self._stopped.wait()
+        finally:
+            watchdog.cancel()
+            server.close()
+            for writer in list(self._connections.values()):
+                writer.close()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await server.wait_closed()
+            self._remove_socket()
+            if self.on_lock is not None:
+                self.on_lock()
+            trace.log("已锁定", "代理")
+
+    def run(self):
+        """在当前线程中运行到代理停止为止（命令行前台运行），SIGINT/SIGTERM 时锁定退出"""
+        async def main():
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                try:
+                    loop.add_signal_handler(sig, self.stop)
+                except (NotImplementedError, RuntimeError):
+                    pass
+            await self.serve()
+        asyncio.run(main())
+
+    def start_in_thread(self):
+        """在后台线程中运行（主窗口托管时使用）"""
+        def target():
+            try:
+                asyncio.run(self.serve())
+            except Exception as e:
+                trace.log(f"启动失败: {str(e)}", "代理")
+
+        self._thread = threading.Thread(target=target, name="vault-agent", daemon=True)
+        self._thread.start()
+
+    def stop(self, wait=False):
+        """请求锁定；可以从任意线程调用"""
+        self._stop_requested = True
+        loop, stopped = self._loop, self._stopped
+        if loop is not None and stopped is not None:
+            try:
+                loop.call_soon_threadsafe(stopped.set)
+            except RuntimeError:
+                # 事件循环已经结束
+                pass
+        if wait and self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _touch(self):
+        self._last_used = time.monotonic()
+
+    async def _watch_idle(self):
+        while True:
+            remaining = self._last_used + self.idle_timeout - time.monotonic()
+            if remaining <= 0:
+                trace.log("空闲超时", "代理")
+                self._stopped.set()
+                return
+            await asyncio.sleep(remaining)
+
+    def _prepare_path(self):
+        directory = os.path.dirname(self.socket_path)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        os.chmod(directory, 0o700)
+        if os.path.exists(self.socket_path):
+            # 能连上说明已有代理在运行；否则是上次异常退出留下的文件
+            if agent_running(self.socket_path):
+                raise RuntimeError(f"代理已在运行: {self.socket_path}")
+            os.remove(self.socket_path)
+
+    def _remove_socket(self):
+        try:
+            os.remove(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _peer_allowed(sock) -> bool:
+        """只接受与代理同一用户的进程；无法取得对端身份的平台依赖套接字文件权限"""
+        if sock is None or not hasattr(socket, "SO_PEERCRED"):
+            return True
+        creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+        _, uid, _ = struct.unpack("3i", creds)
+        return uid == os.getuid()
+
+    async def _handle(self, reader, writer):
+        if not self._peer_allowed(writer.get_extra_info("socket")):
+            trace.log("拒绝了其他用户的连接", "代理")
+            writer.close()
+            return
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                writer.write(await self._loop.run_in_executor(None, self._dispatch, line))
+                await writer.drain()
+                if self._stop_requested:
+                    # lock 请求的响应写出后再停止
+                    self._stopped.set()
+                    break
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            self._connections.pop(task, None)
+            writer.close()
+
+    def _dispatch(self, line) -> bytes:
+        """处理一行请求，返回响应行（在线程池中执行）"""
+        self._touch()
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise CommandError("请求必须是 JSON 对象", usage=True)
+            op = request.pop("op", None)
+            if op == "ping":
+                result = "pong"
+            elif op == "status":
+                result = {
+                    "pid": os.getpid(),
+                    "entries": len(self.commands.repository),
+                    "locks_in": max(0, round(self._last_used + self.idle_timeout - time.monotonic())),
+                }
+            elif op == "lock":
+                self._stop_requested = True
+                result = "locked"
+            elif op in QUERY_OPS:
+                # 主窗口托管时仓库和索引与界面共用，界面在持有存储锁时修改它们
+                with self.commands.storage.lock:
+                    self.commands.refresh()
+                    result = self.commands.run(op, **request)
+            else:
+                raise CommandError(f"代理不支持的操作: {op}", usage=True)
+            response = {"ok": True, "result": result}
+        except (CommandError, ValueError, KeyError) as e:
+            response = {"ok": False, "error": str(e) or type(e).__name__}
+        except Exception as e:
+            # 其他异常（解密失败、读盘出错等）同样只让这个请求失败
+            trace.log(f"处理请求出错: {type(e).__name__}: {str(e)}", "代理")
+            response = {"ok": False, "error": str(e) or type(e).__name__}
+        return (json.dumps(response, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+class AgentClient:
+    """
+    同步客户端，供命令行和脚本使用：
+
+        with AgentClient(path) as agent:
+            password = agent.request("get", entry="github", field="password")
+
+    连接失败抛出 OSError（代理没有运行），操作失败抛出 CommandError。
+    """
+
+    def __init__(self, socket_path, timeout=10.0):
+        self.socket_path = os.fspath(socket_path)
+        self.timeout = timeout
+        self._sock = None
+        self._file = None
+
+    def connect(self):
+        if not AGENT_SUPPORTED:
+            raise OSError("当前平台不支持 Unix 域套接字")
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self._sock = sock
+        self._file = sock.makefile("rwb")
+        return self
+
+    def request(self, op, **kwargs):
+        if self._file is None:
+            self.connect()
+        kwargs["op"] = op
+        self._file.write((json.dumps(kwargs, ensure_ascii=False) + "\n").encode("utf-8"))
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("代理已断开连接")
+        response = json.loads(line)
+        if not response.get("ok"):
+            raise CommandError(response.get("error", "代理返回了错误"))
+        return response.get("result")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._sock.close()
+            self._file = self._sock = None
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def agent_running(socket_path) -> bool:
+    if not AGENT_SUPPORTED or not os.path.exists(socket_path):
+        return False
+    try:
+        with AgentClient(socket_path, timeout=1.0) as client:
+            return client.request("ping") == "pong"
+    except (OSError, ValueError, CommandError):
+        return False
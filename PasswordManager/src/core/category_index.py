@@ -0,0 +1,148 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/3 11:20
+@File: category_index.py
+@Description: 分类层级索引
+
+在 data["categories"]（{"id", "name", "parent_id"} 列表）之上维护父子关系，并按
+深度优先遍历给每个分类编号（欧拉序）：分类 A 的子树恰好是编号落在
+[进入A, 离开A) 区间内的分类，因此“B 是否属于 A 的子树”只需比较两个整数。
+
+分类的增删改会直接修改传入的列表。层级变化后编号在下一次查询时重新计算，
+分类数量通常只有几十个，代价可以忽略。
+"""
+
+from collections import defaultdict
+
+
+class CategoryIndex:
+    def __init__(self, categories):
+        # 直接引用会话中的列表，修改会反映到保存的数据中
+        self.categories = categories
+        self._by_id = {}
+        self._children = defaultdict(list)
+        for cat in categories:
+            self._by_id[cat['id']] = cat
+        for cat in categories:
+            self._children[self._parent_key(cat)].append(cat['id'])
+        # 分类 ID -> (进入编号, 离开编号)，None 表示需要重新计算
+        self._intervals = None
+        self._order = []
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __contains__(self, category_id):
+        return category_id in self._by_id
+
+    def get(self, category_id):
+        return self._by_id.get(category_id)
+
+    def name(self, category_id, default=None):
+        cat = self._by_id.get(category_id)
+        return cat['name'] if cat is not None else default
+
+    def parent(self, category_id):
+        return self._parent_key(self._by_id[category_id])
+
+    def children(self, category_id=None):
+        """子分类 ID 列表；category_id 为 None 时返回顶层分类"""
+        return list(self._children.get(category_id, ()))
+
+    def ancestors(self, category_id):
+        """从父分类到顶层分类依次返回"""
+        result = []
+        parent = self.parent(category_id)
+        while parent is not None and parent not in result:
+            result.append(parent)
+            parent = self.parent(parent)
+        return result
+
+    def path(self, category_id) -> tuple:
+        """从顶层分类到该分类的名称元组"""
+        names = [self.name(c) for c in reversed(self.ancestors(category_id))]
+        names.append(self.name(category_id))
+        return tuple(names)
+
+    def find(self, path):
+        """按名称路径（从顶层开始）查找分类 ID，找不到返回 None；同名时取第一个"""
+        category_id = None
+        for name in path:
+            category_id = next((c for c in self._children.get(category_id, ()) if self.name(c) == name), None)
+            if category_id is None:
+                return None
+        return category_id
+
+    def in_subtree(self, category_id, root_id) -> bool:
+        """category_id 是否为 root_id 本身或其子孙"""
+        intervals = self._ensure_intervals()
+        inner = intervals.get(category_id)
+        outer = intervals.get(root_id)
+        return inner is not None and outer is not None and outer[0] <= inner[0] < outer[1]
+
+    def subtree(self, root_id):
+        """root_id 及其全部子孙的 ID"""
+        intervals = self._ensure_intervals()
+        start, end = intervals[root_id]
+        return self._order[start:end]
+
+    def add(self, name, parent_id=None):
+        """新建分类并返回它"""
+        if parent_id is not None and parent_id not in self._by_id:
+            raise KeyError(parent_id)
+        cat = {'id': max(self._by_id, default=0) + 1, 'name': name, 'parent_id': parent_id}
+        self.categories.append(cat)
+        self._by_id[cat['id']] = cat
+        self._children[parent_id].append(cat['id'])
+        self._intervals = None
+        return cat
+
+    def rename(self, category_id, name):
+        self._by_id[category_id]['name'] = name
+
+    def move(self, category_id, parent_id):
+        """把分类（连同子分类）移到 parent_id 下，parent_id 为 None 表示移到顶层"""
+        if parent_id is not None and self.in_subtree(parent_id, category_id):
+            raise ValueError("不能把分类移动到它自己的子分类下")
+        cat = self._by_id[category_id]
+        self._children[self._parent_key(cat)].remove(category_id)
+        cat['parent_id'] = parent_id
+        self._children[parent_id].append(category_id)
+        self._intervals = None
+
+    def remove(self, category_id):
+        """删除分类，其子分类上移一级；返回原来的父分类 ID"""
+        cat = self._by_id.pop(category_id)
+        parent_id = self._parent_key(cat)
+        siblings = self._children[parent_id]
+        siblings.remove(category_id)
+        for child_id in self._children.pop(category_id, []):
+            self._by_id[child_id]['parent_id'] = parent_id
+            siblings.append(child_id)
+        self.categories.remove(cat)
+        self._intervals = None
+        return parent_id
+
+    def _parent_key(self, cat):
+        # 父分类不存在（数据损坏）时当作顶层分类处理，与分类树的显示一致
+        parent_id = cat.get('parent_id')
+        return parent_id if parent_id in self._by_id else None
+
+    def _ensure_intervals(self):
+        if self._intervals is None:
+            intervals, order = {}, []
+            # 用显式栈做深度优先遍历；visited 防止损坏数据中的环导致死循环
+            stack = [(cat_id, False) for cat_id in reversed(self._children.get(None, ()))]
+            while stack:
+                cat_id, leaving = stack.pop()
+                if leaving:
+                    intervals[cat_id] = (intervals[cat_id], len(order))
+                    continue
+                if cat_id in intervals:
+                    continue
+                intervals[cat_id] = len(order)
+                order.append(cat_id)
+                stack.append((cat_id, True))
+                stack.extend((child, False) for child in reversed(self._children.get(cat_id, ())))
+            self._intervals, self._order = intervals, order
+        return self._intervals
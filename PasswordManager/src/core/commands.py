@@ -0,0 +1,240 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/11 10:20
+@File: commands.py
+@Description: 不依赖界面的保险库操作
+
+命令行（cli.py）和本地代理（agent.py）共用的一组操作：list、get、search、add、edit、
+delete、import、export。每个操作返回可以直接序列化为 JSON 的结果，失败时抛出 CommandError。
+"""
+
+from core.category_index import CategoryIndex
+from core.record import PasswordRecord
+from core.repository import PasswordRepository, new_entry_id
+
+
+class CommandError(Exception):
+    """操作无法完成（条目不存在、参数错误等），消息可以直接显示给用户"""
+
+    def __init__(self, message, usage=False):
+        super().__init__(message)
+        # 调用方式有误（未知操作、参数名错误），而不是数据层面的失败
+        self.usage = usage
+
+
+def _split_path(text):
+    return tuple(part.strip() for part in (text or "").split("/") if part.strip())
+
+
+class VaultCommands:
+    """在已解锁的保险库上执行各个操作，返回可以直接序列化为 JSON 的结果"""
+
+    def __init__(self, storage, repository=None, category_index=None, search_index=None):
+        """
+        不传索引时自行在会话数据上建立；主窗口托管代理时传入界面正在维护的索引，
+        由界面负责保持它们与数据一致。
+        """
+        self.storage = storage
+        self.data = storage.load_data()
+        self._owns_indexes = repository is None
+        if self._owns_indexes:
+            self._build_indexes()
+        else:
+            self.repository = repository
+            self.category_index = category_index
+            self._search_index = search_index
+        self.changed = False
+
+    def _build_indexes(self):
+        self.repository = PasswordRepository(self.data.setdefault("passwords", []))
+        self.category_index = CategoryIndex(self.data.setdefault("categories", []))
+        self._search_index = None
+
+    def refresh(self):
+        """保险库文件被其他进程修改后重新加载（长期运行的代理在每次请求前调用）"""
+        if self._owns_indexes and not self.changed:
+            data = self.storage.load_data()
+            if data is not self.data:
+                self.data = data
+                self._build_indexes()
+
+    # ------------------------------------------------------------ 辅助
+
+    def _entry_json(self, entry, reveal=False):
+        obj = {
+            "id": entry.id,
+            "name": entry.name,
+            "url": entry.url,
+            "username": entry.username,
+            "notes": entry.notes,
+            "category": self._category_path(entry.category_id),
+        }
+        if reveal:
+            obj["password"] = self.storage.reveal_secret(entry)
+        return obj
+
+    def _category_path(self, category_id):
+        if category_id is None or category_id not in self.category_index:
+            return ""
+        return "/".join(self.category_index.path(category_id))
+
+    def _category_id(self, path, create=False):
+        parts = _split_path(path)
+        if not parts:
+            return None
+        category_id = self.category_index.find(parts)
+        if category_id is None:
+            if not create:
+                raise CommandError(f"分类不存在: {path}")
+            parent_id = None
+            for depth in range(1, len(parts) + 1):
+                found = self.category_index.find(parts[:depth])
+                if found is None:
+                    found = self.category_index.add(parts[depth - 1], parent_id)['id']
+                parent_id = found
+            category_id = parent_id
+        return category_id
+
+    def _resolve(self, ref):
+        """按 ID 或名称（不区分大小写，必须唯一）查找条目"""
+        entry = self.repository.get(ref)
+        if entry is not None:
+            return entry
+        folded = ref.casefold()
+        matches = [e for e in self.repository.passwords if e.name.casefold() == folded]
+        if not matches:
+            raise CommandError(f"找不到条目: {ref}")
+        if len(matches) > 1:
+            raise CommandError(f"有 {len(matches)} 个名为 {ref} 的条目，请改用 ID")
+        return matches[0]
+
+    def _mark_changed(self):
+        self.changed = True
+        self.storage.session.mark_dirty()
+
+    # ------------------------------------------------------------ 操作
+
+    def list(self, category=None):
+        entries = self.repository.passwords
+        if category:
+            root = self._category_id(category)
+            subtree = set(self.category_index.subtree(root))
+            entries = [e for e in entries if e.category_id in subtree]
+        return [self._entry_json(e) for e in entries]
+
+    def get(self, entry, field=None):
+        found = self._resolve(entry)
+        # 只取其他字段时不解密密码
+        obj = self._entry_json(found, reveal=field in (None, "password"))
+        if field is not None:
+            if field not in obj:
+                raise CommandError(f"没有字段: {field}")
+            return obj[field]
+        return obj
+
+    def search(self, query):
+        if self._search_index is None:
+            from core.search_index import SearchIndex
+            self._search_index = SearchIndex()
+            self._search_index.rebuild((e.id, e) for e in self.repository.passwords)
+        ids = self._search_index.search(query)
+        return [self._entry_json(e) for e in self.repository.passwords if e.id in ids]
+
+    def add(self, name, password="", url="", username="", notes="", category=None):
+        if not name:
+            raise CommandError("名称不能为空")
+        entry_id = new_entry_id()
+        entry = PasswordRecord(
+            id=entry_id,
+            name=name,
+            url=url or "",
+            username=username or "",
+            encrypted_password=self.storage.encrypt_secret(entry_id, password or ""),
+            notes=notes or "",
+            category_id=self._category_id(category, create=True)
+        )
+        with self.storage.lock:
+            self.repository.put(entry)
+        if self._search_index is not None:
+            self._search_index.add(entry_id, entry)
+        self._mark_changed()
+        return {"id": entry_id}
+
+    def edit(self, entry, name=None, password=None, url=None, username=None, notes=None, category=None):
+        found = self._resolve(entry)
+        changes = {k: v for k, v in (("name", name), ("url", url), ("username", username), ("notes", notes))
+                   if v is not None}
+        if password is not None:
+            changes["encrypted_password"] = self.storage.encrypt_secret(found.id, password)
+        if category is not None:
+            changes["category_id"] = self._category_id(category, create=True)
+        if not changes:
+            raise CommandError("没有要修改的字段")
+        updated = found.replace(**changes)
+        with self.storage.lock:
+            self.repository.put(updated)
+        if self._search_index is not None:
+            self._search_index.update(updated.id, updated)
+        self.storage.forget_secret(updated.id)
+        self._mark_changed()
+        return {"id": updated.id}
+
+    def delete(self, entry):
+        found = self._resolve(entry)
+        with self.storage.lock:
+            self.repository.delete(found.id)
+        if self._search_index is not None:
+            self._search_index.remove(found.id)
+        self.storage.forget_secret(found.id)
+        self._mark_changed()
+        return {"id": found.id}
+
+    def import_(self, path, format=None, export_password=None):
+        from utils import transfer
+        start = len(self.repository)
+        result = transfer.import_file(self.storage, path, self.repository, self.category_index,
+                                      format, export_password)
+        if self._search_index is not None:
+            for entry in self.repository.passwords[start:]:
+                self._search_index.add(entry.id, entry)
+        if result.added or result.categories_created:
+            self.changed = True
+        return {
+            "format": result.format,
+            "added": result.added,
+            "duplicates": result.duplicates,
+            "skipped": result.skipped,
+            "categories_created": result.categories_created,
+        }
+
+    def export(self, path, format="pmx", export_password=None):
+        from utils import transfer
+        # 导出读取的是会话数据，先把本次运行中的修改写盘，两者保持一致
+        self.save()
+        return {"exported": transfer.export_file(self.storage, path, format, export_password)}
+
+    def save(self):
+        if self.changed:
+            self.storage.flush()
+            self.changed = False
+
+    OPERATIONS = {
+        "list": "list",
+        "get": "get",
+        "search": "search",
+        "add": "add",
+        "edit": "edit",
+        "delete": "delete",
+        "import": "import_",
+        "export": "export",
+    }
+
+    def run(self, op, **kwargs):
+        method = self.OPERATIONS.get(op)
+        if method is None:
+            raise CommandError(f"未知操作: {op}", usage=True)
+        try:
+            return getattr(self, method)(**kwargs)
+        except TypeError as e:
+            # 批量操作中的参数名写错
+            raise CommandError(f"{op} 的参数错误: {e}", usage=True) from None
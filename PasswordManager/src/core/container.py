@@ -0,0 +1,292 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/4/19 14:30
+@File: container.py
+@Description: 按记录分别加密的 passwords.dat 容器格式
+
+文件布局（整数均为大端）：
+
+    magic "PMV2" | u16 版本 | u32 头部容量
+    头部区（固定容量，末尾补零）:
+        u32 头部长度 | 头部 JSON（salt 等）
+        u32 索引条目数 | 条目 * (u8 类型, u64 偏移, u32 长度)
+        32 字节校验码
+    记录区：逐条加密的记录
+
+记录为 12 字节 nonce 加 AES-256-GCM 密文（附加数据为格式版本和记录类型），密钥由主密钥
+派生，不经过 base64。头部和索引本身是明文，校验码是以主密钥派生的密钥对 magic 至索引末尾
+的全部字节、再依次加上每个索引条目所指密文的 GCM 标签计算的 HMAC-SHA256：删除、重复、
+调换索引条目，改动头部（包括代数），或换上其他快照中的密文，都会在读取时被发现。
+
+版本 3 的记录附加数据只有记录类型，也没有校验码；版本 2 的记录为 Fernet 令牌。两者仍可
+读取，写出时一律为当前版本。记录的附加数据含有版本号，当前版本的文件改写为旧版本号后
+无法解密，不能借此绕过校验。
+
+分类表等顶层字段作为一条 META 记录（JSON），每个密码条目各自一条 ENTRY 记录
+（二进制，见 record.py）。容器文件作为快照只整体写出：经 utils.file_ops.atomic_write
+原子替换，内容未变化的记录直接复制旧文件中的密文，不需要重新加密。日常的增删改写入
+日志（见 journal.py）。
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import struct
+
+from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from utils.file_ops import atomic_write
+from utils.parallel import map_chunks
+
+MAGIC = b"PMV2"
+VERSION = 4
+# 记录为 Fernet 令牌的旧版本
+FERNET_VERSION = 2
+# 记录为 AES-GCM 密文、头部和索引没有校验码的旧版本
+UNSIGNED_VERSION = 3
+
+KIND_META = 0
+KIND_ENTRY = 1
+
+_PREFIX = struct.Struct(">4sHI")
+_U32 = struct.Struct(">I")
+_SLOT = struct.Struct(">BQI")
+
+_NONCE_SIZE = 12
+_TAG_SIZE = 16
+_MAC_SIZE = 32
+_MIN_HEAD_CAPACITY = 4096
+_PROGRESS_STEP = 1000
+
+
+def encode_record(obj) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), sort_keys=True).encode("utf-8")
+
+
+def record_digest(kind, plain: bytes) -> bytes:
+    return hashlib.blake2b(bytes((kind,)) + plain, digest_size=16).digest()
+
+
+def record_key(key) -> bytes:
+    """由主密钥（Fernet 密钥的 base64 形式）派生记录加密使用的 AES-256-GCM 密钥"""
+    return hmac.new(base64.urlsafe_b64decode(key), b"vault records", hashlib.sha256).digest()
+
+
+def _manifest_mac(key, head: bytes, tags) -> bytes:
+    """头部和索引（head，含文件开头的 magic、版本）连同各条记录的 GCM 标签的校验码"""
+    mac_key = hmac.new(base64.urlsafe_b64decode(key), b"vault manifest", hashlib.sha256).digest()
+    mac = hmac.new(mac_key, head, hashlib.sha256)
+    for tag in tags:
+        mac.update(tag)
+    return mac.digest()
+
+
+def _record_aad(version, kind) -> bytes:
+    return bytes((kind,)) if version == UNSIGNED_VERSION else bytes((version, kind))
+
+
+def _encrypt_chunk(key, records):
+    aead = AESGCM(record_key(key))
+    blobs = []
+    for kind, plain in records:
+        nonce = os.urandom(_NONCE_SIZE)
+        blobs.append(nonce + aead.encrypt(nonce, plain, _record_aad(VERSION, kind)))
+    return blobs
+
+
+def encrypt_records(key, records, workers=1, progress=None):
+    """逐条加密 (类型, 明文)，返回与 records 顺序一致的密文列表；记录较多时多进程并行"""
+    return map_chunks(_encrypt_chunk, records, key, workers=workers, progress=progress)
+
+
+def _decryptor(key, version):
+    """返回 decrypt(类型, 密文) -> 明文，按容器版本选择记录的加密方式"""
+    if version <= FERNET_VERSION:
+        fernet = Fernet(key)
+        return lambda kind, blob: fernet.decrypt(blob)
+    aead = AESGCM(record_key(key))
+    return lambda kind, blob: aead.decrypt(blob[:_NONCE_SIZE], blob[_NONCE_SIZE:], _record_aad(version, kind))
+
+
+class VaultContainer:
+    def __init__(self, path, backups=0):
+        self.path = path
+        # 每次写快照前保留的旧版本数（path.bak.1 ~ path.bak.N）
+        self.backups = backups
+        self.head_capacity = 0
+        # 最近读取或写出的文件的格式版本
+        self.version = VERSION
+        # 内容摘要 -> (偏移, 长度, GCM 标签)，用于写快照时复用未变化记录的密文
+        self._blobs = {}
+
+    @staticmethod
+    def is_container(path) -> bool:
+        try:
+            with open(path, "rb") as f:
+                return f.read(len(MAGIC)) == MAGIC
+        except OSError:
+            return False
+
+    def reset(self):
+        """文件被替换后，旧的密文位置不再可用"""
+        self._blobs = {}
+
+    def read_header(self) -> dict:
+        """只读取头部 JSON，不解密任何记录"""
+        with open(self.path, "rb") as f:
+            header, _, _ = self._read_head(f)
+        return header
+
+    def read_version(self) -> int:
+        """只读取文件的格式版本"""
+        with open(self.path, "rb") as f:
+            _, version, _ = _PREFIX.unpack(f.read(_PREFIX.size))
+        return version
+
+    def _read_head(self, f):
+        """
+        返回 (头部, 索引, 校验信息)。校验信息为 (参与校验的字节, 校验码)，
+        没有校验码的旧版本为 None。
+        """
+        prefix = f.read(_PREFIX.size)
+        magic, version, capacity = _PREFIX.unpack(prefix)
+        if magic != MAGIC:
+            raise ValueError("不是有效的保险库文件")
+        if version > VERSION:
+            raise ValueError(f"不支持的保险库版本: {version}")
+
+        head = f.read(capacity)
+        (header_len,) = _U32.unpack_from(head, 0)
+        pos = _U32.size
+        header = json.loads(head[pos:pos + header_len].decode("utf-8"))
+        pos += header_len
+
+        (count,) = _U32.unpack_from(head, pos)
+        pos += _U32.size
+        slots = [_SLOT.unpack_from(head, pos + i * _SLOT.size) for i in range(count)]
+        pos += count * _SLOT.size
+
+        signed = None
+        if version > UNSIGNED_VERSION:
+            if pos + _MAC_SIZE > len(head):
+                raise ValueError("保险库文件头部不完整")
+            signed = (prefix + head[:pos], head[pos:pos + _MAC_SIZE])
+
+        self.head_capacity = capacity
+        self.version = version
+        return header, slots, signed
+
+    def iter_records(self, key, progress=None):
+        """
+        逐条解密容器，依次产出 (类型, 摘要, 明文)，不在内存中同时保留所有明文；
+        头部用 read_header() 读取（调用方持有文件锁，两次读取之间文件不会被替换）。
+        progress(done, total) 每解密一批记录调用一次。头部和索引的校验码在读完全部记录后
+        核对，不符时抛出 ValueError，调用方不能采用已经产出的记录。
+        """
+        blobs = {}
+        with open(self.path, "rb") as f:
+            _, slots, signed = self._read_head(f)
+            decrypt = _decryptor(key, self.version)
+            tags = []
+            total = len(slots)
+            for i, (kind, offset, length) in enumerate(slots, 1):
+                f.seek(offset)
+                blob = f.read(length)
+                plain = decrypt(kind, blob)
+                digest = record_digest(kind, plain)
+                tag = blob[-_TAG_SIZE:]
+                tags.append(tag)
+                blobs[digest] = (offset, length, tag)
+                yield kind, digest, plain
+                if progress is not None and (i % _PROGRESS_STEP == 0 or i == total):
+                    progress(i, total)
+
+        if signed is not None:
+            head, mac = signed
+            if not hmac.compare_digest(_manifest_mac(key, head, tags), mac):
+                raise ValueError(f"保险库文件的头部或索引校验失败，文件可能被篡改: {self.path}")
+
+        # 旧版本的密文不能复制到新格式的快照中，写快照时全部重新加密
+        self._blobs = blobs if self.version == VERSION else {}
+
+    def load_meta(self, key) -> dict:
+        """只解密 META 记录，可用于校验密钥"""
+        with open(self.path, "rb") as f:
+            _, slots, _ = self._read_head(f)
+            for kind, offset, length in slots:
+                if kind == KIND_META:
+                    f.seek(offset)
+                    plain = _decryptor(key, self.version)(kind, f.read(length))
+                    return json.loads(plain.decode("utf-8"))
+        return {}
+
+    def has_blob(self, digest) -> bool:
+        return digest in self._blobs
+
+    def _build_head(self, header, slots):
+        """头部区的内容（不含校验码）"""
+        header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        parts = [_U32.pack(len(header_bytes)), header_bytes, _U32.pack(len(slots))]
+        parts.extend(_SLOT.pack(kind, *loc) for kind, loc in slots)
+        return b"".join(parts)
+
+    def save(self, key, header, records, workers=1, progress=None, lock=None, backups=None):
+        """
+        用主密钥 key 写出新的快照。records 为 (类型, 摘要, 明文) 序列，明文为 None 时
+        表示该记录未变化，直接复制当前文件中的密文。需要加密的记录较多时按 workers
+        个进程并行加密，progress(done, total) 汇报加密进度。lock 见 atomic_write，
+        backups 为 None 时按 self.backups 保留旧版本。
+        """
+        records = list(records)
+        order, missing, pending = [], [], []
+        seen = set()
+        for kind, digest, plain in records:
+            if digest in seen:
+                continue
+            seen.add(digest)
+            order.append(digest)
+            if digest not in self._blobs:
+                if plain is None:
+                    raise ValueError("缺少记录明文，无法写出快照")
+                missing.append(digest)
+                pending.append((kind, plain))
+
+        fresh = dict(zip(missing, encrypt_records(key, pending, workers, progress)))
+        layout = {
+            digest: len(fresh[digest]) if digest in fresh else self._blobs[digest][1]
+            for digest in order
+        }
+
+        # 头部区留出余量，减少头部字段增长后重新排布的可能
+        needed = len(self._build_head(header, [(kind, (0, 0)) for kind, _, _ in records])) + _MAC_SIZE
+        capacity = max(_MIN_HEAD_CAPACITY, needed + needed // 4)
+        offset = _PREFIX.size + capacity
+        for digest in order:
+            tag = fresh[digest][-_TAG_SIZE:] if digest in fresh else self._blobs[digest][2]
+            layout[digest], offset = (offset, layout[digest], tag), offset + layout[digest]
+
+        prefix = _PREFIX.pack(MAGIC, VERSION, capacity)
+        head = self._build_head(header, [(kind, layout[digest][:2]) for kind, digest, _ in records])
+        mac = _manifest_mac(key, prefix + head, (layout[digest][2] for _, digest, _ in records))
+
+        old = open(self.path, "rb") if self._blobs else None
+        try:
+            with atomic_write(self.path, backups=self.backups if backups is None else backups, lock=lock) as out:
+                out.write(prefix)
+                out.write((head + mac).ljust(capacity, b"\0"))
+                for digest in order:
+                    if digest in fresh:
+                        out.write(fresh[digest])
+                    else:
+                        old.seek(self._blobs[digest][0])
+                        out.write(old.read(self._blobs[digest][1]))
+        finally:
+            if old is not None:
+                old.close()
+
+        self.head_capacity = capacity
+        self.version = VERSION
+        self._blobs = layout
@@ -0,0 +1,130 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/4/21 9:40
+@File: journal.py
+@Description: 保险库修改的追加式预写日志
+
+文件布局：
+
+    magic "PMJ1" | u32 头部长度 | 头部 JSON {"base": 快照代数}
+    帧 * (u32 长度 | Fernet 令牌)
+
+每次提交写入一帧（包含若干操作），写完后 fsync。加载时在快照之上按顺序重放
+base 与快照代数一致的日志；末尾写了一半的帧（长度前缀或令牌不完整）视为未提交，重放时跳过，
+由下一次追加（调用方持有独占锁）截掉。读者只持有共享锁，重放本身从不修改文件。
+完整的帧无法通过校验说明日志已损坏，抛出 ValueError，不删除任何已提交的帧。
+"""
+
+import json
+import os
+import struct
+
+from cryptography.fernet import InvalidToken
+
+from utils import trace
+from utils.file_ops import fsync_directory
+
+MAGIC = b"PMJ1"
+
+_U32 = struct.Struct(">I")
+
+_sync = getattr(os, "fdatasync", os.fsync)
+
+
+class VaultJournal:
+    def __init__(self, path):
+        self.path = path
+        self.base = None
+        self.size = 0
+        self.frames = 0
+        # 重放时发现的未完整尾部：(最后一个完整帧的结束位置, 当时的文件大小)
+        self._torn = None
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def create(self, base):
+        """新建一个空日志，覆盖同名文件"""
+        header = json.dumps({"base": base}).encode("utf-8")
+        with open(self.path, "wb") as f:
+            f.write(MAGIC + _U32.pack(len(header)) + header)
+            f.flush()
+            _sync(f.fileno())
+            self.size = f.tell()
+        # 新文件的目录项也要落盘，否则断电后已提交的帧可能随文件一起丢失
+        fsync_directory(os.path.dirname(os.fspath(self.path)) or ".")
+        self.base = base
+        self.frames = 0
+        self._torn = None
+
+    def read_base(self):
+        """读取日志头部中的快照代数，文件不存在或损坏时返回 None"""
+        try:
+            with open(self.path, "rb") as f:
+                return self._read_header(f)
+        except (OSError, ValueError, struct.error):
+            return None
+
+    def _read_header(self, f):
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("不是有效的日志文件")
+        (length,) = _U32.unpack(f.read(_U32.size))
+        return json.loads(f.read(length).decode("utf-8"))["base"]
+
+    def replay(self, fernet, start=None):
+        """
+        依次返回每一帧中的操作列表。末尾的帧不完整时停止，记下最后一个完整帧的结束位置，
+        由 append 截断（这里不写文件）；完整的帧无法解密或解析时抛出 ValueError。
+        start 为上次读到的位置（之前的 size）时只返回此后追加的帧，frames 在原有基础上累加。
+        """
+        with open(self.path, "rb") as f:
+            self.base = self._read_header(f)
+            if start is None:
+                self.frames = 0
+            else:
+                f.seek(start)
+            valid_end = f.tell()
+            while True:
+                prefix = f.read(_U32.size)
+                if len(prefix) < _U32.size:
+                    break
+                (length,) = _U32.unpack(prefix)
+                token = f.read(length)
+                if len(token) < length:
+                    break
+                try:
+                    ops = json.loads(fernet.decrypt(token).decode("utf-8"))
+                except (InvalidToken, ValueError) as e:
+                    raise ValueError(f"日志已损坏（偏移 {valid_end} 处的帧无法通过校验）: {self.path}") from e
+                valid_end = f.tell()
+                self.frames += 1
+                yield ops
+
+            end = f.seek(0, os.SEEK_END)
+            self._torn = (valid_end, end) if end != valid_end else None
+            self.size = valid_end
+
+    def append(self, fernet, ops):
+        """
+        追加一帧并落盘，调用方持有独占锁。上次重放发现未完整的尾部、且此后文件没有变化时，
+        先截掉它，新帧接在最后一个完整帧之后。
+        """
+        token = fernet.encrypt(json.dumps(ops, ensure_ascii=False).encode("utf-8"))
+        with open(self.path, "r+b") as f:
+            end = f.seek(0, os.SEEK_END)
+            if self._torn is not None and self._torn == (self.size, end):
+                trace.log(f"丢弃未完整写入的尾部: {self.path}", "日志")
+                f.truncate(self.size)
+                f.seek(self.size)
+            f.write(_U32.pack(len(token)) + token)
+            f.flush()
+            _sync(f.fileno())
+        self._torn = None
+        self.size += _U32.size + len(token)
+        self.frames += 1
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
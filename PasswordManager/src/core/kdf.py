@@ -0,0 +1,169 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/4/23 15:20
+@File: kdf.py
+@Description: 主密码密钥派生算法及参数校准
+
+参数以 dict 形式保存在保险库头部的 "kdf" 字段中，例如：
+    {"name": "scrypt", "n": 131072, "r": 8, "p": 1}
+没有该字段的旧文件一律按 PBKDF2-HMAC-SHA256 100,000 次处理。
+"""
+
+import math
+import os
+import time
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+try:
+    from cryptography.hazmat.primitives.kdf.argon2 import Argon2id
+except ImportError:  # cryptography < 44
+    Argon2id = None
+
+KEY_LENGTH = 32
+
+
+class Pbkdf2Kdf:
+    name = "pbkdf2-sha256"
+    # 校准结果不会低于这个次数
+    min_iterations = 100_000
+
+    def __init__(self, iterations=100_000):
+        self.iterations = iterations
+
+    def derive(self, password: bytes, salt: bytes) -> bytes:
+        kdf = PBKDF2HMAC(
+            algorithm=hashes.SHA256(),
+            length=KEY_LENGTH,
+            salt=salt,
+            iterations=self.iterations,
+            backend=default_backend()
+        )
+        return kdf.derive(password)
+
+    def to_dict(self):
+        return {"name": self.name, "iterations": self.iterations}
+
+    @classmethod
+    def from_dict(cls, params):
+        return cls(params["iterations"])
+
+    @classmethod
+    def calibrate(cls, target_ms):
+        probe = cls(20_000)
+        elapsed = _measure(probe)
+        iterations = int(probe.iterations * target_ms / max(elapsed, 1e-3))
+        return cls(max(cls.min_iterations, iterations))
+
+
+class ScryptKdf:
+    name = "scrypt"
+    min_log_n = 14
+    # n=2^20, r=8 时约占 1 GiB 内存，不再继续增大
+    max_log_n = 20
+
+    def __init__(self, n=2 ** 15, r=8, p=1):
+        self.n, self.r, self.p = n, r, p
+
+    def derive(self, password: bytes, salt: bytes) -> bytes:
+        kdf = Scrypt(salt=salt, length=KEY_LENGTH, n=self.n, r=self.r, p=self.p, backend=default_backend())
+        return kdf.derive(password)
+
+    def to_dict(self):
+        return {"name": self.name, "n": self.n, "r": self.r, "p": self.p}
+
+    @classmethod
+    def from_dict(cls, params):
+        return cls(params["n"], params["r"], params["p"])
+
+    @classmethod
+    def calibrate(cls, target_ms):
+        # 耗时与 n 近似成正比，n 只能取 2 的幂
+        log_n = cls.min_log_n
+        elapsed = _measure(cls(2 ** log_n))
+        while log_n < cls.max_log_n and elapsed * 2 <= target_ms:
+            log_n += 1
+            elapsed *= 2
+        return cls(2 ** log_n)
+
+
+class Argon2idKdf:
+    name = "argon2id"
+    min_iterations = 2
+
+    def __init__(self, iterations=3, memory_cost=64 * 1024, lanes=4):
+        self.iterations = iterations
+        # 单位 KiB
+        self.memory_cost = memory_cost
+        self.lanes = lanes
+
+    def derive(self, password: bytes, salt: bytes) -> bytes:
+        kdf = Argon2id(
+            salt=salt,
+            length=KEY_LENGTH,
+            iterations=self.iterations,
+            lanes=self.lanes,
+            memory_cost=self.memory_cost
+        )
+        return kdf.derive(password)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "iterations": self.iterations,
+            "memory_cost": self.memory_cost,
+            "lanes": self.lanes
+        }
+
+    @classmethod
+    def from_dict(cls, params):
+        return cls(params["iterations"], params["memory_cost"], params["lanes"])
+
+    @classmethod
+    def calibrate(cls, target_ms):
+        # 固定 64 MiB 内存，按单轮耗时推算迭代次数
+        elapsed = _measure(cls(iterations=1))
+        iterations = math.floor(target_ms / max(elapsed, 1e-3))
+        return cls(iterations=max(cls.min_iterations, iterations))
+
+
+KDF_TYPES = {cls.name: cls for cls in (Pbkdf2Kdf, ScryptKdf, Argon2idKdf)}
+
+
+def available_kdfs():
+    """当前 cryptography 版本支持的算法名称"""
+    return [name for name, cls in KDF_TYPES.items() if cls is not Argon2idKdf or Argon2id is not None]
+
+
+def legacy_kdf():
+    """头部没有 kdf 字段的旧保险库使用的参数"""
+    return Pbkdf2Kdf(100_000)
+
+
+def kdf_from_dict(params):
+    if not params:
+        return legacy_kdf()
+    if params.get("name") not in available_kdfs():
+        raise ValueError(f"不支持的密钥派生算法: {params.get('name')}")
+    return KDF_TYPES[params["name"]].from_dict(params)
+
+
+def calibrate(name, target_ms=300):
+    """在本机上测量耗时，选出解锁时间接近 target_ms 毫秒的参数"""
+    if name not in available_kdfs():
+        raise ValueError(f"不支持的密钥派生算法: {name}")
+    return KDF_TYPES[name].calibrate(target_ms)
+
+
+def _measure(kdf, rounds=3) -> float:
+    """执行几次派生，返回最短耗时（毫秒），排除首次调用的预热开销"""
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        kdf.derive(b"calibration", os.urandom(16))
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
@@ -0,0 +1,133 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/12 10:30
+@File: merge.py
+@Description: 保险库的三方合并
+
+两个进程基于同一个磁盘状态（共同祖先 base）各自修改后，把对方（theirs）的修改
+并入本地（ours）：
+
+- 只有一方改动的条目取改动的一方，包括新增和删除
+- 双方改成了相同内容的条目不算冲突
+- 一方删除、另一方修改时保留修改
+- 双方改成不同内容时保留本地版本，对方的版本作为冲突副本另存（由调用方生成副本）
+
+分类表按分类 ID 做同样的合并。分类 ID 是递增整数，双方同时新建的分类可能拿到同一个 ID，
+此时对方的分类换一个新 ID，引用它的条目随之改动。其余顶层字段只有一方改动时取改动的一方，
+双方都改时以本地为准。
+"""
+
+from core.container import encode_record
+
+
+class MergeResult:
+    """把对方的修改应用到本地需要的操作"""
+
+    def __init__(self):
+        # 需要新增或替换的条目（对方的版本）
+        self.puts = []
+        # 需要删除的本地条目 ID
+        self.deletes = []
+        # 双方都修改了的 (本地条目, 对方条目)
+        self.conflicts = []
+        # 合并后的顶层字段（不含 passwords），None 表示不需要改动
+        self.meta = None
+        # 对方分类 ID -> 新 ID
+        self.category_remap = {}
+
+    def __bool__(self):
+        return bool(self.puts or self.deletes or self.meta is not None)
+
+
+def _same(a, b) -> bool:
+    if a is None or b is None:
+        return a is b
+    # 记录不可变，同一个对象必然相同；否则比较序列化后的摘要
+    return a is b or a.encode()[0] == b.encode()[0]
+
+
+def merge_entries(result, ids, base, ours, theirs):
+    """
+    对 ids 中的每个条目做三方合并，结果写入 result。base、ours、theirs 为
+    条目 ID -> 记录（不存在时返回 None）的函数。对方只追加了日志时 ids 只需包含
+    日志中出现过的条目，其余条目对方没有改动，保留本地版本即可。
+    """
+    for entry_id in ids:
+        b, o, t = base(entry_id), ours(entry_id), theirs(entry_id)
+        if _same(t, b) or _same(o, t):
+            continue
+        if _same(o, b) or o is None:
+            # 本地没有改动，或本地删除而对方修改了：取对方的版本
+            if t is None:
+                result.deletes.append(entry_id)
+            else:
+                result.puts.append(t)
+        elif t is not None:
+            result.conflicts.append((o, t))
+        # 对方删除而本地修改了：保留本地版本
+
+
+def _merge_categories(base, ours, theirs, remap):
+    base_by_id = {c["id"]: c for c in base}
+    ours_by_id = {c["id"]: c for c in ours}
+    theirs_by_id = {c["id"]: c for c in theirs}
+    merged = [dict(c) for c in ours]
+    merged_by_id = {c["id"]: c for c in merged}
+    next_id = max([*base_by_id, *ours_by_id, *theirs_by_id], default=0) + 1
+
+    taken = []
+    for cat_id, cat in theirs_by_id.items():
+        b, o = base_by_id.get(cat_id), ours_by_id.get(cat_id)
+        if cat == b or cat == o:
+            continue
+        if b is None and o is not None:
+            # 双方同时新建了相同 ID 的分类
+            remap[cat_id] = next_id
+            copy = dict(cat, id=next_id)
+            next_id += 1
+            merged.append(copy)
+            taken.append(copy)
+        elif o == b:
+            if o is None:
+                copy = dict(cat)
+                merged.append(copy)
+            else:
+                copy = merged_by_id[cat_id]
+                copy.clear()
+                copy.update(cat)
+            taken.append(copy)
+
+    for cat_id, cat in base_by_id.items():
+        if cat_id not in theirs_by_id and ours_by_id.get(cat_id) == cat:
+            merged.remove(merged_by_id[cat_id])
+
+    # 从对方取来的分类可能挂在换了 ID 的分类下
+    for cat in taken:
+        if cat.get("parent_id") in remap:
+            cat["parent_id"] = remap[cat["parent_id"]]
+    return merged
+
+
+def merge_meta(result, base, ours, theirs):
+    """合并顶层字段（分类表、数据密钥等），结果写入 result.meta 和 result.category_remap"""
+    theirs_plain = encode_record(theirs)
+    base_plain = encode_record(base)
+    if theirs_plain == base_plain or theirs_plain == encode_record(ours):
+        return
+    if encode_record(ours) == base_plain:
+        result.meta = theirs
+        return
+
+    merged = dict(ours)
+    for key in set(base) | set(theirs):
+        if key == "categories" or theirs.get(key) == base.get(key) or ours.get(key) != base.get(key):
+            continue
+        if key in theirs:
+            merged[key] = theirs[key]
+        else:
+            merged.pop(key, None)
+    merged["categories"] = _merge_categories(
+        base.get("categories", []), ours.get("categories", []), theirs.get("categories", []),
+        result.category_remap
+    )
+    result.meta = merged
@@ -5,71 +5,288 @@
 @Description: 
 """
 
-from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex, QSortFilterProxyModel
 from PyQt6.QtGui import QStandardItemModel, QStandardItem
 
+from utils import trace
+
 
 class PasswordTableModel(QAbstractTableModel):
-    def __init__(self, passwords, categories):
+    """
+    条目较多时按批向视图提供行（canFetchMore/fetchMore），视图滚动到底部才加载
+    下一批。每行的显示文本在加载时一次算好并缓存为元组。
+    """
+    # 每次加载的行数
+    fetch_batch = 1000
+
+    def __init__(self, repository, category_index):
         super().__init__()
-        self.passwords = passwords
-        self.categories = {c['id']: c['name'] for c in categories}
+        self.repository = repository
+        self.passwords = repository.passwords
+        self.category_index = category_index
         self.headers = ["名称", "分类", "账号", "网址", "备注"]
+        # 已加载行的显示文本，None 表示需要重新计算
+        self._display = []
+        self._fetch(min(self.fetch_batch, len(self.passwords)))
 
     def rowCount(self, parent=QModelIndex()):
-        return len(self.passwords)
+        if parent.isValid():
+            return 0
+        return len(self._display)
 
     def columnCount(self, parent=QModelIndex()):
         return len(self.headers)
 
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and len(self._display) < len(self.passwords)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        count = min(self.fetch_batch, len(self.passwords) - len(self._display))
+        if count > 0:
+            row = len(self._display)
+            self.beginInsertRows(QModelIndex(), row, row + count - 1)
+            self._fetch(count)
+            self.endInsertRows()
+
+    @trace.traced("加载全部行", "view")
+    def fetch_all(self) -> bool:
+        """
+        一次加载剩余的全部行（过滤、排序和新增条目前需要完整的数据）。
+        按重置模型处理，代理只需重新建立一次映射；返回是否加载了新行。
+        """
+        if self.fully_loaded:
+            return False
+        self.beginResetModel()
+        # 显示文本留到 data() 第一次用到时再计算
+        self._display.extend([None] * (len(self.passwords) - len(self._display)))
+        self.endResetModel()
+        return True
+
+    @property
+    def fully_loaded(self) -> bool:
+        return len(self._display) == len(self.passwords)
+
+    def _fetch(self, count):
+        start = len(self._display)
+        self._display.extend(map(self.display_row, self.passwords[start:start + count]))
+
+    def display_row(self, item):
+        return (
+            item.name,
+            self.category_index.name(item.category_id, '无分类'),
+            item.username,
+            item.url,
+            item.notes
+        )
+
     def data(self, index, role=Qt.ItemDataRole.DisplayRole):
-        if not index.isValid():
+        if role != Qt.ItemDataRole.DisplayRole or not index.isValid():
             return None
 
         row = index.row()
-        col = index.column()
-        item = self.passwords[row]
-
-        if role == Qt.ItemDataRole.DisplayRole:
-            return {
-                0: item.get('name', ''),
-                1: self.categories.get(item.get('category_id'), '无分类'),
-                2: item.get('username', ''),
-                3: item.get('url', ''),
-                4: item.get('notes', '')
-            }.get(col, '')
-        return None
+        display = self._display[row]
+        if display is None:
+            display = self._display[row] = self.display_row(self.passwords[row])
+        return display[index.column()]
 
     def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
         if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
             return self.headers[section]
         return None
 
+    def entry_id_at(self, row):
+        return self.passwords[row].id
+
+    def put_entry(self, entry):
+        """新增或更新条目并通知视图，返回条目 ID"""
+        if entry.id in self.repository:
+            row, _ = self.repository.put(entry)
+            if row < len(self._display):
+                self._display[row] = None
+                self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.headers) - 1))
+        elif not self.fully_loaded:
+            # 新条目追加在仓库末尾、已加载的范围之后，随 fetchMore 出现，不重置模型
+            self.repository.put(entry)
+        else:
+            row = len(self.repository)
+            self.beginInsertRows(QModelIndex(), row, row)
+            self.repository.put(entry)
+            self._display.append(self.display_row(entry))
+            self.endInsertRows()
+        return entry.id
+
+    def entries_appended(self, start):
+        """
+        仓库末尾从 start 行起批量追加了条目（导入）后通知视图。之前还没加载完时
+        新行会随 fetchMore 出现，无需处理；已全部加载时把新行作为待计算的行插入。
+        """
+        if len(self._display) != start or self.fully_loaded:
+            return
+        self.beginInsertRows(QModelIndex(), start, len(self.passwords) - 1)
+        self._display.extend([None] * (len(self.passwords) - start))
+        self.endInsertRows()
+
+    def remove_entry(self, entry_id):
+        row = self.repository.row_of(entry_id)
+        if row >= len(self._display):
+            return self.repository.delete(entry_id)[1]
+        self.beginRemoveRows(QModelIndex(), row, row)
+        _, entry = self.repository.delete(entry_id)
+        del self._display[row]
+        self.endRemoveRows()
+        return entry
+
+    def categories_changed(self):
+        """分类改名或删除后刷新分类列"""
+        if self._display:
+            self._display = [None] * len(self._display)
+            self.dataChanged.emit(self.index(0, 1), self.index(len(self._display) - 1, 1))
+
+
+class PasswordFilterProxyModel(QSortFilterProxyModel):
+    """
+    在完整的 PasswordTableModel 之上按分类（含子分类）和搜索结果过滤，并支持按任意列排序。
+    搜索结果为条目 ID 的集合，None 表示不过滤。
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.category_id = None
+        self.matches = None
+        # 所选分类子树中的分类 ID，None 表示不按分类过滤
+        self._subtree = None
+        self._passwords = []
+        self.setSortCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
+        self.setDynamicSortFilter(True)
+
+    def setSourceModel(self, model):
+        # 换了数据源后旧的过滤条件不再有效，等下一次 set_filter 重新计算
+        self.category_id = self.matches = self._subtree = None
+        self._passwords = model.passwords if model is not None else []
+        super().setSourceModel(model)
+
+    def set_filter(self, category_id, matches):
+        if category_id == self.category_id and matches is self.matches:
+            return
+        self.category_id = category_id
+        self.matches = matches
+        self.refresh()
+
+    @trace.traced("过滤表格", "view")
+    def refresh(self):
+        """重新应用过滤条件（分类层级变化后也需要调用）"""
+        index = self.sourceModel().category_index
+        if self.category_id is not None and self.category_id in index:
+            self._subtree = set(index.subtree(self.category_id))
+        else:
+            self._subtree = None
+        # 未加载的行不会参与过滤，筛选前先全部加载；加载时的重置已经按新条件过滤过
+        if (self._subtree is None and self.matches is None) or not self.sourceModel().fetch_all():
+            self.invalidateRowsFilter()
+
+    @trace.traced("排序", "view")
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        if column >= 0 and self.sourceModel() is not None:
+            self.sourceModel().fetch_all()
+        super().sort(column, order)
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        entry = self._passwords[source_row]
+        if self.matches is not None and entry.id not in self.matches:
+            return False
+        return self._subtree is None or entry.category_id in self._subtree
+
 
 class CategoryTreeModel(QStandardItemModel):
-    def __init__(self, categories):
+    """
+    分类树。顶部的“全部”项表示不按分类过滤（UserRole 为 None）。
+    分类的增删改只更新受影响的项；counter(分类 ID) 返回该分类子树中的条目数，
+    显示在名称后面，条目变化时调用 refresh_counts 更新相关分类及其上级。
+    """
+
+    def __init__(self, index, counter=None):
         super().__init__()
-        self.categories = categories or []
-        self.setHorizontalHeaderLabels(["分类"])
+        self.category_index = index
+        self.counter = counter
+        self._items = {}
         self._setup_model()
 
+    @trace.traced("重建分类树", "view")
     def _setup_model(self):
         self.clear()
         self.setHorizontalHeaderLabels(["分类"])  # 再次设置标题
 
-        items = {}
-        for cat in self.categories:
-            item = QStandardItem(cat['name'])
+        self.all_item = QStandardItem("全部")
+        self.all_item.setData(None, Qt.ItemDataRole.UserRole)
+        self.appendRow(self.all_item)
+
+        self._items = {}
+        for cat in self.category_index.categories:
+            item = QStandardItem()
             item.setData(cat['id'], Qt.ItemDataRole.UserRole)
-            items[cat['id']] = item
-
-        for cat in self.categories:
-            parent_id = cat.get('parent_id')
-            item = items[cat['id']]
-
-            if parent_id is None:
-                self.appendRow(item)
-            elif parent_id in items:
-                items[parent_id].appendRow(item)
-            else:
-                self.appendRow(item)
+            self._items[cat['id']] = item
+
+        for cat in self.category_index.categories:
+            self._parent_item(self.category_index.parent(cat['id'])).appendRow(self._items[cat['id']])
+        self.refresh_counts()
+
+    def reset(self, index):
+        """整体替换数据（重新加载或导入之后）"""
+        self.category_index = index
+        self._setup_model()
+
+    def item_for(self, category_id):
+        return self.all_item if category_id is None else self._items.get(category_id)
+
+    def _parent_item(self, parent_id):
+        return self.invisibleRootItem() if parent_id is None else self._items[parent_id]
+
+    def _label(self, category_id):
+        name = "全部" if category_id is None else self.category_index.name(category_id, "")
+        if self.counter is None:
+            return name
+        return f"{name} ({self.counter(category_id)})"
+
+    def refresh_counts(self, category_ids=None):
+        """更新给定分类及其所有上级的显示；不传参数时更新全部"""
+        if category_ids is None:
+            targets = set(self._items)
+        else:
+            targets = set()
+            for category_id in category_ids:
+                if category_id in self._items:
+                    targets.add(category_id)
+                    targets.update(self.category_index.ancestors(category_id))
+        for category_id in targets:
+            self._items[category_id].setText(self._label(category_id))
+        self.all_item.setText(self._label(None))
+
+    def add_category(self, category_id):
+        item = QStandardItem()
+        item.setData(category_id, Qt.ItemDataRole.UserRole)
+        self._items[category_id] = item
+        self._parent_item(self.category_index.parent(category_id)).appendRow(item)
+        item.setText(self._label(category_id))
+        return item
+
+    def rename_category(self, category_id):
+        self._items[category_id].setText(self._label(category_id))
+
+    def move_category(self, category_id, old_parent_id):
+        """分类已在索引中移动，把对应的项（连同子项）挂到新的父项下"""
+        item = self._items[category_id]
+        row = self._parent_item(old_parent_id).takeRow(item.row())
+        self._parent_item(self.category_index.parent(category_id)).appendRow(row)
+        self.refresh_counts([old_parent_id, category_id])
+
+    def remove_category(self, category_id, parent_id, child_ids):
+        """分类已从索引中删除，子项上移到 parent_id 下"""
+        item = self._items.pop(category_id)
+        parent_item = self._parent_item(parent_id)
+        for child_id in child_ids:
+            child = self._items[child_id]
+            parent_item.appendRow(item.takeRow(child.row()))
+        parent_item.removeRow(item.row())
+        self.refresh_counts([parent_id])
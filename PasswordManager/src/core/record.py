@@ -0,0 +1,192 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/2 15:10
+@File: record.py
+@Description: 密码条目的紧凑内存表示
+
+解密后的条目不再以 dict 保存，而是使用带 __slots__ 的 PasswordRecord：没有
+每个对象的 __dict__，字段按固定位置存放。账号和网址经常在多个条目间重复，
+加载时做驻留（intern），相同的值只保存一份；驻留的字符串没有引用后随之释放。
+
+记录视为不可变：修改条目时用 replace() 生成新记录，再交给仓库替换旧记录。
+digest 缓存的是该记录在保险库中序列化后的摘要，未改动的记录保存时无需重新编码。
+
+保险库中的条目用定长头部加变长字段的二进制格式序列化（整数均为大端）：
+
+    u8 格式版本 | u8 标志 | u16 * 5 (id, name, url, username, 密码密文的长度)
+    | u32 * 2 (notes, extra 的长度) | i64 分类 ID | 各字段的 UTF-8 字节
+
+密码密文存为 base64 解码后的原始字节，extra 为 JSON。字段超出长度上限或类型不是
+预期的（例如导入数据中字符串形式的分类 ID）时整条改用 JSON 序列化。JSON 以 "{"
+开头，与格式版本字节不会冲突，decode() 据此区分，旧版容器中的 JSON 记录同样可以读取。
+"""
+
+import base64
+import json
+import struct
+import sys
+
+from core.container import KIND_ENTRY, encode_record, record_digest
+
+# 序列化时固定输出的字段，其余字段原样保存在 extra 中
+ENTRY_FIELDS = ("id", "name", "url", "username", "encrypted_password", "notes", "category_id")
+
+# 二进制序列化的格式版本，字段变化时递增并在 decode() 中兼容旧版本
+ENTRY_SCHEMA = 1
+
+_HEAD = struct.Struct(">BBHHHHHIIq")
+_FLAG_NO_CATEGORY = 0x01
+# 密码密文按原始字节保存（否则为原样的 UTF-8 文本）
+_FLAG_RAW_SECRET = 0x02
+_U16_MAX = 0xFFFF
+_U32_MAX = 0xFFFFFFFF
+_I64_RANGE = range(-2 ** 63, 2 ** 63)
+
+
+def _intern(text):
+    return sys.intern(text) if text else ""
+
+
+def _raw_secret(token):
+    """密码密文的 base64 解码结果；不是规范的 base64 文本（解码后不能原样还原）时为 None"""
+    if not token.isascii() or len(token) % 4:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token)
+    except ValueError:
+        return None
+    return raw if base64.urlsafe_b64encode(raw).decode("ascii") == token else None
+
+
+class PasswordRecord:
+    __slots__ = ENTRY_FIELDS + ("extra", "digest")
+
+    def __init__(self, id=None, name="", url="", username="", encrypted_password="", notes="",
+                 category_id=None, extra=None, digest=None):
+        self.id = id
+        self.name = name
+        self.url = url
+        self.username = username
+        self.encrypted_password = encrypted_password
+        self.notes = notes
+        self.category_id = category_id
+        # 未识别的字段（例如导入数据带来的），没有时为 None
+        self.extra = extra
+        self.digest = digest
+
+    def __repr__(self):
+        return f"PasswordRecord(id={self.id!r}, name={self.name!r})"
+
+    @classmethod
+    def from_dict(cls, obj, digest=None):
+        extra = {k: v for k, v in obj.items() if k not in ENTRY_FIELDS} or None
+        return cls(
+            obj.get("id"),
+            obj.get("name") or "",
+            _intern(obj.get("url")),
+            _intern(obj.get("username")),
+            obj.get("encrypted_password") or "",
+            obj.get("notes") or "",
+            obj.get("category_id"),
+            extra,
+            digest
+        )
+
+    @classmethod
+    def decode(cls, plain, digest=None):
+        """从保险库中的序列化结果（二进制或 JSON）还原记录"""
+        if plain[:1] == b"{":
+            return cls.from_dict(json.loads(plain.decode("utf-8")), digest)
+        schema, flags, n_id, n_name, n_url, n_username, n_secret, n_notes, n_extra, category_id = \
+            _HEAD.unpack_from(plain)
+        if schema != ENTRY_SCHEMA:
+            raise ValueError(f"不支持的条目格式版本: {schema}")
+
+        # 各字段依次紧挨着存放，逐个累加长度得到边界
+        a = _HEAD.size
+        b = a + n_id
+        c = b + n_name
+        d = c + n_url
+        e = d + n_username
+        f = e + n_secret
+        g = f + n_notes
+        secret = plain[e:f]
+        extra = plain[g:g + n_extra]
+        if flags & _FLAG_NO_CATEGORY:
+            category_id = None
+        return cls(
+            plain[a:b].decode("utf-8"),
+            plain[b:c].decode("utf-8"),
+            _intern(plain[c:d].decode("utf-8")),
+            _intern(plain[d:e].decode("utf-8")),
+            base64.urlsafe_b64encode(secret).decode("ascii") if flags & _FLAG_RAW_SECRET else secret.decode("utf-8"),
+            plain[f:g].decode("utf-8"),
+            category_id,
+            json.loads(extra.decode("utf-8")) if extra else None,
+            digest
+        )
+
+    def serialize(self) -> bytes:
+        """保险库中保存的序列化结果，见模块说明"""
+        category_id = self.category_id
+        texts = (self.id, self.name or "", self.url or "", self.username or "")
+        secret, notes = self.encrypted_password or "", self.notes or ""
+        if (not all(type(text) is str for text in texts + (secret, notes))
+                or not (category_id is None or type(category_id) is int and category_id in _I64_RANGE)):
+            return self._serialize_json(texts, secret, notes)
+
+        flags = 0 if category_id is not None else _FLAG_NO_CATEGORY
+        raw = _raw_secret(secret)
+        if raw is not None:
+            flags |= _FLAG_RAW_SECRET
+        else:
+            raw = secret.encode("utf-8")
+
+        short = [text.encode("utf-8") for text in texts] + [raw]
+        long = [notes.encode("utf-8"), encode_record(self.extra) if self.extra else b""]
+        if any(len(b) > _U16_MAX for b in short) or any(len(b) > _U32_MAX for b in long):
+            return self._serialize_json(texts, secret, notes)
+        fields = short + long
+        return b"".join([_HEAD.pack(ENTRY_SCHEMA, flags, *map(len, fields), category_id or 0), *fields])
+
+    def _serialize_json(self, texts, secret, notes):
+        # 空值按 from_dict() 读回后的样子写出，日志重放时重新序列化得到的摘要才一致
+        obj = self.to_dict()
+        obj.update(name=texts[1], url=texts[2], username=texts[3], encrypted_password=secret, notes=notes)
+        return encode_record(obj)
+
+    def to_dict(self) -> dict:
+        obj = dict(self.extra) if self.extra else {}
+        obj.update({
+            "id": self.id,
+            "name": self.name,
+            "url": self.url,
+            "username": self.username,
+            "encrypted_password": self.encrypted_password,
+            "notes": self.notes,
+            "category_id": self.category_id
+        })
+        return obj
+
+    def replace(self, **changes):
+        """返回修改了部分字段的新记录"""
+        fields = {name: getattr(self, name) for name in ENTRY_FIELDS}
+        fields["extra"] = self.extra
+        fields.update(changes)
+        return PasswordRecord(**fields)
+
+    def encode(self):
+        """返回 (摘要, 序列化结果)；序列化结果只在摘要尚未缓存时计算，否则为 None"""
+        if self.digest is not None:
+            return self.digest, None
+        plain = self.serialize()
+        self.digest = record_digest(KIND_ENTRY, plain)
+        return self.digest, plain
+
+
+def to_records(entries):
+    """把列表中 dict 形式的条目（日志、旧版数据、调用方传入的）原地转换成记录，返回该列表"""
+    for i, entry in enumerate(entries):
+        if not isinstance(entry, PasswordRecord):
+            entries[i] = PasswordRecord.from_dict(entry)
+    return entries
@@ -0,0 +1,119 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/4/30 14:05
+@File: repository.py
+@Description: 按 ID 存取密码条目
+
+条目仍按原顺序保存在 data["passwords"] 列表中（即磁盘上的顺序），仓库在其上
+维护 ID -> 条目、分类 -> ID 集合两个索引，查找和按分类筛选都不需要遍历列表。
+"""
+
+import uuid
+from collections import defaultdict
+
+
+def new_entry_id() -> str:
+    return uuid.uuid4().hex
+
+
+def ensure_entry_ids(passwords) -> int:
+    """为没有 ID 或 ID 重复的条目分配新 ID，返回分配的个数（用于迁移旧数据）"""
+    count = 0
+    seen = set()
+    for entry in passwords:
+        if not entry.id or entry.id in seen:
+            entry.id = new_entry_id()
+            # ID 变了，序列化结果随之改变
+            entry.digest = None
+            count += 1
+        seen.add(entry.id)
+    return count
+
+
+class PasswordRepository:
+    def __init__(self, passwords):
+        # 直接引用会话中的列表，修改会反映到保存的数据中
+        self.passwords = passwords
+        self._by_id = {}
+        self._by_category = defaultdict(set)
+        # ID -> 建立索引时的分类，条目被原地修改后用来找到旧的分类
+        self._category_of = {}
+        # ID -> 行号；删除后 _stale_from 之后的行号需要重新计算
+        self._rows = {}
+        ensure_entry_ids(passwords)
+        for row, entry in enumerate(passwords):
+            self._index(entry, row)
+        self._stale_from = len(passwords)
+
+    def __len__(self):
+        return len(self.passwords)
+
+    def __contains__(self, entry_id):
+        return entry_id in self._by_id
+
+    def get(self, entry_id):
+        return self._by_id.get(entry_id)
+
+    def ids(self):
+        return self._by_id.keys()
+
+    def ids_in_category(self, category_id):
+        """某分类下所有条目的 ID 集合（只读）"""
+        return self._by_category.get(category_id, frozenset())
+
+    def row_of(self, entry_id) -> int:
+        row = self._rows.get(entry_id)
+        if row is None:
+            raise KeyError(entry_id)
+        if row >= self._stale_from:
+            for i in range(self._stale_from, len(self.passwords)):
+                self._rows[self.passwords[i].id] = i
+            self._stale_from = len(self.passwords)
+            row = self._rows[entry_id]
+        return row
+
+    def put(self, entry):
+        """
+        保存条目并返回 (行号, 是否新增)。没有 ID 时分配新 ID 并追加到末尾；
+        ID 已存在时用它替换原条目。
+        """
+        entry_id = entry.id
+        if not entry_id:
+            entry_id = entry.id = new_entry_id()
+
+        if entry_id in self._by_id:
+            row = self.row_of(entry_id)
+            self._unindex(entry_id)
+            self.passwords[row] = entry
+            self._index(entry, row)
+            return row, False
+
+        row = len(self.passwords)
+        self.passwords.append(entry)
+        self._index(entry, row)
+        return row, True
+
+    def delete(self, entry_id):
+        """删除条目，返回 (行号, 条目)"""
+        row = self.row_of(entry_id)
+        entry = self.passwords.pop(row)
+        self._unindex(entry_id)
+        del self._rows[entry_id]
+        self._stale_from = min(self._stale_from, row)
+        return row, entry
+
+    def _index(self, entry, row):
+        entry_id = entry.id
+        category_id = entry.category_id
+        self._by_id[entry_id] = entry
+        self._by_category[category_id].add(entry_id)
+        self._category_of[entry_id] = category_id
+        self._rows[entry_id] = row
+
+    def _unindex(self, entry_id):
+        category_id = self._category_of.pop(entry_id)
+        ids = self._by_category[category_id]
+        ids.discard(entry_id)
+        if not ids:
+            del self._by_category[category_id]
+        del self._by_id[entry_id]
@@ -0,0 +1,169 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/4/27 16:45
+@File: search_index.py
+@Description: 密码条目的内存倒排索引
+
+每个字段（名称、网址、账号、备注）转成小写后按三字组建立倒排表；中日韩文字
+另外按单字和双字建立，方便用两个汉字这样的短词搜索。查询语法：
+
+    gmail            子串匹配
+    ^git             前缀匹配（字段以 git 开头）
+    工作 邮箱         多个词用空格分隔，条目需同时匹配全部词
+
+索引只保存调用方给出的键（例如条目 ID），不保存条目本身。
+"""
+
+import threading
+from collections import defaultdict
+
+from utils import trace
+
+SEARCH_FIELDS = ("name", "url", "username", "notes")
+
+# 前缀锚点和字段分隔符，不会出现在正常文本中
+_ANCHOR = "\x02"
+_SEP = "\x00"
+# 扫描候选时每隔多少条检查一次是否已取消
+_CANCEL_CHECK = 1024
+
+
+def _is_cjk(ch) -> bool:
+    return ch >= "⺀"
+
+
+def _normalize(text) -> str:
+    return (text or "").casefold()
+
+
+def _field_grams(text):
+    grams = {text[i:i + 3] for i in range(len(text) - 2)}
+    if not text.isascii():
+        for i, ch in enumerate(text):
+            if _is_cjk(ch):
+                grams.add(ch)
+                grams.update(text[j:j + 2] for j in (i - 1, i) if 0 <= j and j + 2 <= len(text))
+    if len(text) >= 2:
+        grams.add(_ANCHOR + text[:2])
+    return grams
+
+
+def _entry_grams(haystack):
+    return set().union(*map(_field_grams, haystack[1:].split(_SEP)))
+
+
+def _query_grams(term, prefix):
+    """
+    返回能缩小候选范围的索引项；返回 None 表示该词太短，只能逐条扫描。
+    exact 为 True 时命中索引项即代表匹配，无需再逐条核对。
+    """
+    grams = {term[i:i + 3] for i in range(len(term) - 2)}
+    # 三个字的词本身就是索引项
+    exact = len(term) == 3 and not prefix
+    if not grams and any(_is_cjk(ch) for ch in term):
+        grams = {term}
+        exact = not prefix
+    if prefix and len(term) >= 2:
+        grams.add(_ANCHOR + term[:2])
+        exact = exact or len(term) == 2
+    return (grams, exact) if grams else (None, False)
+
+
+class SearchIndex:
+    def __init__(self, fields=SEARCH_FIELDS):
+        self.fields = fields
+        self._postings = defaultdict(set)
+        # 键 -> 各字段小写后以分隔符拼接的文本（以分隔符开头），用于核对候选
+        self._texts = {}
+        # 界面线程增量维护索引，查询可能在后台线程进行
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._texts)
+
+    @trace.traced("建立搜索索引", "search")
+    def rebuild(self, items):
+        """items 为 (键, PasswordRecord) 序列"""
+        with self.lock:
+            self._postings.clear()
+            self._texts.clear()
+            for key, entry in items:
+                self._add(key, entry)
+
+    def add(self, key, entry):
+        with self.lock:
+            self._add(key, entry)
+
+    def update(self, key, entry):
+        with self.lock:
+            self._remove(key)
+            self._add(key, entry)
+
+    def remove(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def _add(self, key, entry):
+        haystack = "".join(_SEP + _normalize(getattr(entry, field)) for field in self.fields)
+        self._texts[key] = haystack
+        for gram in _entry_grams(haystack):
+            self._postings[gram].add(key)
+
+    def _remove(self, key):
+        haystack = self._texts.pop(key, None)
+        if haystack is None:
+            return
+        for gram in _entry_grams(haystack):
+            keys = self._postings.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[gram]
+
+    @trace.traced("搜索", "search")
+    def search(self, query, candidates=None, cancelled=None):
+        """
+        返回匹配查询的键集合。candidates 不为 None 时只在其中查找（用于在上一次
+        结果的基础上继续缩小范围）。cancelled() 返回 True 时中止并返回 None。
+        """
+        terms = []
+        for term in _normalize(query).split():
+            prefix = term.startswith("^")
+            term = term[1:] if prefix else term
+            if term:
+                # 前缀匹配即“分隔符 + 词”的子串匹配
+                terms.append((term, prefix, _SEP + term if prefix else term))
+
+        with self.lock:
+            pending, postings = [], []
+            for term, prefix, needle in terms:
+                grams, exact = _query_grams(term, prefix)
+                if grams is None or not exact:
+                    pending.append(needle)
+                if grams is not None:
+                    postings.extend(self._postings.get(gram, set()) for gram in grams)
+
+            # 先按倒排表从小到大求交集缩小范围，最后再逐条核对剩下的词
+            result = None if candidates is None else set(candidates) & self._texts.keys()
+            for keys in sorted(postings, key=len):
+                result = keys & result if result is not None else set(keys)
+                if not result:
+                    return set()
+            if result is None:
+                result = self._texts.keys()
+            if not pending:
+                return set(result)
+
+            texts = self._texts
+            keys = list(result)
+            matched = set()
+            for start in range(0, len(keys), _CANCEL_CHECK):
+                if cancelled is not None and cancelled():
+                    return None
+                chunk = keys[start:start + _CANCEL_CHECK]
+                if len(pending) == 1:
+                    needle = pending[0]
+                    matched.update(key for key in chunk if needle in texts[key])
+                else:
+                    matched.update(key for key in chunk if all(n in texts[key] for n in pending))
+        return matched
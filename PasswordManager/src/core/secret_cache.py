@@ -0,0 +1,75 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/1 10:30
+@File: secret_cache.py
+@Description: 已解密密码的短期缓存
+
+只缓存用户最近查看或复制过的少量密码，超过容量按最近最少使用淘汰，超过存活
+时间自动过期。明文保存在 bytearray 中，淘汰、过期或清空时先用 0 覆盖再丢弃。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+def wipe(buffer):
+    """用 0 覆盖 bytearray 的内容"""
+    buffer[:] = bytes(len(buffer))
+
+
+class SecretCache:
+    def __init__(self, capacity=32, ttl=60):
+        self.capacity = capacity
+        # 秒
+        self.ttl = ttl
+        # 键 -> (明文, 过期时间)，按最近使用排序
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        """返回缓存的明文（bytearray），不存在或已过期时返回 None"""
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            if item[1] <= time.monotonic():
+                self._drop(key)
+                return None
+            self._items.move_to_end(key)
+            return item[0]
+
+    def put(self, key, plaintext: bytearray):
+        with self._lock:
+            if key in self._items:
+                self._drop(key)
+            self._items[key] = (plaintext, time.monotonic() + self.ttl)
+            while len(self._items) > self.capacity:
+                self._drop(next(iter(self._items)))
+
+    def invalidate(self, predicate):
+        """丢弃 predicate(键) 为真的所有项"""
+        with self._lock:
+            for key in [key for key in self._items if predicate(key)]:
+                self._drop(key)
+
+    def purge(self):
+        """清除已过期的项，返回清除的个数"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (_, expires) in self._items.items() if expires <= now]
+            for key in expired:
+                self._drop(key)
+        return len(expired)
+
+    def clear(self):
+        with self._lock:
+            while self._items:
+                self._drop(next(iter(self._items)))
+
+    def _drop(self, key):
+        plaintext, _ = self._items.pop(key)
+        wipe(plaintext)
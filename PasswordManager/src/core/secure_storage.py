@@ -3,24 +3,148 @@
 @Date: 2025/4/15 16:21
 @File: secure_storage.py
 @Description: 
+
+多个进程（两个窗口、窗口和命令行、代理）可以同时打开同一个保险库：
+- 读取时对 passwords.dat.lock 加共享锁，写入时加独占锁（utils/file_lock.py），读者之间不互斥
+- 会话记录最后一次同步时快照和日志的状态（快照头部的代数标识快照，日志长度标识其后的提交），
+  写入前发现其他进程提交过时，先把对方的修改三方合并进来（core/merge.py）再提交
+- 对方只追加了日志时从上次读到的位置继续重放，只解密新增的帧
 """
 
 import base64
 import hashlib
+import hmac
 import json
 import os
+import shutil
+import threading
+from contextlib import contextmanager
+
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from core import kdf as kdfs
+from core.container import VERSION as CONTAINER_VERSION
+from core.container import FERNET_VERSION, KIND_ENTRY, KIND_META, VaultContainer, encode_record, record_digest
+from core.journal import VaultJournal
+from core.merge import MergeResult, merge_entries, merge_meta
+from core.record import PasswordRecord, to_records
+from core.repository import ensure_entry_ids, new_entry_id
+from core.secret_cache import SecretCache, wipe
+from core.session import VaultSession
+from utils import trace
+from utils.file_lock import FileLock
+from utils.file_ops import atomic_write, remove_backups, replace_file
+from utils.parallel import map_chunks
+
+_KEY_CHECK_LABEL = b"password-manager key check"
+# 单个密码密文的格式版本：版本号 | 12 字节 nonce | AES-GCM 密文
+_SECRET_VERSION = 1
+_NONCE_SIZE = 12
+
+
+class VaultChangedError(Exception):
+    """保险库已被其他进程修改，需要先并入对方的修改（auto_sync 为 False 时由调用方处理）"""
+
+
+class VaultKeyChangedError(ValueError):
+    """主密码已在其他程序中修改，当前密钥无法再读取保险库，需要重新解锁"""
+
+
+def _file_state(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
 
-from cryptography.fernet import Fernet
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return None
+
+
+class VaultState:
+    """
+    从磁盘读到的保险库状态（快照加日志）。只重放了新增日志帧时，previous/changed 记录
+    这些帧涉及的条目在上次同步时和现在的版本（不存在为 None），否则两者为 None。
+    """
+
+    def __init__(self, generation):
+        self.generation = generation
+        self.meta = {}
+        self.meta_plain = None
+        self.meta_digest = None
+        self.entries = []
+        self.digests = []
+        self.pending = {}
+        self.journal = None
+        self.version = None
+        # 快照的容器版本；Fernet 版本快照之后的日志中，条目摘要按 JSON 序列化计算
+        self.format = CONTAINER_VERSION
+        # 读取时会话所处的版本，并入前据此确认会话在此期间没有再提交
+        self.since = None
+        self.previous = None
+        self.changed = None
+
+
+def _reencrypt_secrets(old_key, new_key, items):
+    """把一批 (条目 ID, 密文) 从旧数据密钥转为新数据密钥（可在子进程中执行）"""
+    old, new = AESGCM(old_key), AESGCM(new_key)
+    result = []
+    for entry_id, token in items:
+        if not token:
+            result.append(token)
+            continue
+        raw = base64.urlsafe_b64decode(token)
+        if raw[0] != _SECRET_VERSION:
+            raise ValueError(f"不支持的密码密文版本: {raw[0]}")
+        aad = entry_id.encode()
+        plaintext = bytearray(old.decrypt(raw[1:1 + _NONCE_SIZE], raw[1 + _NONCE_SIZE:], aad))
+        nonce = os.urandom(_NONCE_SIZE)
+        try:
+            ciphertext = new.encrypt(nonce, bytes(plaintext), aad)
+        finally:
+            wipe(plaintext)
+        result.append(base64.urlsafe_b64encode(bytes([_SECRET_VERSION]) + nonce + ciphertext).decode("ascii"))
+    return result
 
 
 class SecureStorage:
     def __init__(self, config):
         self.config = config
         self.key = None
-        self.backend = default_backend()
-        self.iterations = 100_000
+        self.salt = None
+        self._key_check = None
+        self.kdf = kdfs.legacy_kdf()
+        self.session = None
+        self.container = VaultContainer(config.data_path, config.backup_count)
+        self.journal = VaultJournal(self._journal_path)
+        # 日志超过任一阈值时在后台压缩为新快照
+        self.journal_max_bytes = 4 * 1024 * 1024
+        self.journal_max_frames = 500
+        self.lock = threading.RLock()
+        # 进程间的读写锁；另一个锁文件在压缩期间一直持有，用来判断压缩是否还在进行
+        self.file_lock = FileLock(f"{config.data_path}.lock")
+        self._compaction_lock = FileLock(f"{config.data_path}.compact.lock")
+        # 为 True 时 load_data/save_data 自动并入其他进程的修改（新建数据对象）；
+        # 界面自己增量同步（read_external/apply_external）时设为 False
+        self.auto_sync = True
+        self.generation = 0
+        # 最近一次提交（或同步）后的状态，用于计算下一帧日志的差异，也是三方合并的共同祖先；
+        # _committed 与 _digests 一一对应
+        self._meta_plain = None
+        self._meta_digest = None
+        self._digests = None
+        self._committed = None
+        # 只存在于日志、尚未写入快照的记录明文
+        self._pending = {}
+        self._compactor = None
+        # 密码字段使用单独的数据密钥加密，数据密钥由主密钥包装后保存在元数据中
+        self._secret_cipher = None
+        self.secret_cache = SecretCache(config.secret_cache_size, config.secret_cache_ttl)
 
     def is_master_password_set(self) -> bool:
         """
@@ -30,72 +154,877 @@ class SecureStorage:
             return False
 
         try:
+            if VaultContainer.is_container(self.config.data_path):
+                return "salt" in self.container.read_header()
             with open(self.config.data_path, "r", encoding="utf-8") as f:
                 obj = json.load(f)
             return "salt" in obj and "data" in obj
         except Exception as e:
-            print(f"[读取主密码失败] {e}")
+            trace.log(e, "读取主密码失败")
             return False
 
-    def initialize_master_key(self, password, salt=None):
+    def initialize_master_key(self, password, salt=None, kdf=None):
+        """
+        派生主密钥。不传 salt 表示新建保险库，此时按配置在本机上校准密钥派生参数。
+        """
         if not password:
             raise ValueError("密码不能为空")
 
         if salt is None:
             salt = os.urandom(16)
+            if kdf is None:
+                kdf = self.recommended_kdf()
+        if kdf is not None:
+            self.kdf = kdf
 
-        kdf = PBKDF2HMAC(
-            algorithm=hashlib.sha256(),
-            length=32,
-            salt=salt,
-            iterations=self.iterations,
-            backend=self.backend
-        )
-        self.key = base64.urlsafe_b64encode(kdf.derive(password.encode()))
+        self._set_key(self._derive_key(password, salt), salt)
         return salt
 
+    def recommended_kdf(self):
+        return kdfs.calibrate(self.config.kdf_algorithm, self.config.kdf_target_ms)
+
+    def _derive_key(self, password, salt, kdf=None) -> bytes:
+        kdf = kdf or self.kdf
+        with trace.span("密钥派生", "crypto", kdf=kdf.name):
+            return kdf.derive(password.encode(), salt)
+
+    def _set_key(self, raw_key, salt):
+        self.key = base64.urlsafe_b64encode(raw_key)
+        self.salt = salt
+        self._key_check = self._compute_key_check(raw_key)
+
+    @staticmethod
+    def _compute_key_check(raw_key) -> str:
+        """由密钥派生的校验值，只用于比对密码是否正确，无法反推出密钥"""
+        return hmac.new(raw_key, _KEY_CHECK_LABEL, hashlib.sha256).hexdigest()
+
+    def _read_vault_header(self) -> dict:
+        """读取 salt、校验值等未加密的头部信息"""
+        if VaultContainer.is_container(self.config.data_path):
+            return self.container.read_header()
+
+        with open(self.config.data_path, "r", encoding="utf-8") as f:
+            obj = json.load(f)
+        return {"salt": obj.get("salt")} if "data" in obj else {}
+
+    def unlock(self, password, progress=None) -> bool:
+        """
+        用主密码解锁保险库。每次解锁只做一次密钥派生：有校验值时直接比对，
+        旧文件没有校验值时通过解密数据来验证，解密结果顺带留在会话中。
+        """
+        if not password:
+            raise ValueError("密码不能为空")
+
+        header = self._read_vault_header()
+        if not header.get("salt"):
+            raise ValueError("数据损坏，找不到主密码记录。")
+
+        salt = bytes.fromhex(header["salt"])
+        kdf = kdfs.kdf_from_dict(header.get("kdf"))
+        raw_key = self._derive_key(password, salt, kdf)
+
+        if header.get("check"):
+            if not hmac.compare_digest(header["check"], self._compute_key_check(raw_key)):
+                return False
+            self.kdf = kdf
+            self._set_key(raw_key, salt)
+            return True
+
+        self.kdf = kdf
+        self._set_key(raw_key, salt)
+        try:
+            self.reload_data(progress)
+        except InvalidToken:
+            self.key = None
+            self.session = None
+            return False
+        return True
+
     def verify_password(self, password):
+        """校验密码是否正确，不改变当前密钥"""
         try:
             if not os.path.exists(self.config.data_path):
                 return False
 
-            with open(self.config.data_path, "r", encoding="utf-8") as f:
-                obj = json.load(f)
-
-            if "salt" not in obj or "data" not in obj:
+            header = self._read_vault_header()
+            if not header.get("salt"):
                 return False
 
-            salt = bytes.fromhex(obj["salt"])
-            self.initialize_master_key(password, salt)
+            kdf = kdfs.kdf_from_dict(header.get("kdf"))
+            raw_key = self._derive_key(password, bytes.fromhex(header["salt"]), kdf)
+            if header.get("check"):
+                return hmac.compare_digest(header["check"], self._compute_key_check(raw_key))
 
-            fernet = Fernet(self.key)
-            decrypted = fernet.decrypt(obj["data"].encode())
-            json.loads(decrypted.decode("utf-8"))
+            key = base64.urlsafe_b64encode(raw_key)
+            if VaultContainer.is_container(self.config.data_path):
+                self.container.load_meta(key)
+            else:
+                with open(self.config.data_path, "r", encoding="utf-8") as f:
+                    Fernet(key).decrypt(json.load(f)["data"].encode())
             return True
 
         except Exception as e:
-            print(f"[验证失败] {str(e)}")
+            trace.log(str(e), "验证失败")
             return False
 
+    def needs_kdf_upgrade(self) -> bool:
+        """当前保险库使用的算法与配置不一致（例如旧文件默认的 PBKDF2）"""
+        return self.kdf.name != self.config.kdf_algorithm
+
+    @trace.traced("重新加密保险库", "storage")
+    def rekey(self, new_password, kdf=None, rotate_secrets=False, progress=None):
+        """
+        用新密码和/或新的密钥派生参数重新加密整个保险库：新密钥只派生一次，所有记录
+        用新主密钥重新加密后写成新快照（多进程并行，见 utils/parallel.py）。
+        rotate_secrets 为 True 时（修改主密码）同时换一个新的数据密钥，重新加密每个条目的密码。
+
+        新快照经原子替换后才生效：中途失败或进程被终止时磁盘上仍是旧密码加密的完整保险库，
+        内存中的密钥和会话数据保持原状，重新执行即可。成功后会话换成新的数据对象（条目为
+        替换后的新记录）。不再轮换出旧快照：已有的 .bak.N 和迁移时留下的 .v1.bak 由旧密钥
+        （旧密码或较弱的密钥派生参数）加密，替换成功后一并删除。
+        progress(done, total) 依次汇报重新加密密码和写快照两个阶段的进度。
+        """
+        if not self.key:
+            raise ValueError("未初始化密钥，不能重新加密")
+
+        self.flush()
+        with self._snapshot_lock():
+            self._ensure_current()
+            data = self.load_data()
+            kdf = kdf or self.recommended_kdf()
+            salt = os.urandom(16)
+            previous = (self.key, self.salt, self.kdf, self._key_check, self._secret_cipher)
+            secret_key = self._unwrap_secret_key(data["secret_key"]) if data.get("secret_key") else None
+            # 在副本上重新加密，写入成功前不改动会话数据和其中的记录
+            new_data = dict(data)
+            entries = new_data["passwords"] = list(data.get("passwords", []))
+            rotated = rotate_secrets and secret_key is not None
+            if rotated:
+                new_secret_key = AESGCM.generate_key(bit_length=256)
+                items = [(entry.id, entry.encrypted_password) for entry in entries]
+                tokens = map_chunks(_reencrypt_secrets, items, secret_key, new_secret_key,
+                                    workers=self.config.crypto_workers, progress=progress)
+                entries[:] = [entry.replace(encrypted_password=token) for entry, token in zip(entries, tokens)]
+                secret_key = new_secret_key
+
+            self.kdf = kdf
+            self._set_key(self._derive_key(new_password, salt), salt)
+            try:
+                if "master_salt" in new_data:
+                    new_data["master_salt"] = salt.hex()
+                # 用新主密钥包装数据密钥；不轮换时各条目的密码密文保持不变
+                if secret_key is not None:
+                    new_data["secret_key"] = self._wrap_secret_key(secret_key)
+                self._secret_cipher = None
+                self._write_snapshot(new_data, progress, keep_backups=False)
+            except BaseException:
+                self.key, self.salt, self.kdf, self._key_check, self._secret_cipher = previous
+                # 快照没有替换，磁盘上的密文仍可复用，下次保存按旧密钥重写快照
+                self._digests = None
+                raise
+            self.session.data = new_data
+            self.session.mark_saved(self._disk_version())
+            removed = remove_backups(self.config.data_path)
+            if removed:
+                trace.log(f"已删除 {removed} 个旧密钥加密的备份", "密钥")
+            if rotated:
+                self.secret_cache.clear()
+        trace.log(f"已使用 {kdf.name} 重新加密保险库（{len(entries)} 条）", "密钥")
+
+    def encrypt_secret(self, entry_id, secret: str) -> str:
+        """
+        加密单个条目的密码，结果保存在条目的 encrypted_password 字段中。
+        密文与条目 ID 绑定，不能挪到其他条目下使用。
+        """
+        nonce = os.urandom(_NONCE_SIZE)
+        plaintext = bytearray(secret.encode("utf-8"))
+        try:
+            ciphertext = self._get_secret_cipher(create=True).encrypt(nonce, bytes(plaintext), entry_id.encode())
+        finally:
+            wipe(plaintext)
+        return base64.urlsafe_b64encode(bytes([_SECRET_VERSION]) + nonce + ciphertext).decode("ascii")
+
+    def decrypt_secret(self, entry_id, token) -> bytearray:
+        """解密单个密码，返回 bytearray，调用方用完后应调用 wipe() 清除"""
+        raw = base64.urlsafe_b64decode(token)
+        if raw[0] != _SECRET_VERSION:
+            raise ValueError(f"不支持的密码密文版本: {raw[0]}")
+        nonce, ciphertext = raw[1:1 + _NONCE_SIZE], raw[1 + _NONCE_SIZE:]
+        return bytearray(self._get_secret_cipher().decrypt(nonce, ciphertext, entry_id.encode()))
+
+    def reveal_secret(self, entry) -> str:
+        """
+        返回条目的明文密码，只在用户查看或复制时调用；列表和搜索从不解密密码。
+        最近用过的明文留在短期缓存中，重复查看无需再次解密。
+        """
+        token = entry.encrypted_password
+        if not token:
+            return ""
+        key = (entry.id, token)
+        plaintext = self.secret_cache.get(key)
+        if plaintext is None:
+            trace.count("密码解密")
+            plaintext = self.decrypt_secret(entry.id, token)
+            self.secret_cache.put(key, plaintext)
+        return plaintext.decode("utf-8")
+
+    def forget_secret(self, entry_id):
+        """条目被修改或删除后立即清除其缓存的明文"""
+        self.secret_cache.invalidate(lambda key: key[0] == entry_id)
+
+    def _get_secret_cipher(self, create=False):
+        """
+        返回当前会话的数据密钥对应的 AESGCM 对象。保险库还没有数据密钥时，
+        create 为 True 则生成一个并写入元数据（随调用方下一次保存落盘）。
+        """
+        if self.session is None:
+            raise ValueError("保险库未解锁")
+        data = self.session.data
+        wrapped = data.get("secret_key")
+        if wrapped is None:
+            if not create:
+                raise ValueError("保险库中没有密码数据密钥")
+            secret_key = AESGCM.generate_key(bit_length=256)
+            with self.lock:
+                wrapped = data["secret_key"] = self._wrap_secret_key(secret_key)
+            self._secret_cipher = (wrapped, AESGCM(secret_key))
+        elif self._secret_cipher is None or self._secret_cipher[0] != wrapped:
+            self._secret_cipher = (wrapped, AESGCM(self._unwrap_secret_key(wrapped)))
+        return self._secret_cipher[1]
+
+    def _wrap_secret_key(self, secret_key: bytes) -> str:
+        return Fernet(self.key).encrypt(secret_key).decode("ascii")
+
+    def _unwrap_secret_key(self, wrapped: str) -> bytes:
+        return Fernet(self.key).decrypt(wrapped.encode("ascii"))
+
+    @trace.traced("保存", "storage")
     def save_data(self, data: dict):
+        """
+        提交数据。与上次提交相比的变化作为一帧追加到日志中，
+        日志过大时由后台线程折叠回快照。其他进程在此之前提交过时，先并入对方的修改
+        （auto_sync 为 False 时抛出 VaultChangedError，由调用方同步后重试）。
+        """
         if not self.key:
             raise ValueError("未初始化密钥，不能保存数据")
 
+        rewrite = self._digests is None or not os.path.exists(self.config.data_path)
+        with self._snapshot_lock() if rewrite else self.lock, self.file_lock.exclusive():
+            to_records(data.setdefault("passwords", []))
+            if self.session is None:
+                self.session = VaultSession(data)
+            elif data is not self.session.data:
+                self.session.data = data
+            self.session.mark_dirty()
+            self._ensure_current()
+            data = self.session.data
+
+            if rewrite or self._digests is None or not os.path.exists(self.config.data_path):
+                self._write_snapshot(data)
+            elif self._needs_recovery():
+                try:
+                    self._write_snapshot(data)
+                finally:
+                    self._compaction_lock.release()
+            else:
+                self._append_changes(data)
+            self.session.mark_saved(self._disk_version())
+
+        self._maybe_compact()
+
+    def load_data(self, progress=None) -> dict:
+        """
+        返回保险库数据。会话存在时直接返回内存中的数据；其他进程提交过修改而本地没有
+        未保存的修改时（且 auto_sync 为 True），先读入对方的修改，返回新的数据对象。
+        没有会话时读取快照并重放日志，progress(done, total) 报告解密进度。
+        """
+        session = self.session
+        if session is not None:
+            # 有未保存的修改时以内存为准，保存时再合并
+            if session.dirty or not self.auto_sync or not session.is_stale(self._disk_version()):
+                return session.data
+
+        self._wait_for_compaction()
+        # 旧格式的文件读取后立即迁移，需要重写快照的锁；加锁后再按文件的实际格式处理
+        exists = os.path.exists(self.config.data_path)
+        legacy = exists and not VaultContainer.is_container(self.config.data_path)
+        outdated = exists and not legacy and self.container.read_version() < CONTAINER_VERSION
+        with self._snapshot_lock() if legacy or outdated else self.lock, self.file_lock.shared():
+            if self.session is not None:
+                self._sync_locked(progress)
+                return self.session.data
+
+            exists = os.path.exists(self.config.data_path)
+            if exists and not VaultContainer.is_container(self.config.data_path):
+                data = self._read_legacy_data()
+            elif exists:
+                state = self._read_state(progress)
+                self._adopt_state(state)
+                data = dict(state.meta)
+                data["passwords"] = state.entries
+                # 加锁前其他程序刚换上旧格式文件时没有持有压缩锁，留到下次加载再迁移
+                if state.format < CONTAINER_VERSION and self._compaction_lock.locked:
+                    # 连同日志一起整体写成新格式的快照
+                    self._write_snapshot(data, progress)
+                    trace.log(f"数据文件已升级为版本 {CONTAINER_VERSION} 格式", "迁移")
+            else:
+                data = {}
+            self.session = VaultSession(data, self._disk_version())
+
+        if ensure_entry_ids(data.get("passwords", [])):
+            # 旧数据中的条目没有 ID，补上后立即保存，之后各处都按 ID 引用条目
+            trace.log("已为旧条目分配 ID", "迁移")
+            self.save_data(data)
+        return data
+
+    def reload_data(self, progress=None) -> dict:
+        """丢弃内存中的数据，强制从磁盘重新加载"""
+        self.session = None
+        return self.load_data(progress)
+
+    def restore_from(self, path, progress=None):
+        """用备份文件替换当前数据文件，旧日志随之作废"""
+        with self._snapshot_lock():
+            # 当前保险库随备份轮换保留为 .bak.1，导入出错时还能找回
+            with open(path, "rb") as src, atomic_write(self.config.data_path, backups=self.config.backup_count) as dst:
+                shutil.copyfileobj(src, dst)
+            self.journal.remove()
+            VaultJournal(self._next_journal_path).remove()
+            self.container.reset()
+            self._digests = None
+            self.session = None
+        return self.load_data(progress)
+
+    # ------------------------------------------------------------ 多进程同步
+
+    def _disk_version(self):
+        """快照文件和两个日志文件的当前状态；其他进程追加日志或替换快照后都会变化"""
+        return (
+            _file_state(self.config.data_path),
+            _file_size(self._journal_path),
+            _file_size(self._next_journal_path)
+        )
+
+    def watched_paths(self):
+        """其他进程提交修改时会变化的文件，界面据此监视保险库"""
+        return [self.config.data_path, self._journal_path, self._next_journal_path]
+
+    def is_stale(self) -> bool:
+        """其他进程在上次同步之后提交过修改"""
+        session = self.session
+        return session is not None and session.is_stale(self._disk_version())
+
+    @trace.traced("读取外部修改", "sync")
+    def read_external(self, progress=None):
+        """
+        读取其他进程提交的修改，返回 VaultState，不改动会话（可以在后台线程中执行）；
+        与上次同步时一致则返回 None。结果交给 apply_external() 并入会话。
+        """
+        with self.lock:
+            if self.session is None or self._digests is None:
+                return None
+            with self.file_lock.shared():
+                return self._read_external_locked(progress)
+
+    def _read_external_locked(self, progress=None):
+        since = self.session.version
+        current = self._disk_version()
+        if current == since:
+            return None
+        state = self._catch_up(since, current)
+        if state is None:
+            trace.log("数据文件已被外部修改，重新加载", "会话")
+            state = self._read_state(progress)
+        state.since = since
+        return state
+
+    @trace.traced("合并外部修改", "sync")
+    def apply_external(self, state, apply=None, lookup=None):
+        """
+        把 read_external() 读到的修改与会话三方合并（共同祖先是上次同步时的状态），返回 MergeResult。
+
+        apply(result) 在持有 self.lock 时把结果应用到会话数据上，界面借此同步更新模型；
+        不传时生成新的会话数据对象，原对象保持不变。lookup(entry_id) 按 ID 取会话中的条目，
+        不传时临时建立索引。双方改成不同内容的条目保留本地版本，对方的版本另存为冲突副本。
+        读取之后会话又提交过时抛出 VaultChangedError，需要重新读取。
+        """
+        with self.lock:
+            session = self.session
+            if session is None or state.since != session.version:
+                raise VaultChangedError("读取期间保险库又有新的提交，需要重新读取")
+
+            data = session.data
+            if lookup is None:
+                lookup = {entry.id: entry for entry in data.get("passwords", [])}.get
+            result = MergeResult()
+            merge_meta(result, json.loads(self._meta_plain.decode("utf-8")),
+                       {k: v for k, v in data.items() if k != "passwords"}, state.meta)
+            if state.changed is not None:
+                merge_entries(result, state.changed, state.previous.get, lookup, state.changed.get)
+            else:
+                base = {entry.id: entry for entry in self._committed}
+                theirs = {entry.id: entry for entry in state.entries}
+                merge_entries(result, base.keys() | theirs.keys(), base.get, lookup, theirs.get)
+
+            local_changes = session.dirty or bool(result.conflicts)
+            self._rewrap_secret_key(result, data, state)
+            result.puts.extend(self._conflict_copy(theirs) for _, theirs in result.conflicts)
+            if result.category_remap:
+                remap = result.category_remap
+                result.puts = [
+                    entry.replace(category_id=remap[entry.category_id]) if entry.category_id in remap else entry
+                    for entry in result.puts
+                ]
+                local_changes = True
+
+            if apply is None:
+                self._apply_to_copy(result)
+            else:
+                apply(result)
+            for entry_id in result.deletes:
+                self.forget_secret(entry_id)
+            for entry in result.puts:
+                self.forget_secret(entry.id)
+
+            self._adopt_state(state)
+            session.version = state.version
+            session.dirty = local_changes
+            if result.conflicts:
+                trace.log(f"{len(result.conflicts)} 个条目双方都修改过，对方的版本已另存为副本", "合并")
+        return result
+
+    def _sync_locked(self, progress=None):
+        """读取并并入其他进程的修改（调用方持有 self.lock 和文件锁）"""
+        state = self._read_external_locked(progress)
+        if state is not None:
+            self.apply_external(state)
+
+    def _ensure_current(self):
+        """写入前确认会话基于磁盘上的最新状态（调用方持有 self.lock 和独占锁）"""
+        session = self.session
+        if session is None or self._digests is None or not session.is_stale(self._disk_version()):
+            return
+        if not self.auto_sync:
+            raise VaultChangedError("保险库已被其他程序修改，请先同步")
+        self._sync_locked()
+
+    def _catch_up(self, since, current):
+        """
+        快照没有被替换、日志只是变长时，在上次同步的状态上只重放新增的帧。
+        无法增量读取（快照被替换、日志被截断或重建）时返回 None。
+        """
+        if since is None or current[0] != since[0]:
+            return None
+
         fernet = Fernet(self.key)
-        encrypted = fernet.encrypt(json.dumps(data).encode()).decode()
+        state = VaultState(self.generation)
+        state.meta = json.loads(self._meta_plain.decode("utf-8"))
+        state.meta_plain, state.meta_digest = self._meta_plain, self._meta_digest
+        state.entries = list(self._committed)
+        state.digests = list(self._digests)
+        state.pending = dict(self._pending)
+        state.format = self.container.version
+        state.previous, state.changed = {}, {}
+
+        expected = self.generation
+        journals = []
+        for path, start, size in ((self._journal_path, since[1], current[1]),
+                                  (self._next_journal_path, since[2], current[2])):
+            if size is None:
+                if start is not None:
+                    return None
+                continue
+            if start is not None and size < start:
+                return None
+            journal = VaultJournal(path)
+            if journal.read_base() != expected:
+                return None
+            journals.append((journal, start))
+            expected += 1
+
+        for journal, start in journals:
+            if journal.path == self.journal.path and start is not None:
+                journal.frames = self.journal.frames
+            with trace.span("重放日志", "sync", path=os.path.basename(journal.path), start=start):
+                for ops in journal.replay(fernet, start):
+                    self._apply_ops(ops, state)
+            state.journal = journal
+        state.version = current
+        return state
+
+    def _adopt_state(self, state):
+        """以读到的磁盘状态作为最新的提交状态"""
+        self.generation = state.generation
+        self._meta_plain, self._meta_digest = state.meta_plain, state.meta_digest
+        self._committed = list(state.entries)
+        self._digests = state.digests
+        self._pending = state.pending
+        self.journal = state.journal or VaultJournal(self._journal_path)
+
+    def _apply_to_copy(self, result):
+        """把合并结果应用到会话数据的副本上，替换会话数据"""
+        data = self.session.data
+        deleted = set(result.deletes)
+        entries = [entry for entry in data.get("passwords", []) if entry.id not in deleted]
+        rows = {entry.id: row for row, entry in enumerate(entries)}
+        for entry in result.puts:
+            row = rows.get(entry.id)
+            if row is None:
+                rows[entry.id] = len(entries)
+                entries.append(entry)
+            else:
+                entries[row] = entry
+        new_data = dict(result.meta) if result.meta is not None else {k: v for k, v in data.items() if k != "passwords"}
+        new_data["passwords"] = entries
+        self.session.data = new_data
+
+    def _conflict_copy(self, entry):
+        """对方版本的冲突副本：新 ID（密码密文与 ID 绑定，需要重新加密）"""
+        copy_id = new_entry_id()
+        token = entry.encrypted_password
+        if token:
+            plaintext = self.decrypt_secret(entry.id, token)
+            try:
+                token = self.encrypt_secret(copy_id, plaintext.decode("utf-8"))
+            finally:
+                wipe(plaintext)
+        return entry.replace(id=copy_id, name=f"{entry.name}（冲突副本）", encrypted_password=token)
+
+    def _rewrap_secret_key(self, result, data, state):
+        """
+        双方在保险库还没有数据密钥时各自生成了一个：采用对方的数据密钥，
+        本地用自己的密钥加密的密码改用对方的密钥重新加密。
+        """
+        base_meta = json.loads(self._meta_plain.decode("utf-8"))
+        ours, theirs = data.get("secret_key"), state.meta.get("secret_key")
+        if base_meta.get("secret_key") is not None or ours is None or theirs is None or ours == theirs:
+            return
+        # 双方都改了顶层字段，merge_meta 一定给出了合并结果
+        result.meta["secret_key"] = theirs
+        old = AESGCM(self._unwrap_secret_key(ours))
+        new = AESGCM(self._unwrap_secret_key(theirs))
+        updated = {entry.id: entry for entry in result.puts}
+        for entry in data.get("passwords", []):
+            # 取自对方的条目本来就是用对方的密钥加密的
+            if entry.id in updated or not entry.encrypted_password:
+                continue
+            raw = base64.urlsafe_b64decode(entry.encrypted_password)
+            aad = entry.id.encode()
+            plaintext = bytearray(old.decrypt(raw[1:1 + _NONCE_SIZE], raw[1 + _NONCE_SIZE:], aad))
+            nonce = os.urandom(_NONCE_SIZE)
+            try:
+                ciphertext = new.encrypt(nonce, bytes(plaintext), aad)
+            finally:
+                wipe(plaintext)
+            token = base64.urlsafe_b64encode(bytes([_SECRET_VERSION]) + nonce + ciphertext).decode("ascii")
+            updated[entry.id] = entry.replace(encrypted_password=token)
+        result.puts = list(updated.values())
+        self._secret_cipher = None
 
-        obj = {
-            "salt": data.get("master_salt"),
-            "data": encrypted
+    def _needs_recovery(self) -> bool:
+        """
+        上次压缩在替换快照前中断（日志停在 .journal.new 上且没有进程在压缩）。
+        返回 True 时已持有压缩锁，调用方写完快照后释放。
+        """
+        if self._compactor is not None or self.journal.path != self._next_journal_path:
+            return False
+        if not self._compaction_lock.acquire(blocking=False):
+            return False
+        trace.log("恢复未完成的压缩", "日志")
+        return True
+
+    @contextmanager
+    def _snapshot_lock(self):
+        """
+        整体重写快照期间持有的锁：压缩锁、self.lock 和独占文件锁，顺序与压缩线程相同
+        （压缩锁 → 提交时的 self.lock → 文件锁）。本进程或其他进程正在压缩时等它结束，
+        期间也不会有新的压缩开始。调用方不能已经持有 self.lock，否则会与压缩线程互相等待。
+        """
+        with self._compaction_lock.exclusive(), self.lock, self.file_lock.exclusive():
+            yield
+
+    def flush(self):
+        """将会话中未保存的修改写回磁盘"""
+        if self.session is not None and self.session.dirty:
+            self.save_data(self.session.data)
+
+    def close_session(self, save=True):
+        """保存并丢弃内存中的数据和密钥；save 为 False 时放弃未保存的修改"""
+        if save:
+            self.flush()
+        self._wait_for_compaction()
+        self.session = None
+        self.key = None
+        self._key_check = None
+        self._digests = None
+        self._committed = None
+        self._pending = {}
+        self._secret_cipher = None
+        self.secret_cache.clear()
+
+    @property
+    def _journal_path(self):
+        return f"{self.config.data_path}.journal"
+
+    @property
+    def _next_journal_path(self):
+        return f"{self.config.data_path}.journal.new"
+
+    def _header(self, generation):
+        return {
+            "salt": self.salt.hex() if self.salt else None,
+            "kdf": self.kdf.to_dict(),
+            "check": self._key_check,
+            "generation": generation
         }
 
-        with open(self.config.data_path, "w", encoding="utf-8") as f:
-            json.dump(obj, f, ensure_ascii=False, indent=4)
+    @trace.traced("写快照", "storage")
+    def _write_snapshot(self, data, progress=None, keep_backups=True):
+        """
+        整体写出新快照并开始一个空日志（新建保险库、迁移旧格式或更换密钥时使用）。
+        调用方持有压缩锁（见 _snapshot_lock），不会与其他进程的压缩同时替换快照。
+        keep_backups 为 False 时不把当前文件轮换为 .bak.1（旧文件由已经不用的密钥加密）。
+        """
+        if not self._compaction_lock.locked:
+            raise RuntimeError("写快照前需要持有压缩锁")
+        if self.salt is None and data.get("master_salt"):
+            self.salt = bytes.fromhex(data["master_salt"])
+
+        meta = {k: v for k, v in data.items() if k != "passwords"}
+        self._meta_plain = encode_record(meta)
+        self._meta_digest = record_digest(KIND_META, self._meta_plain)
+        records = [(KIND_META, self._meta_digest, self._meta_plain)]
+        self._digests = []
+        for entry in to_records(data.setdefault("passwords", [])):
+            # 快照整体重写，已缓存摘要的记录也要重新编码
+            entry.digest = None
+            digest, plain = entry.encode()
+            records.append((KIND_ENTRY, digest, plain))
+            self._digests.append(digest)
 
-    def load_data(self) -> dict:
-        if not os.path.exists(self.config.data_path):
-            return {}
+        self.generation += 1
+        self.container.reset()
+        self.container.save(self.key, self._header(self.generation), records, self.config.crypto_workers, progress,
+                            backups=None if keep_backups else 0)
+        self.journal = VaultJournal(self._journal_path)
+        self.journal.create(self.generation)
+        # 中断的压缩留下的日志已经包含在新快照中
+        VaultJournal(self._next_journal_path).remove()
+        self._committed = list(data["passwords"])
+        self._pending = {}
+
+    @trace.traced("追加日志", "storage")
+    def _append_changes(self, data):
+        """把与上次提交之间的差异写成一帧日志"""
+        ops = []
+        meta = {k: v for k, v in data.items() if k != "passwords"}
+        meta_plain = encode_record(meta)
+        meta_digest = record_digest(KIND_META, meta_plain)
+        if meta_digest != self._meta_digest:
+            ops.append({"op": "meta", "meta": meta})
+
+        # 未改动的记录带有缓存的摘要，只有新增或修改过的记录需要编码
+        entries = data.get("passwords", [])
+        encoded = [entry.encode() for entry in entries]
+        digests = [digest for digest, _ in encoded]
+
+        # 单次增删改只会改动一段连续区间，去掉相同的头尾即可
+        old = self._digests
+        limit = min(len(old), len(digests))
+        head = 0
+        while head < limit and old[head] == digests[head]:
+            head += 1
+        tail = 0
+        while tail < limit - head and old[-1 - tail] == digests[-1 - tail]:
+            tail += 1
+
+        removed = old[head:len(old) - tail]
+        inserted = range(head, len(digests) - tail)
+        if removed or inserted:
+            ops.append({
+                "op": "splice",
+                "at": head,
+                "remove": [digest.hex() for digest in removed],
+                "insert": [entries[i].to_dict() for i in inserted]
+            })
+
+        if not ops:
+            return
+
+        if self.journal.base is None:
+            self.journal.create(self.generation)
+        self.journal.append(Fernet(self.key), ops)
+
+        self._meta_plain, self._meta_digest = meta_plain, meta_digest
+        self._digests = digests
+        self._committed = list(entries)
+        for i in inserted:
+            digest, plain = encoded[i]
+            if plain is None and digest not in self._pending and not self.container.has_blob(digest):
+                plain = entries[i].serialize()
+            if plain is not None:
+                self._pending[digest] = plain
+
+    @staticmethod
+    def _apply_ops(ops, state):
+        """在读到的状态上重放一帧日志；state.changed 不为 None 时记录涉及的条目"""
+        for op in ops:
+            if op["op"] == "meta":
+                state.meta.clear()
+                state.meta.update(op["meta"])
+                state.meta_plain = encode_record(state.meta)
+                state.meta_digest = record_digest(KIND_META, state.meta_plain)
+            elif op["op"] == "splice":
+                at, removed = op["at"], op["remove"]
+                if [digest.hex() for digest in state.digests[at:at + len(removed)]] != removed:
+                    raise ValueError("日志与快照不一致")
+                records = [PasswordRecord.from_dict(entry) for entry in op["insert"]]
+                if state.format <= FERNET_VERSION:
+                    plains = [encode_record(entry) for entry in op["insert"]]
+                else:
+                    plains = [record.serialize() for record in records]
+                digests = [record_digest(KIND_ENTRY, plain) for plain in plains]
+                for record, digest in zip(records, digests):
+                    record.digest = digest
+                if state.changed is not None:
+                    for entry in state.entries[at:at + len(removed)]:
+                        state.previous.setdefault(entry.id, entry)
+                        state.changed[entry.id] = None
+                    for entry in records:
+                        state.previous.setdefault(entry.id, None)
+                        state.changed[entry.id] = entry
+                state.entries[at:at + len(removed)] = records
+                state.digests[at:at + len(removed)] = digests
+                state.pending.update(zip(digests, plains))
+
+    def _maybe_compact(self):
+        if self.journal.size >= self.journal_max_bytes or self.journal.frames >= self.journal_max_frames:
+            self.compact()
+
+    def compact(self, wait=False):
+        """
+        把日志折叠成新快照。新的提交会先写入 .journal.new，
+        快照替换完成后再把它改名为正式日志，任何时刻崩溃都能按代数恢复。
+        压缩期间其他进程也会把提交追加到 .journal.new；会话落后于磁盘或其他进程正在压缩时跳过。
+        """
+        with self.lock:
+            if self._compactor is None and self._can_compact():
+                with self.file_lock.exclusive():
+                    if not self.is_stale() and self._compaction_lock.acquire(blocking=False):
+                        self._start_compaction()
+            compactor = self._compactor
 
+        if wait and compactor is not None:
+            compactor.join()
+
+    def _start_compaction(self):
+        records = [(KIND_META, self._meta_digest, self._meta_plain)]
+        records.extend((KIND_ENTRY, digest, self._pending.get(digest)) for digest in self._digests)
+        generation = self.generation + 1
+        # 快照对应的是此刻的正式日志，提交前确认它没有被其他进程改动
+        expected = self._disk_version()[:2]
+
+        self.journal = VaultJournal(self._next_journal_path)
+        self.journal.create(generation)
+        if self.session is not None:
+            self.session.version = self._disk_version()
+        self._compactor = threading.Thread(
+            target=self._run_compaction,
+            args=(self.key, self._header(generation), records, set(self._pending), generation, expected),
+            daemon=True
+        )
+        # 压缩锁由压缩线程在结束时释放
+        self._compaction_lock.hand_over(self._compactor)
+        self._compactor.start()
+
+    def _can_compact(self):
+        return (
+            self.key is not None
+            and self._digests is not None
+            and self.journal.path == self._journal_path
+            and self.journal.frames > 0
+        )
+
+    def _run_compaction(self, key, header, records, included, generation, expected):
+        try:
+            with trace.span("压缩日志", "storage", records=len(records)):
+                self.container.save(key, header, records, self.config.crypto_workers,
+                                    lock=self._committing_compaction(generation, included, expected))
+        except Exception as e:
+            # 快照没有替换成功，新提交继续留在 .journal.new 中，下次加载时一并重放
+            trace.log(str(e), "压缩失败")
+            with self.lock:
+                self._compactor = None
+        finally:
+            self._compaction_lock.release()
+
+    @contextmanager
+    def _committing_compaction(self, generation, included, expected):
+        """替换快照和日志改名在同一个独占锁内完成，其他进程不会读到两者之间的状态"""
+        with self.lock, self.file_lock.exclusive():
+            if self._disk_version()[:2] != expected:
+                raise VaultChangedError("压缩期间快照被其他程序替换，放弃本次压缩")
+            yield
+            replace_file(self._next_journal_path, self._journal_path)
+            self.journal.path = self._journal_path
+            self.generation = generation
+            self._pending = {d: p for d, p in self._pending.items() if d not in included}
+            if self.session is not None:
+                # 其他进程在压缩期间追加到 .journal.new 的帧还没有读过，日志位置沿用改名前的
+                self.session.version = (_file_state(self.config.data_path), self.session.version[2], None)
+            self._compactor = None
+
+    def _wait_for_compaction(self):
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+
+    @trace.traced("读取保险库", "storage")
+    def _read_state(self, progress=None):
+        """读取快照并重放日志，返回磁盘上的完整状态（调用方持有文件锁）"""
+        if not self.key:
+            raise ValueError("密钥未初始化，无法解密")
+
+        header = self.container.read_header()
+        if self._key_check and header.get("check") and header["check"] != self._key_check:
+            raise VaultKeyChangedError("主密码已在其他程序中修改，请重新解锁")
+        if self.salt is None and header.get("salt"):
+            self.salt = bytes.fromhex(header["salt"])
+
+        state = VaultState(header.get("generation", 0))
+        state.version = self._disk_version()
+        state.format = self.container.version
+        # 边解密边解析，明文用完即丢弃
+        with trace.span("解密快照", "storage") as span:
+            for kind, digest, plain in self.container.iter_records(self.key, progress):
+                if kind == KIND_META:
+                    state.meta = json.loads(plain.decode("utf-8"))
+                    state.meta_plain, state.meta_digest = plain, digest
+                else:
+                    state.entries.append(PasswordRecord.decode(plain, digest))
+                    state.digests.append(digest)
+            span.set(records=len(state.entries))
+        if state.meta_plain is None:
+            state.meta_plain = encode_record(state.meta)
+            state.meta_digest = record_digest(KIND_META, state.meta_plain)
+
+        # 依次重放正式日志和压缩留下（或正在写入）的 .journal.new；
+        # 压缩中断的日志在下一次写入时由 _needs_recovery 折叠
+        fernet = Fernet(self.key)
+        expected = state.generation
+        for path in (self._journal_path, self._next_journal_path):
+            journal = VaultJournal(path)
+            if journal.read_base() != expected:
+                continue
+            with trace.span("重放日志", "storage", path=os.path.basename(path)):
+                for ops in journal.replay(fernet):
+                    self._apply_ops(ops, state)
+            state.journal = journal
+            expected += 1
+        return state
+
+    def _read_legacy_data(self) -> dict:
+        """读取旧版单一 Fernet 数据块格式，并迁移为按记录加密的容器格式"""
         with open(self.config.data_path, "r", encoding="utf-8") as f:
             obj = json.load(f)
 
@@ -107,4 +1036,12 @@ class SecureStorage:
 
         fernet = Fernet(self.key)
         decrypted = fernet.decrypt(obj["data"].encode())
-        return json.loads(decrypted.decode("utf-8"))
+        data = json.loads(decrypted.decode("utf-8"))
+
+        if self.salt is None and obj.get("salt"):
+            self.salt = bytes.fromhex(obj["salt"])
+        # 迁移前保留一份旧文件
+        shutil.copy2(self.config.data_path, f"{self.config.data_path}.v1.bak")
+        self._write_snapshot(data)
+        trace.log("数据文件已升级为按记录加密的格式", "迁移")
+        return data
@@ -0,0 +1,29 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/4/18 10:05
+@File: session.py
+@Description: 已解锁保险库的内存会话
+"""
+
+
+class VaultSession:
+    """
+    登录后解密一次的保险库数据，之后的读取都直接走内存。
+    version 是最后一次与磁盘同步（加载、提交或并入其他进程的修改）时快照和日志的状态
+    （见 SecureStorage._disk_version），与磁盘当前状态不同说明其他进程提交过修改。
+    """
+
+    def __init__(self, data, version=None):
+        self.data = data
+        self.dirty = False
+        self.version = version
+
+    def is_stale(self, version) -> bool:
+        return version != self.version
+
+    def mark_dirty(self):
+        self.dirty = True
+
+    def mark_saved(self, version):
+        self.dirty = False
+        self.version = version
@@ -6,40 +6,66 @@
 """
 
 
+import time
+
+# 启动计时从这里开始，之后才导入 PyQt6 等较重的模块
+_STARTED = time.perf_counter()
+
+import multiprocessing
 import os
 import sys
+import threading
 
-from PyQt6.QtWidgets import QApplication, QMessageBox, QDialog
-
-from config.app_config import AppConfig
-from core.secure_storage import SecureStorage
-from ui.dialogs.login import LoginDialog
-from ui.main_window import MainWindow
+from utils import trace
+from utils.startup import StartupProfile
 
 
 class PasswordManager:
-    def __init__(self):
+    """
+    启动时只导入显示登录对话框所需的模块；主窗口及其依赖在对话框显示期间由后台线程导入，
+    密钥派生完成后在界面线程中创建。
+    """
+
+    def __init__(self, profile):
+        self.profile = profile
+        with profile.phase("导入 PyQt6"):
+            from PyQt6.QtWidgets import QApplication
+        with profile.phase("导入配置和存储"):
+            from config.app_config import AppConfig
+            from core.secure_storage import SecureStorage
+
         self.config = AppConfig()
+        profile.enabled = self.config.debug
+        if self.config.debug or self.config.trace_path:
+            # 跟踪的时间轴与启动计时对齐
+            trace.enable(self.config.trace_path, origin=profile.started)
         self.ensure_config_directory()
         self.storage = SecureStorage(self.config)
         self.app = QApplication(sys.argv)
         self.main_window = None
         self.initialized = False
+        self._preload = None
+        # 登录时升级密钥派生参数失败的原因，主窗口打开后提示
+        self.kdf_upgrade_error = None
 
     def ensure_config_directory(self):
         """确保配置目录和密码文件路径存在"""
         os.makedirs(os.path.dirname(self.config.data_path), exist_ok=True)
 
     def run(self):
-        # 加载样式表
-        self.app.setStyleSheet(self.load_stylesheet())
+        from PyQt6.QtWidgets import QMessageBox
+        from config.styles import load_stylesheet
+
+        # 加载样式表，应用到整个程序（包括之后的对话框）
+        with self.profile.phase("加载样式表"):
+            self.app.setStyleSheet(load_stylesheet())
 
         try:
             if not os.path.exists(self.config.data_path) or os.path.getsize(self.config.data_path) == 0:
-                print("首次运行，需要设置主密码")
+                trace.log("首次运行，需要设置主密码")
                 self.setup_master_password()
             else:
-                print("非首次运行，需要登录")
+                trace.log("非首次运行，需要登录")
                 self.login()
 
             if self.initialized and self.main_window:
@@ -49,78 +75,100 @@ class PasswordManager:
 
         except Exception as e:
             QMessageBox.critical(None, "错误", f"程序崩溃: {str(e)}")
-            print(f"错误详情: {str(e)}")
+            trace.log(f"错误详情: {str(e)}")
             sys.exit(1)
 
+    def preload_main_window(self):
+        """在后台线程中导入主窗口模块，与用户输入密码、密钥派生同时进行"""
+        def preload():
+            with self.profile.phase("导入主窗口（后台）"):
+                import ui.main_window  # noqa: F401
+
+        self._preload = threading.Thread(target=preload, name="preload-main-window", daemon=True)
+        self._preload.start()
+
+    def open_login_dialog(self, mode, task):
+        from PyQt6.QtWidgets import QDialog
+        with self.profile.phase("导入登录对话框"):
+            from ui.dialogs.login import LoginDialog
+
+        dialog = LoginDialog(mode=mode, crypto=self.storage, task=task)
+        # 对话框画出来之后再开始后台导入，不和首帧争抢解释器
+        self.profile.watch_first_frame(dialog, "登录对话框首帧", self.preload_main_window)
+        return dialog.exec() == QDialog.DialogCode.Accepted
+
     def setup_master_password(self):
-        dialog = LoginDialog(mode='setup', crypto=self.storage)
-        result = dialog.exec()
-
-        if result == QDialog.DialogCode.Accepted:
-            password = dialog.password_input.text()
-            if not password:
-                QMessageBox.warning(None, "提示", "密码不能为空。")
-                return
-
-            try:
-                salt = self.storage.initialize_master_key(password)
-                initial_data = {
-                    "passwords": [],
-                    "categories": [{"id": 1, "name": "默认分类", "parent_id": None}],
-                    "master_salt": salt.hex()
-                }
-                self.storage.save_data(initial_data)
-                self.initialized = True
-                self.show_main_window()
-            except Exception as e:
-                print(f"设置密码出错: {str(e)}")
-                QMessageBox.critical(None, "错误", f"密码设置失败: {str(e)}")
+        # 密钥派生参数校准和首次保存都在对话框的后台线程中完成
+        if self.open_login_dialog('setup', self.create_vault):
+            self.initialized = True
+            self.show_main_window()
         else:
-            print("用户取消设置密码")
+            trace.log("用户取消设置密码")
+
+    def create_vault(self, password, progress=None):
+        """在后台线程中执行：派生主密钥并写入初始数据"""
+        try:
+            salt = self.storage.initialize_master_key(password)
+            initial_data = {
+                "passwords": [],
+                "categories": [{"id": 1, "name": "默认分类", "parent_id": None}],
+                "master_salt": salt.hex()
+            }
+            self.storage.save_data(initial_data)
+        except Exception as e:
+            trace.log(f"设置密码出错: {str(e)}")
+            raise
+        return True
 
     def login(self):
-        dialog = LoginDialog(mode='login', crypto=self.storage)
-        if dialog.exec() == QDialog.DialogCode.Accepted:
-            password = dialog.password_input.text()
-            if not password:
-                QMessageBox.warning(None, "提示", "密码不能为空。")
-                return
-
-            data = self.storage.load_data()
-            if not data or not data.get("master_salt"):
-                QMessageBox.critical(None, "错误", "数据损坏，找不到主密码记录。")
-                return
-
-            try:
-                stored_salt = bytes.fromhex(data["master_salt"])
-                self.storage.initialize_master_key(password, stored_salt)
-
-                if self.storage.verify_password(password):
-                    self.initialized = True
-                    self.show_main_window()
-                else:
-                    QMessageBox.warning(None, "错误", "密码不正确。")
-            except Exception as e:
-                QMessageBox.critical(None, "错误", f"验证失败: {str(e)}")
+        if self.open_login_dialog('login', self.unlock_vault):
+            self.initialized = True
+            self.show_main_window()
+
+    def unlock_vault(self, password, progress=None):
+        """在后台线程中执行：只做一次密钥派生，验证通过后直接用同一个密钥加载数据"""
+        if not self.storage.unlock(password, progress):
+            return False
+        self.storage.load_data(progress)
+        if self.storage.needs_kdf_upgrade():
+            if self.config.kdf_auto_upgrade:
+                self.upgrade_kdf(password, progress)
+            else:
+                trace.log(f"保险库仍使用 {self.storage.kdf.name}，修改主密码时升级", "密钥")
+        return True
+
+    def upgrade_kdf(self, password, progress=None):
+        """
+        在登录对话框的后台任务中把旧保险库的密钥派生算法升级为配置的算法，
+        进度显示在对话框中。失败时保险库保持原样，打开主窗口后提示用户。
+        """
+        try:
+            self.storage.rekey(password, progress=progress)
+        except Exception as e:
+            trace.log(f"密钥派生参数升级失败: {str(e)}")
+            self.kdf_upgrade_error = e
 
     def show_main_window(self):
+        from PyQt6.QtWidgets import QMessageBox
         try:
-            self.main_window = MainWindow(self.storage, self.config)
+            if self._preload is not None:
+                self._preload.join()
+            from ui.main_window import MainWindow
+            with self.profile.phase("创建主窗口"):
+                self.main_window = MainWindow(self.storage, self.config)
+            self.profile.watch_first_frame(self.main_window, "主窗口首帧", self.profile.report)
             self.main_window.show()
+            if self.kdf_upgrade_error is not None:
+                QMessageBox.warning(self.main_window, "提示",
+                                    f"升级密钥派生参数失败，保险库仍使用原来的参数: {str(self.kdf_upgrade_error)}")
+                self.kdf_upgrade_error = None
         except Exception as e:
-            print(f"主窗口创建失败: {str(e)}")
+            trace.log(f"主窗口创建失败: {str(e)}")
             QMessageBox.critical(None, "错误", f"无法启动主界面: {str(e)}")
 
-    def load_stylesheet(self):
-        try:
-            # 注意根据项目结构调整路径
-            with open("../resources/qss/main.qss", "r", encoding="utf-8") as f:
-                return f.read()
-        except FileNotFoundError:
-            print("样式表未找到")
-            return ""
-
 
 if __name__ == "__main__":
-    manager = PasswordManager()
+    # 打包后的程序中，批量加密使用的子进程从这里接管执行
+    multiprocessing.freeze_support()
+    manager = PasswordManager(StartupProfile(_STARTED))
     manager.run()
@@ -0,0 +1,114 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/5 10:15
+@File: autosave.py
+@Description: 合并修改、延迟保存
+
+界面上的增删改只修改内存并调用 mark_dirty()，不直接写盘。停止修改 quiet_ms
+毫秒后，或第一次修改后最多 max_delay_ms 毫秒，在后台线程中把所有累积的修改
+作为一次提交写入。关闭窗口和锁定前调用 flush() 同步写完。
+"""
+
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+
+from ui.workers import TaskRunner
+
+STATE_CLEAN = "clean"
+STATE_PENDING = "pending"
+STATE_SAVING = "saving"
+STATE_FAILED = "failed"
+
+
+class AutosaveScheduler(QObject):
+    stateChanged = pyqtSignal(str)
+    failed = pyqtSignal(object)
+
+    def __init__(self, storage, quiet_ms=1000, max_delay_ms=5000, parent=None):
+        super().__init__(parent)
+        self.storage = storage
+        self.state = STATE_CLEAN
+        # 自动保存不占用状态栏的忙碌提示
+        self.runner = TaskRunner(self)
+        self._dirty = False
+        self._saving = False
+
+        self._quiet_timer = QTimer(self)
+        self._quiet_timer.setSingleShot(True)
+        self._quiet_timer.setInterval(quiet_ms)
+        self._quiet_timer.timeout.connect(self._flush_async)
+
+        self._deadline_timer = QTimer(self)
+        self._deadline_timer.setSingleShot(True)
+        self._deadline_timer.setInterval(max_delay_ms)
+        self._deadline_timer.timeout.connect(self._flush_async)
+
+    @property
+    def pending(self) -> bool:
+        """还有修改没有写入磁盘"""
+        return self._dirty or self._saving
+
+    def mark_dirty(self):
+        """内存中的数据已修改（调用方应已持有 storage.lock 完成修改）"""
+        if self.storage.session is not None:
+            self.storage.session.mark_dirty()
+        self._dirty = True
+        self._quiet_timer.start()
+        if not self._deadline_timer.isActive():
+            self._deadline_timer.start()
+        if not self._saving:
+            self._set_state(STATE_PENDING)
+
+    def flush(self):
+        """同步写入所有未保存的修改（关闭窗口、锁定前调用），失败时抛出异常"""
+        self._quiet_timer.stop()
+        self._deadline_timer.stop()
+        self.runner.wait()
+        if self._dirty:
+            self._dirty = False
+            try:
+                self.storage.flush()
+            except Exception:
+                self._dirty = True
+                self._set_state(STATE_FAILED)
+                raise
+        self._set_state(STATE_CLEAN)
+
+    def discard(self):
+        """放弃还没有写盘的修改（保险库已无法按当前密钥写入时）"""
+        self._quiet_timer.stop()
+        self._deadline_timer.stop()
+        self.runner.wait()
+        self._dirty = False
+        self._set_state(STATE_CLEAN)
+
+    def _flush_async(self):
+        self._quiet_timer.stop()
+        self._deadline_timer.stop()
+        if not self._dirty or self._saving:
+            # 正在保存时新的修改由 _on_saved 接着处理
+            return
+        self._dirty = False
+        self._saving = True
+        self._set_state(STATE_SAVING)
+        self.runner.submit(self.storage.flush, on_done=self._on_saved, on_error=self._on_failed)
+
+    def _on_saved(self, _):
+        self._saving = False
+        if not self._dirty:
+            self._set_state(STATE_CLEAN)
+            return
+        self._set_state(STATE_PENDING)
+        # 保存期间又有修改；计时器已经到期的话立即再保存一次
+        if not self._quiet_timer.isActive():
+            self._flush_async()
+
+    def _on_failed(self, error):
+        self._saving = False
+        self._dirty = True
+        self._set_state(STATE_FAILED)
+        self.failed.emit(error)
+
+    def _set_state(self, state):
+        if state != self.state:
+            self.state = state
+            self.stateChanged.emit(state)
@@ -9,36 +9,41 @@ from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QIcon
 from PyQt6.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QLineEdit, QPushButton, QLabel,
-    QGraphicsDropShadowEffect, QMessageBox
+    QGraphicsDropShadowEffect, QMessageBox, QProgressBar
 )
 
+from ui.workers import TaskRunner
 
-# 加载并应用样式表
-def load_stylesheet():
-    try:
-        with open("../resources/qss/main.qss", "r", encoding="utf-8") as style_file:
-            return style_file.read()
-    except FileNotFoundError:
-        # print("样式表文件未找到！")
-        return ""  # 如果找不到样式表，返回空样式
 
 class LoginDialog(QDialog):
-    def __init__(self, mode, crypto, parent=None):
+    def __init__(self, mode, crypto, parent=None, task=None):
+        """
+        task(password, progress) 在后台线程执行（解锁或创建保险库），
+        返回 True 时对话框才关闭，期间界面保持响应并显示进度。
+        mode 为 'change' 时输入原密码和新密码，task 的参数为 (原密码, 新密码, progress)。
+        """
         super().__init__(parent)
 
-        self.setWindowTitle("设置主密码" if mode == 'setup' else "登录")
+        self.setWindowTitle({'setup': "设置主密码", 'change': "修改主密码"}.get(mode, "登录"))
         self.setWindowIcon(QIcon("icons/lock_icon.png"))
 
         self.crypto = crypto
         self.mode = mode
+        self.task = task
+        self.runner = TaskRunner(self)
+        self.runner.progress.connect(self._on_progress)
 
-        # 使用加载的样式
-        self.setStyleSheet(load_stylesheet())
+        # 原密码输入框（修改主密码时）
+        self.old_password_input = QLineEdit(self)
+        self.old_password_input.setEchoMode(QLineEdit.EchoMode.Password)
+        self.old_password_input.setPlaceholderText("请输入原密码")
+        self.old_password_input.setMinimumWidth(250)
+        self.old_password_input.setVisible(self.mode == 'change')
 
         # 密码输入框
         self.password_input = QLineEdit(self)
         self.password_input.setEchoMode(QLineEdit.EchoMode.Password)
-        self.password_input.setPlaceholderText("请输入密码")
+        self.password_input.setPlaceholderText("请输入新密码" if mode == 'change' else "请输入密码")
         self.password_input.setMinimumWidth(250)  # 设置最小宽度
 
         # 确认密码输入框
@@ -46,7 +51,7 @@ class LoginDialog(QDialog):
         self.confirm_password_input.setEchoMode(QLineEdit.EchoMode.Password)
         self.confirm_password_input.setPlaceholderText("请确认密码")
         self.confirm_password_input.setMinimumWidth(250)  # 设置最小宽度
-        self.confirm_password_input.setVisible(self.mode == 'setup')
+        self.confirm_password_input.setVisible(self.mode in ('setup', 'change'))
 
         # 眼睛按钮，切换密码可见性
         self.show_eye_button = QPushButton("👁️", self)
@@ -66,7 +71,7 @@ class LoginDialog(QDialog):
         layout = QVBoxLayout(self)
 
         # 标题
-        title = QLabel(f"请输入{'设置' if mode == 'setup' else '登录'}密码", self)
+        title = QLabel({'setup': "请输入设置密码", 'change': "请输入原密码和新密码"}.get(mode, "请输入登录密码"), self)
         title.setAlignment(Qt.AlignmentFlag.AlignCenter)
 
         # 提示文字
@@ -75,6 +80,8 @@ class LoginDialog(QDialog):
 
         layout.addWidget(tip)
         layout.addWidget(title)
+        if self.mode == 'change':
+            layout.addWidget(self.old_password_input)
 
         # 密码输入框和眼睛按钮布局
         pass_layout = QHBoxLayout()
@@ -83,32 +90,41 @@ class LoginDialog(QDialog):
 
         layout.addLayout(pass_layout)
 
-        # 如果是首次设置密码，添加确认密码输入框
-        if self.mode == 'setup':
+        # 首次设置或修改密码时，添加确认密码输入框
+        if self.mode in ('setup', 'change'):
             confirm_layout = QHBoxLayout()
             confirm_layout.addWidget(self.confirm_password_input)
             confirm_layout.addWidget(self.show_eye_button)
 
             layout.addLayout(confirm_layout)
 
+        # 后台任务进度
+        self.status_label = QLabel("", self)
+        self.status_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.progress_bar = QProgressBar(self)
+        self.progress_bar.setTextVisible(False)
+        self.progress_bar.setVisible(False)
+        layout.addWidget(self.status_label)
+        layout.addWidget(self.progress_bar)
+
         # 按钮布局
         btns = QHBoxLayout()
         btns.addWidget(self.cancel_button)
         btns.addWidget(self.confirm_button)
 
         layout.addLayout(btns)
-        self.setFixedSize(400, 300)
+        self.setFixedSize(400, 340 if self.mode == 'change' else 300)
 
         # 设置阴影效果
         self.setGraphicsEffect(self.create_shadow_effect())  # 使用阴影效果
 
     def toggle_password_visibility(self):
         if self.password_input.echoMode() == QLineEdit.EchoMode.Password:
-            self.password_input.setEchoMode(QLineEdit.EchoMode.Normal)
-            self.confirm_password_input.setEchoMode(QLineEdit.EchoMode.Normal)
+            mode = QLineEdit.EchoMode.Normal
         else:
-            self.password_input.setEchoMode(QLineEdit.EchoMode.Password)
-            self.confirm_password_input.setEchoMode(QLineEdit.EchoMode.Password)
+            mode = QLineEdit.EchoMode.Password
+        for field in (self.old_password_input, self.password_input, self.confirm_password_input):
+            field.setEchoMode(mode)
 
     def create_shadow_effect(self):
         shadow = QGraphicsDropShadowEffect()
@@ -125,8 +141,65 @@ class LoginDialog(QDialog):
             QMessageBox.warning(self, "错误", "密码不能为空")
             return
 
-        if self.mode == 'setup' and password != confirm:
+        if self.mode in ('setup', 'change') and password != confirm:
             QMessageBox.warning(self, "错误", "两次输入的密码不一致")
             return
 
-        super().accept()
+        args = (password,)
+        if self.mode == 'change':
+            old_password = self.old_password_input.text()
+            if not old_password:
+                QMessageBox.warning(self, "错误", "请输入原密码")
+                return
+            if old_password == password:
+                QMessageBox.warning(self, "错误", "新密码不能与原密码相同")
+                return
+            args = (old_password, password)
+
+        if self.task is None:
+            super().accept()
+            return
+
+        self._set_busy(True)
+        self.runner.submit(
+            self.task, *args,
+            on_done=self._on_task_done,
+            on_error=self._on_task_failed,
+            with_progress=True
+        )
+
+    def reject(self):
+        # 后台任务进行中不允许关闭
+        if not self.runner.busy:
+            super().reject()
+
+    def _set_busy(self, busy):
+        self.old_password_input.setEnabled(not busy)
+        self.password_input.setEnabled(not busy)
+        self.confirm_password_input.setEnabled(not busy)
+        self.confirm_button.setEnabled(not busy)
+        self.cancel_button.setEnabled(not busy)
+        message = {'setup': "正在创建保险库...", 'change': "正在重新加密..."}.get(self.mode, "正在解锁...")
+        self.status_label.setText(message if busy else "")
+        # 没有收到进度前显示为忙碌状态
+        self.progress_bar.setRange(0, 0)
+        self.progress_bar.setVisible(busy)
+
+    def _on_progress(self, done, total):
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(done)
+
+    def _on_task_done(self, ok):
+        self._set_busy(False)
+        if ok:
+            super().accept()
+        else:
+            QMessageBox.warning(self, "错误", "原密码不正确。" if self.mode == 'change' else "密码不正确。")
+            field = self.old_password_input if self.mode == 'change' else self.password_input
+            field.selectAll()
+            field.setFocus()
+
+    def _on_task_failed(self, error):
+        self._set_busy(False)
+        action = "修改主密码失败" if self.mode == 'change' else "验证失败"
+        QMessageBox.critical(self, "错误", f"{action}: {str(error)}")
@@ -6,16 +6,28 @@
 """
 
 import os
+import time
 
-from PyQt6.QtCore import Qt
-from PyQt6.QtGui import QAction
+from PyQt6.QtCore import Qt, QFileSystemWatcher, QTimer
+from PyQt6.QtGui import QAction, QGuiApplication
 from PyQt6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QSplitter, QTreeView, QTableView, QHeaderView,
-    QLineEdit, QPushButton, QMessageBox, QFileDialog, QDialog
+    QSplitter, QTreeView,
+    QLineEdit, QPushButton, QMessageBox, QFileDialog, QDialog, QLabel, QProgressBar,
+    QMenu, QInputDialog
 )
 
-from core.models import PasswordTableModel, CategoryTreeModel
+from core.category_index import CategoryIndex
+from core.models import PasswordTableModel, PasswordFilterProxyModel, CategoryTreeModel
+from core.record import PasswordRecord
+from core.repository import PasswordRepository, new_entry_id
+from core.search_index import SearchIndex
+from core.secure_storage import VaultChangedError, VaultKeyChangedError
+from ui.autosave import STATE_FAILED, STATE_PENDING, STATE_SAVING, AutosaveScheduler
+from ui.widgets.password_table import PasswordTableView
+from ui.workers import TaskRunner
+from utils import trace, transfer
+from utils.metrics import LatencyHistogram
 
 
 class MainWindow(QMainWindow):
@@ -24,6 +36,41 @@ class MainWindow(QMainWindow):
         self.storage = storage
         self.config = config
         self.current_category_id = None
+        # 解锁后建立一次搜索索引，之后随增删改增量维护；键为条目 ID
+        self.search_index = SearchIndex()
+        self._indexed_data = None
+        # 当前搜索结果（None 表示不过滤）及对应的查询，用于输入延长时在结果内继续缩小
+        self._search_matches = None
+        self._last_query = ""
+        # 每发起一次查询加一，旧查询据此自行取消或丢弃结果
+        self._search_generation = 0
+        # 解锁期间托管的本地代理（见 _update_agent）
+        self.agent = None
+        self.search_latency = LatencyHistogram()
+        self.runner = TaskRunner(self)
+        # 搜索不显示在状态栏的忙碌提示中
+        self.search_runner = TaskRunner(self)
+        # 修改只改内存，由自动保存合并后在后台写盘
+        self.autosave = AutosaveScheduler(storage, config.autosave_quiet_ms, config.autosave_max_delay_ms, self)
+        # 定期清除过期的已解密密码，即使用户不再操作也不会一直留在内存中
+        self.secret_timer = QTimer(self)
+        self.secret_timer.setInterval(10_000)
+        self.secret_timer.timeout.connect(self.storage.secret_cache.purge)
+        self.secret_timer.start()
+        # 其他程序（命令行、另一个窗口）提交的修改：监视保险库文件，停顿片刻后在后台读取，
+        # 只把变化的条目并入界面。存储层不再自动同步，写入前发现过期时由界面先合并
+        storage.auto_sync = False
+        self.sync_runner = TaskRunner(self)
+        self._syncing = False
+        self._sync_again = False
+        self.sync_timer = QTimer(self)
+        self.sync_timer.setSingleShot(True)
+        self.sync_timer.setInterval(200)
+        self.sync_timer.timeout.connect(self._start_sync)
+        self.vault_watcher = QFileSystemWatcher(self)
+        self.vault_watcher.directoryChanged.connect(self._on_vault_files_changed)
+        self.vault_watcher.fileChanged.connect(self._on_vault_files_changed)
+        self._watch_vault_files()
 
         self.setWindowTitle("密码管理器")
         self.setGeometry(100, 100, 1000, 600)
@@ -34,7 +81,7 @@ class MainWindow(QMainWindow):
         self._load_data()
         self._connect_signals()
 
-        print("主窗口初始化完成")
+        trace.log("主窗口初始化完成")
 
     def _setup_ui(self):
         central_widget = QWidget()
@@ -46,6 +93,10 @@ class MainWindow(QMainWindow):
         self.search_input.setPlaceholderText("搜索...")
         search_button = QPushButton("搜索")
         search_button.clicked.connect(self._on_search)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(self.config.search_debounce_ms)
+        self.search_timer.timeout.connect(self._start_search)
         search_layout.addWidget(self.search_input)
         search_layout.addWidget(search_button)
 
@@ -53,11 +104,17 @@ class MainWindow(QMainWindow):
         self.category_tree = QTreeView()
         self.category_tree.setHeaderHidden(True)
         self.category_tree.setSelectionBehavior(QTreeView.SelectionBehavior.SelectRows)
+        self.category_tree.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        self.category_index = None
+        self.category_model = None
         splitter.addWidget(self.category_tree)
 
-        self.password_table = QTableView()
-        self.password_table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
-        self.password_table.setSelectionMode(QTableView.SelectionMode.SingleSelection)
+        # 表格始终显示同一个代理模型，过滤和排序都不会重置视图
+        self.repository = None
+        self.password_model = None
+        self.password_proxy = PasswordFilterProxyModel(self)
+        self.password_table = PasswordTableView()
+        self.password_table.setModel(self.password_proxy)
         splitter.addWidget(self.password_table)
         splitter.setSizes([200, 600])
 
@@ -74,8 +131,68 @@ class MainWindow(QMainWindow):
         main_layout.addLayout(toolbar_layout)
 
         self._create_menu_bar()
+        self._setup_status_bar()
+
+    def _setup_status_bar(self):
+        self.busy_label = QLabel()
+        self.busy_bar = QProgressBar()
+        self.busy_bar.setMaximumWidth(120)
+        self.busy_bar.setTextVisible(False)
+        self.busy_bar.setVisible(False)
+        # 调试模式下显示搜索延迟分布
+        self.latency_label = QLabel()
+        self.latency_label.setVisible(self.config.debug)
+        # 调试模式下显示最近几次操作的耗时（utils/trace.py），悬停查看更多
+        self.trace_label = QLabel()
+        self.trace_label.setVisible(self.config.debug and trace.enabled())
+        if self.trace_label.isVisible():
+            self.trace_timer = QTimer(self)
+            self.trace_timer.setInterval(1000)
+            self.trace_timer.timeout.connect(self._update_trace_overlay)
+            self.trace_timer.start()
+        # 自动保存状态：有未保存的修改 / 正在保存 / 保存失败
+        self.save_label = QLabel()
+        self.statusBar().addPermanentWidget(self.trace_label)
+        self.statusBar().addPermanentWidget(self.latency_label)
+        self.statusBar().addPermanentWidget(self.save_label)
+        self.statusBar().addPermanentWidget(self.busy_label)
+        self.statusBar().addPermanentWidget(self.busy_bar)
+        self.runner.busyChanged.connect(self._on_busy_changed)
+        self.autosave.stateChanged.connect(self._on_autosave_state)
+        self.autosave.failed.connect(self._on_save_failed)
+        self.runner.progress.connect(self._on_progress)
         self.statusBar().showMessage("就绪")
 
+    def _update_trace_overlay(self):
+        recent, counters = trace.tracer.snapshot()
+        shown = recent[-self.config.trace_overlay_size:]
+        self.trace_label.setText("  ".join(f"{name} {ms:.1f}ms" for name, ms, _ in reversed(shown)))
+        lines = [f"{name:<12} {ms:9.1f} ms  {thread}" for name, ms, thread in reversed(recent)]
+        lines += [f"{name}: {value}" for name, value in sorted(counters.items())]
+        self.trace_label.setToolTip("\n".join(lines))
+
+    def _on_export_trace(self):
+        path, _ = QFileDialog.getSaveFileName(
+            self, "导出性能跟踪", os.path.expanduser("~/password-manager-trace.json"), "Chrome 跟踪 (*.json)"
+        )
+        if not path:
+            return
+        try:
+            trace.tracer.export(path)
+        except OSError as e:
+            QMessageBox.critical(self, "错误", f"导出失败: {str(e)}")
+            return
+        self.statusBar().showMessage(f"性能跟踪已导出到 {path}，可在 chrome://tracing 中打开", 5000)
+
+    def _on_busy_changed(self, busy, message):
+        self.busy_label.setText(message if busy else "")
+        self.busy_bar.setRange(0, 0)
+        self.busy_bar.setVisible(busy)
+
+    def _on_progress(self, done, total):
+        self.busy_bar.setRange(0, total)
+        self.busy_bar.setValue(done)
+
     def _create_menu_bar(self):
         menubar = self.menuBar()
 
@@ -89,6 +206,11 @@ class MainWindow(QMainWindow):
         file_menu.addAction(import_action)
 
         file_menu.addSeparator()
+        lock_action = QAction("锁定", self)
+        lock_action.setShortcut("Ctrl+L")
+        lock_action.triggered.connect(lambda: self._on_lock())
+        file_menu.addAction(lock_action)
+
         exit_action = QAction("退出", self)
         exit_action.triggered.connect(self.close)
         file_menu.addAction(exit_action)
@@ -106,44 +228,207 @@ class MainWindow(QMainWindow):
         delete_action.triggered.connect(self._on_delete)
         edit_menu.addAction(delete_action)
 
+        copy_action = QAction("复制密码", self)
+        copy_action.triggered.connect(self._on_copy_password)
+        edit_menu.addAction(copy_action)
+
         settings_menu = menubar.addMenu("设置")
         change_pw_action = QAction("修改主密码", self)
         change_pw_action.triggered.connect(self._on_change_password)
         settings_menu.addAction(change_pw_action)
 
+        if trace.enabled():
+            settings_menu.addSeparator()
+            export_trace_action = QAction("导出性能跟踪...", self)
+            export_trace_action.triggered.connect(self._on_export_trace)
+            settings_menu.addAction(export_trace_action)
+
     def _load_data(self):
-        data = self.storage.load_data()
-        self.category_model = CategoryTreeModel(data.get("categories", []))
-        self.category_tree.setModel(self.category_model)
-        self.category_tree.expandAll()
         self._load_password_data()
 
-    def _load_password_data(self, search_term=None):
-        data = self.storage.load_data()
-        passwords = data.get("passwords", [])
-
-        if search_term:
-            search_term = search_term.lower()
-            passwords = [
-                p for p in passwords
-                if any(search_term in p.get(field, '').lower() for field in ['name', 'url', 'username', 'notes'])
-            ]
-
-        if self.current_category_id:
-            passwords = [p for p in passwords if p.get('category_id') == self.current_category_id]
-
-        self.password_model = PasswordTableModel(passwords, data.get("categories", []))
-        self.password_table.setModel(self.password_model)
+    def _ensure_indexes(self, data):
+        # 会话重新加载后条目对象都换了，需要重建仓库、索引和各个模型
+        if data is not self._indexed_data:
+            with trace.span("重建模型", "view", entries=len(data.get("passwords", []))):
+                self.repository = PasswordRepository(data.setdefault("passwords", []))
+                self.category_index = CategoryIndex(data.setdefault("categories", []))
+                self.search_index.rebuild((p.id, p) for p in self.repository.passwords)
+                self.password_model = PasswordTableModel(self.repository, self.category_index)
+                self.password_proxy.setSourceModel(self.password_model)
+                if self.category_model is None:
+                    self.category_model = CategoryTreeModel(self.category_index, self._category_count)
+                    self.category_tree.setModel(self.category_model)
+                else:
+                    self.category_model.reset(self.category_index)
+                self.category_tree.expandAll()
+            if self.current_category_id not in self.category_index:
+                self.current_category_id = None
+            self._indexed_data = data
+            self._update_agent()
+
+    def _update_agent(self):
+        """
+        托管本地代理（配置 agent_enabled），让脚本在界面解锁期间直接查询。
+        代理与界面共用仓库和索引，处理每个请求时持有存储锁，界面的修改同样在锁内完成；
+        数据重新加载后换上新的，代理空闲超时退出后重新启动。
+        """
+        if not self.config.agent_enabled or self.repository is None:
+            return
+        from core.agent import AGENT_SUPPORTED, AgentServer
+        from core.commands import VaultCommands
+        if not AGENT_SUPPORTED:
+            return
+        commands = VaultCommands(self.storage, self.repository, self.category_index, self.search_index)
+        if self.agent is not None and self.agent.running:
+            self.agent.commands = commands
+        else:
+            self.agent = AgentServer(commands, self.config.agent_socket_path, self.config.agent_idle_timeout)
+            self.agent.start_in_thread()
+
+    def _stop_agent(self):
+        if self.agent is not None:
+            self.agent.stop(wait=True)
+            self.agent = None
+
+    def _watch_vault_files(self):
+        # 原子替换和删除会让文件失去监视，每次变化后重新加上；监视目录才能发现新建的日志
+        paths = [os.fspath(p) for p in (os.path.dirname(self.config.data_path), *self.storage.watched_paths())]
+        watching = set(self.vault_watcher.files()) | set(self.vault_watcher.directories())
+        missing = [p for p in paths if p not in watching and os.path.exists(p)]
+        if missing:
+            self.vault_watcher.addPaths(missing)
+
+    def _on_vault_files_changed(self, _path):
+        self._watch_vault_files()
+        if self.storage.session is not None:
+            self.sync_timer.start()
+
+    def _start_sync(self):
+        if self.storage.session is None or self.repository is None:
+            return
+        if self._syncing or self.runner.busy:
+            # 导入、恢复等任务结束后再读取
+            self._sync_again = True
+            if not self._syncing:
+                self.sync_timer.start()
+            return
+        self._syncing = True
+        self.sync_runner.submit(self.storage.read_external,
+                                on_done=self._on_external_read, on_error=self._on_sync_failed)
 
-        header = self.password_table.horizontalHeader()
-        header.setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
-        header.setStretchLastSection(True)
+    def _on_external_read(self, state):
+        self._syncing = False
+        if state is not None and self.storage.session is not None and self.repository is not None:
+            try:
+                self._merge_external(state)
+            except VaultChangedError:
+                # 读取之后本窗口又保存过，基准变了，重新读取
+                self._sync_again = True
+        if self._sync_again:
+            self._sync_again = False
+            self.sync_timer.start()
+
+    def _on_sync_failed(self, error):
+        self._syncing = False
+        if isinstance(error, VaultKeyChangedError):
+            QMessageBox.warning(self, "需要重新解锁", f"{str(error)}\n本窗口未保存的修改无法写入，将被放弃。")
+            self._on_lock(save=False)
+            return
+        trace.log(f"读取其他程序的修改失败: {str(error)}", "同步")
+
+    def _sync_now(self):
+        """同步读取并并入其他程序的修改（写盘前发现保险库过期时）"""
+        self.sync_runner.wait()
+        state = self.storage.read_external()
+        if state is not None:
+            self._merge_external(state)
+
+    def _merge_external(self, state):
+        result = self.storage.apply_external(state, self._apply_external_changes, lookup=self.repository.get)
+        if not result:
+            return
+        if result.meta is not None:
+            self.category_model.reset(self.category_index)
+            self.category_tree.expandAll()
+            if self.current_category_id not in self.category_index:
+                self.current_category_id = None
+            self.password_model.categories_changed()
+            self._update_agent()
+        else:
+            self.category_model.refresh_counts()
+        self._refresh_search()
+        if self.storage.session.dirty:
+            # 本地还有未保存的修改（或生成了冲突副本），交给自动保存提交合并结果
+            self.autosave.mark_dirty()
+
+        message = f"已同步其他程序的修改：更新 {len(result.puts)} 条，删除 {len(result.deletes)} 条"
+        self.statusBar().showMessage(message, 5000)
+        if result.conflicts:
+            names = "、".join(ours.name for ours, _ in result.conflicts[:5])
+            QMessageBox.warning(
+                self, "修改冲突",
+                f"{len(result.conflicts)} 个条目（{names}）在其他程序中也被修改过。\n"
+                f"已保留本窗口的版本，对方的版本另存为“（冲突副本）”条目。"
+            )
+
+    def _apply_external_changes(self, result):
+        """在持有存储锁时把合并结果应用到仓库和各个模型上，只动变化的条目"""
+        data = self._indexed_data
+        if result.meta is not None:
+            for key in [k for k in data if k != "passwords"]:
+                del data[key]
+            data.update(result.meta)
+            self.category_index = CategoryIndex(data.setdefault("categories", []))
+            self.password_model.category_index = self.category_index
+        for entry_id in result.deletes:
+            if entry_id in self.repository:
+                self.password_model.remove_entry(entry_id)
+                self.search_index.remove(entry_id)
+        for entry in result.puts:
+            if entry.id in self.repository:
+                self.search_index.update(entry.id, entry)
+            else:
+                self.search_index.add(entry.id, entry)
+            self.password_model.put_entry(entry)
+
+    def _save_now(self):
+        """同步写入所有修改，失败时抛出异常；其他程序先提交过时并入它们的修改后重试"""
+        for _ in range(3):
+            try:
+                self.autosave.flush()
+                return
+            except VaultChangedError:
+                self._sync_now()
+        self.autosave.flush()
+
+    def _category_count(self, category_id):
+        """分类（含子分类）中的条目数，None 表示全部条目"""
+        if self.repository is None:
+            return 0
+        if category_id is None:
+            return len(self.repository)
+        return sum(len(self.repository.ids_in_category(c)) for c in self.category_index.subtree(category_id))
+
+    def _load_password_data(self):
+        """按当前分类和搜索结果更新过滤条件"""
+        self._ensure_indexes(self.storage.load_data())
+        self.password_proxy.set_filter(self.current_category_id, self._search_matches)
+
+    def _selected_entry_id(self):
+        """当前选中条目的 ID，未选中返回 None"""
+        selected = self.password_table.selectionModel().selectedRows()
+        if not selected:
+            return None
+        return self.password_model.entry_id_at(self.password_proxy.mapToSource(selected[0]).row())
 
     def _connect_signals(self):
         self.add_button.clicked.connect(self._on_add)
         self.edit_button.clicked.connect(self._on_edit)
         self.delete_button.clicked.connect(self._on_delete)
         self.category_tree.selectionModel().selectionChanged.connect(self._on_category_selected)
+        self.category_tree.customContextMenuRequested.connect(self._on_category_menu)
+        self.search_input.textChanged.connect(self._on_search_text_changed)
+        self.search_input.returnPressed.connect(self._on_search)
         self.password_table.doubleClicked.connect(self._on_edit)
 
     def _on_category_selected(self):
@@ -153,9 +438,151 @@ class MainWindow(QMainWindow):
             self._load_password_data()
             self.statusBar().showMessage(f"已选择分类: {selected.data()}", 3000)
 
+    def _on_category_menu(self, pos):
+        index = self.category_tree.indexAt(pos)
+        category_id = index.data(Qt.ItemDataRole.UserRole) if index.isValid() else None
+
+        menu = QMenu(self)
+        menu.addAction("新建分类", lambda: self._on_add_category(None))
+        if category_id is not None:
+            menu.addAction("新建子分类", lambda: self._on_add_category(category_id))
+            menu.addAction("重命名", lambda: self._on_rename_category(category_id))
+            menu.addAction("移动到...", lambda: self._on_move_category(category_id))
+            menu.addSeparator()
+            menu.addAction("删除分类", lambda: self._on_delete_category(category_id))
+        menu.exec(self.category_tree.viewport().mapToGlobal(pos))
+
+    def _on_add_category(self, parent_id):
+        name, ok = QInputDialog.getText(self, "新建分类", "分类名称:")
+        if not ok or not name.strip():
+            return
+        with self.storage.lock:
+            cat = self.category_index.add(name.strip(), parent_id)
+        item = self.category_model.add_category(cat['id'])
+        self.category_tree.expand(item.parent().index() if item.parent() else item.index())
+        self._mark_changed("分类已添加")
+
+    def _on_rename_category(self, category_id):
+        name, ok = QInputDialog.getText(self, "重命名分类", "分类名称:", text=self.category_index.name(category_id))
+        if not ok or not name.strip():
+            return
+        with self.storage.lock:
+            self.category_index.rename(category_id, name.strip())
+        self.category_model.rename_category(category_id)
+        self.password_model.categories_changed()
+        self._mark_changed("分类已重命名")
+
+    def _on_move_category(self, category_id):
+        # 只能移到自身子树以外的分类下
+        targets = [("（顶层）", None)] + [
+            (cat['name'], cat['id']) for cat in self.category_index.categories
+            if not self.category_index.in_subtree(cat['id'], category_id)
+        ]
+        label, ok = QInputDialog.getItem(self, "移动分类", "移动到:", [t[0] for t in targets], 0, False)
+        if not ok:
+            return
+        parent_id = next(t[1] for t in targets if t[0] == label)
+        old_parent_id = self.category_index.parent(category_id)
+        if parent_id == old_parent_id:
+            return
+
+        with self.storage.lock:
+            self.category_index.move(category_id, parent_id)
+        self.category_model.move_category(category_id, old_parent_id)
+        self.category_tree.expandAll()
+        self.password_proxy.refresh()
+        self._mark_changed("分类已移动")
+
+    def _on_delete_category(self, category_id):
+        entry_ids = list(self.repository.ids_in_category(category_id))
+        message = f"确定要删除分类 '{self.category_index.name(category_id)}' 吗？"
+        if entry_ids:
+            message += f"\n其中的 {len(entry_ids)} 个条目将移到上级分类。"
+        reply = QMessageBox.question(self, "确认删除", message,
+                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+
+        child_ids = self.category_index.children(category_id)
+        with self.storage.lock:
+            parent_id = self.category_index.remove(category_id)
+            for entry_id in entry_ids:
+                self.password_model.put_entry(self.repository.get(entry_id).replace(category_id=parent_id))
+        self.category_model.remove_category(category_id, parent_id, child_ids)
+        self.password_model.categories_changed()
+        if self.current_category_id == category_id:
+            # 选中的分类没了，改为选中它的上级
+            self.category_tree.setCurrentIndex(self.category_model.item_for(parent_id).index())
+        self.password_proxy.refresh()
+        self._mark_changed("分类已删除")
+
+    def _on_search_text_changed(self, _):
+        # 输入停顿后才真正查询
+        self.search_timer.start()
+
     def _on_search(self):
-        search_term = self.search_input.text().strip()
-        self._load_password_data(search_term)
+        self.search_timer.stop()
+        self._start_search()
+
+    def _refresh_search(self):
+        """数据变化后旧结果不再可靠，按当前关键字完整重查"""
+        self._last_query = ""
+        self._start_search()
+
+    def _start_search(self):
+        query = self.search_input.text().strip()
+        self._search_generation += 1
+        generation = self._search_generation
+
+        if not query:
+            self._search_matches = None
+            self._last_query = ""
+            self._load_password_data()
+            return
+
+        # 在上一次输入的基础上继续输入时，结果只会更少
+        candidates = None
+        if self._last_query and self._search_matches is not None and query.startswith(self._last_query):
+            candidates = self._search_matches
+
+        self._ensure_indexes(self.storage.load_data())
+        started = time.perf_counter()
+        self.search_runner.submit(
+            self.search_index.search, query, candidates,
+            cancelled=lambda: generation != self._search_generation,
+            on_done=lambda result: self._on_search_done(generation, query, result, started)
+        )
+
+    def _on_search_done(self, generation, query, result, started):
+        if generation != self._search_generation or result is None:
+            return
+        self._search_matches = result
+        self._last_query = query
+        self._load_password_data()
+
+        self.search_latency.record((time.perf_counter() - started) * 1000)
+        if self.config.debug:
+            self.latency_label.setText(f"搜索 {self.search_latency.summary()}")
+
+    def _mark_changed(self, message):
+        """内存中的数据已修改，交给自动保存写盘"""
+        self.autosave.mark_dirty()
+        self.statusBar().showMessage(message, 3000)
+
+    def _on_autosave_state(self, state):
+        self.save_label.setText({
+            STATE_PENDING: "● 有未保存的修改",
+            STATE_SAVING: "正在保存...",
+            STATE_FAILED: "保存失败",
+        }.get(state, ""))
+
+    def _on_save_failed(self, error):
+        if isinstance(error, VaultChangedError):
+            # 其他程序先提交了修改，并入之后自动保存会重新提交
+            self.sync_timer.stop()
+            self._start_sync()
+            return
+        QMessageBox.critical(self, "错误", f"保存失败: {str(error)}")
 
     def _on_add(self):
         from ui.dialogs.password import PasswordDialog
@@ -163,38 +590,40 @@ class MainWindow(QMainWindow):
 
         if dialog.exec() == QDialog.DialogCode.Accepted:
             entry = dialog.get_entry_data()
-            encrypted = self.storage.encrypt_data({
-                'password': entry['password']
-            })
-
-            new_entry = {
-                'name': entry['name'],
-                'url': entry['url'],
-                'username': entry['username'],
-                'encrypted_password': encrypted,
-                'notes': entry['notes'],
-                'category_id': entry['category_id']
-            }
+            entry_id = new_entry_id()
+            encrypted = self.storage.encrypt_secret(entry_id, entry['password'])
+
+            new_entry = PasswordRecord(
+                id=entry_id,
+                name=entry['name'],
+                url=entry['url'],
+                username=entry['username'],
+                encrypted_password=encrypted,
+                notes=entry['notes'],
+                category_id=entry['category_id']
+            )
 
             data = self.storage.load_data()
-            data.setdefault("passwords", []).append(new_entry)
-            self.storage.save_data(data)
-            self._load_password_data()
-            self.statusBar().showMessage("添加成功", 3000)
+            self._ensure_indexes(data)
+            # 后台保存可能正在读取同一份数据，修改时持有存储锁
+            with self.storage.lock:
+                self.password_model.put_entry(new_entry)
+            self.search_index.add(entry_id, new_entry)
+            self.category_model.refresh_counts([new_entry.category_id])
+            self._mark_changed("添加成功")
+            self._refresh_search()
 
     def _on_edit(self):
-        selected = self.password_table.selectionModel().selectedRows()
-        if not selected:
+        entry_id = self._selected_entry_id()
+        if entry_id is None:
             QMessageBox.warning(self, "警告", "请先选择要编辑的条目")
             return
 
-        row = selected[0].row()
         data = self.storage.load_data()
-        entry = data["passwords"][row]
+        entry = self.repository.get(entry_id)
 
         try:
-            decrypted = self.storage.decrypt_data(entry['encrypted_password'])
-            password = decrypted.get('password', '')
+            password = self.storage.reveal_secret(entry)
         except Exception as e:
             QMessageBox.critical(self, "错误", f"解密失败: {str(e)}")
             return
@@ -204,80 +633,329 @@ class MainWindow(QMainWindow):
             mode='edit',
             categories=data.get("categories", []),
             entry_data={
-                'name': entry['name'],
-                'url': entry['url'],
-                'username': entry['username'],
+                'name': entry.name,
+                'url': entry.url,
+                'username': entry.username,
                 'password': password,
-                'notes': entry.get('notes', ''),
-                'category_id': entry.get('category_id')
+                'notes': entry.notes,
+                'category_id': entry.category_id
             }
         )
 
         if dialog.exec() == QDialog.DialogCode.Accepted:
             updated = dialog.get_entry_data()
+            encrypted = None
             if updated['password'] != password:
-                entry['encrypted_password'] = self.storage.encrypt_data({'password': updated['password']})
-            entry.update({
-                'name': updated['name'],
-                'url': updated['url'],
-                'username': updated['username'],
-                'notes': updated['notes'],
-                'category_id': updated['category_id']
-            })
-
-            self.storage.save_data(data)
-            self._load_password_data()
-            self.statusBar().showMessage("更新成功", 3000)
+                encrypted = self.storage.encrypt_secret(entry_id, updated['password'])
+            old_category_id = entry.category_id
+            entry = entry.replace(
+                name=updated['name'],
+                url=updated['url'],
+                username=updated['username'],
+                notes=updated['notes'],
+                category_id=updated['category_id'],
+                encrypted_password=encrypted or entry.encrypted_password
+            )
+            with self.storage.lock:
+                self.password_model.put_entry(entry)
+            self.search_index.update(entry_id, entry)
+            if encrypted is not None:
+                self.storage.forget_secret(entry_id)
+            if entry.category_id != old_category_id:
+                self.category_model.refresh_counts([old_category_id, entry.category_id])
+
+            self._mark_changed("更新成功")
+            self._refresh_search()
 
     def _on_delete(self):
-        selected = self.password_table.selectionModel().selectedRows()
-        if not selected:
+        entry_id = self._selected_entry_id()
+        if entry_id is None:
             QMessageBox.warning(self, "警告", "请先选择要删除的条目")
             return
 
-        row = selected[0].row()
-        data = self.storage.load_data()
-        entry_name = data["passwords"][row]['name']
+        entry = self.repository.get(entry_id)
+        entry_name = entry.name
 
         reply = QMessageBox.question(self, "确认删除", f"确定要删除 '{entry_name}' 吗？",
                                      QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
         if reply == QMessageBox.StandardButton.Yes:
-            data["passwords"].pop(row)
-            self.storage.save_data(data)
-            self._load_password_data()
-            self.statusBar().showMessage("删除成功", 3000)
+            with self.storage.lock:
+                self.password_model.remove_entry(entry_id)
+            self.search_index.remove(entry_id)
+            self.storage.forget_secret(entry_id)
+            self.category_model.refresh_counts([entry.category_id])
+            self._mark_changed("删除成功")
+            self._refresh_search()
+
+    def _on_copy_password(self):
+        entry_id = self._selected_entry_id()
+        if entry_id is None:
+            QMessageBox.warning(self, "警告", "请先选择要复制的条目")
+            return
+
+        try:
+            password = self.storage.reveal_secret(self.repository.get(entry_id))
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"解密失败: {str(e)}")
+            return
+        QGuiApplication.clipboard().setText(password)
+        self.statusBar().showMessage("密码已复制到剪贴板", 3000)
 
     def _on_export(self):
-        path, _ = QFileDialog.getSaveFileName(self, "导出数据", os.path.expanduser("~/password_backup.dat"), "Data Files (*.dat)")
-        if path:
-            try:
-                import shutil
-                shutil.copy2(self.config.data_path, path)
-                QMessageBox.information(self, "成功", f"数据已导出到: {path}")
-            except Exception as e:
-                QMessageBox.critical(self, "错误", f"导出失败: {str(e)}")
+        path, selected = QFileDialog.getSaveFileName(
+            self, "导出数据", os.path.expanduser("~/passwords.pmx"),
+            "加密导出 (*.pmx);;CSV 明文 (*.csv);;完整备份 (*.dat)"
+        )
+        if not path:
+            return
+        fmt = os.path.splitext(path)[1].lower().lstrip(".")
+        if fmt not in ("pmx", "csv", "dat"):
+            # 没有输入扩展名时按选中的文件类型
+            fmt = next((ext for ext in ("csv", "dat") if f"*.{ext}" in selected), "pmx")
+            path = f"{path}.{fmt}"
+
+        password = None
+        if fmt == "pmx":
+            password = self._ask_transfer_password("设置导出密码", confirm=True)
+            if password is None:
+                return
+        elif fmt == "csv":
+            reply = QMessageBox.warning(self, "明文导出", "CSV 文件中的密码是明文，任何能读取该文件的人都能看到。确定继续吗？",
+                                        QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+            if reply != QMessageBox.StandardButton.Yes:
+                return
+
+        # 先把自动保存队列中的修改写盘，导出的才是最新数据
+        try:
+            self._save_now()
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"保存失败，未导出: {str(e)}")
+            return
+        if fmt == "dat":
+            task, args = self._export_backup, (path,)
+        else:
+            task, args = transfer.export_file, (self.storage, path, fmt, password)
+        self.runner.submit(
+            task, *args,
+            message="正在导出...",
+            on_done=lambda _: QMessageBox.information(self, "成功", f"数据已导出到: {path}"),
+            on_error=lambda e: QMessageBox.critical(self, "错误", f"导出失败: {str(e)}"),
+            with_progress=fmt != "dat"
+        )
+
+    def _export_backup(self, path):
+        import shutil
+        # 先把日志折叠进快照，导出的文件才是完整的
+        self.storage.compact(wait=True)
+        shutil.copy2(self.config.data_path, path)
+
+    def _ask_transfer_password(self, title, confirm=False):
+        """输入导出文件的密码，取消返回 None"""
+        password, ok = QInputDialog.getText(self, title, "密码：", QLineEdit.EchoMode.Password)
+        if not ok:
+            return None
+        if not password:
+            QMessageBox.warning(self, "警告", "密码不能为空")
+            return None
+        if confirm:
+            again, ok = QInputDialog.getText(self, title, "再次输入密码：", QLineEdit.EchoMode.Password)
+            if not ok:
+                return None
+            if again != password:
+                QMessageBox.warning(self, "警告", "两次输入的密码不一致")
+                return None
+        return password
 
     def _on_import(self):
-        path, _ = QFileDialog.getOpenFileName(self, "选择备份文件", os.path.expanduser("~"), "Data Files (*.dat)")
-        if path:
-            reply = QMessageBox.question(self, "确认导入", "导入将覆盖当前所有数据，确定继续吗？",
-                                         QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
-            if reply == QMessageBox.StandardButton.Yes:
-                try:
-                    import shutil
-                    shutil.copy2(path, self.config.data_path)
-                    # reload & reinitialize key
-                    self._load_data()
-                    QMessageBox.information(self, "成功", "数据导入完成")
-                except Exception as e:
-                    QMessageBox.critical(self, "错误", f"导入失败: {str(e)}")
+        path, _ = QFileDialog.getOpenFileName(
+            self, "选择导入文件", os.path.expanduser("~"),
+            "可导入的文件 (*.pmx *.csv *.dat);;加密导出 (*.pmx);;CSV (*.csv);;完整备份 (*.dat)"
+        )
+        if not path:
+            return
+        if path.lower().endswith(".dat"):
+            self._restore_backup(path)
+            return
+
+        try:
+            fmt = transfer.detect_format(path)
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"无法导入: {str(e)}")
+            return
+        password = None
+        if fmt == transfer.NATIVE_FORMAT:
+            password = self._ask_transfer_password("输入导出密码")
+            if password is None:
+                return
+
+        # 导入在后台直接修改仓库，期间禁止界面上的其他修改
+        self._set_editable(False)
+        start = len(self.repository)
+        self.runner.submit(
+            transfer.import_file, self.storage, path, self.repository, self.category_index, fmt, password,
+            message="正在导入...",
+            on_done=lambda result: self._on_merged(start, result),
+            on_error=self._on_import_failed,
+            with_progress=True
+        )
+
+    def _set_editable(self, enabled):
+        self.centralWidget().setEnabled(enabled)
+        self.menuBar().setEnabled(enabled)
+
+    def _on_merged(self, start, result):
+        self._set_editable(True)
+        for entry in self.repository.passwords[start:]:
+            self.search_index.add(entry.id, entry)
+        self.password_model.entries_appended(start)
+        if result.categories_created:
+            self.category_model.reset(self.category_index)
+            self.category_tree.expandAll()
+        else:
+            self.category_model.refresh_counts()
+        self.password_proxy.refresh()
+        if result.added or result.categories_created:
+            self._mark_changed(f"已导入 {result.added} 条")
+        self._refresh_search()
+        QMessageBox.information(
+            self, "导入完成",
+            f"新增 {result.added} 条，跳过重复 {result.duplicates} 条，"
+            f"跳过无账号密码的 {result.skipped} 条，新建分类 {result.categories_created} 个"
+        )
+
+    def _on_import_failed(self, error):
+        # 失败前已追加的条目保留在仓库中，同样需要同步到界面
+        self._set_editable(True)
+        self._indexed_data = None
+        self._load_data()
+        self._refresh_search()
+        if self.storage.session is not None and self.storage.session.dirty:
+            self.autosave.mark_dirty()
+        QMessageBox.critical(self, "错误", f"导入失败: {str(error)}")
+
+    def _restore_backup(self, path):
+        reply = QMessageBox.question(self, "确认恢复", "从备份恢复将覆盖当前所有数据，确定继续吗？",
+                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+        try:
+            # 被覆盖的数据会保留在备份中，先确保它是完整的
+            self.runner.wait()
+            self._save_now()
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"保存失败，未恢复备份: {str(e)}")
+            return
+        self.runner.submit(
+            self.storage.restore_from, path,
+            message="正在恢复...",
+            on_done=self._on_restored,
+            on_error=lambda e: QMessageBox.critical(self, "错误", f"恢复失败: {str(e)}"),
+            with_progress=True
+        )
+
+    def _on_restored(self, _):
+        self._last_query = ""
+        self._search_matches = None
+        self._load_data()
+        self._refresh_search()
+        QMessageBox.information(self, "成功", "数据恢复完成")
 
     def _on_change_password(self):
+        try:
+            # 重新加密前先把排队的修改按旧密钥写盘
+            self.runner.wait()
+            self._save_now()
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"保存失败，无法修改主密码: {str(e)}")
+            return
         from ui.dialogs.login import LoginDialog
-        dialog = LoginDialog(mode='change', crypto=self.storage)
+        dialog = LoginDialog(mode='change', crypto=self.storage, parent=self, task=self._change_master_password)
         if dialog.exec() == QDialog.DialogCode.Accepted:
+            # 重新加密后会话换成了新的数据对象，按新记录重建模型和索引
+            self._load_password_data()
             QMessageBox.information(self, "成功", "主密码已修改")
 
+    def _change_master_password(self, old_password, new_password, progress=None):
+        """在后台线程中执行：校验原密码，再用新密码重新加密整个保险库"""
+        if not self.storage.verify_password(old_password):
+            return False
+        self.storage.rekey(new_password, rotate_secrets=True, progress=progress)
+        return True
+
+    def _on_lock(self, save=True):
+        """
+        保存并清除内存中的数据和密钥，重新输入主密码后才能继续使用。
+        save 为 False 时放弃未保存的修改（主密码已在其他程序中修改，无法再按旧密钥写入）。
+        """
+        self.sync_timer.stop()
+        try:
+            self.runner.wait()
+            if save:
+                self._save_now()
+            else:
+                self.autosave.discard()
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"保存失败，未锁定: {str(e)}")
+            return
+        self._stop_agent()
+        self.storage.close_session(save)
+        self._clear_indexes()
+        self.hide()
+
+        from ui.dialogs.login import LoginDialog
+        dialog = LoginDialog(mode='login', crypto=self.storage, task=self._unlock)
+        if dialog.exec() == QDialog.DialogCode.Accepted:
+            self._load_data()
+            self.show()
+        else:
+            self.close()
+
+    def _unlock(self, password, progress=None):
+        """在后台线程中执行"""
+        if not self.storage.unlock(password, progress):
+            return False
+        self.storage.load_data(progress)
+        return True
+
+    def _clear_indexes(self):
+        """锁定后丢弃界面持有的所有条目和索引"""
+        self.search_timer.stop()
+        self._search_generation += 1
+        self._search_matches = None
+        self._last_query = ""
+        self.search_input.blockSignals(True)
+        self.search_input.clear()
+        self.search_input.blockSignals(False)
+        self.search_index.rebuild([])
+        self.password_proxy.setSourceModel(None)
+        self.repository = None
+        self.password_model = None
+        self.category_index = CategoryIndex([])
+        self.category_model.reset(self.category_index)
+        self._indexed_data = None
+
     def closeEvent(self, event):
-        print("主窗口关闭")
+        """关闭前写入所有修改；保存失败时由用户选择重试、放弃修改或取消关闭"""
+        self.sync_timer.stop()
+        buttons = QMessageBox.StandardButton
+        while True:
+            try:
+                self.runner.wait()
+                self._save_now()
+                break
+            except Exception as e:
+                reply = QMessageBox.critical(
+                    self, "错误", f"保存失败: {str(e)}\n\n重试保存，放弃未保存的修改，还是取消关闭？",
+                    buttons.Retry | buttons.Discard | buttons.Cancel, buttons.Retry
+                )
+                if reply == buttons.Discard:
+                    self.autosave.discard()
+                    break
+                if reply != buttons.Retry:
+                    event.ignore()
+                    return
+        self._stop_agent()
+        # 与锁定时一样清除内存中的密钥和已解密的密码
+        self.storage.close_session(save=False)
+        trace.log("主窗口关闭")
         event.accept()
@@ -2,5 +2,77 @@
 @Author: Chan Sheen
 @Date: 2025/4/15 17:14
 @File: password_table.py
-@Description: 
+@Description: 密码列表视图
+
+面向十万条以上的保险库：行高固定，视图只绘制可见的行；列宽按抽样的行估算，
+不使用 ResizeToContents（它会测量每一行的文本）。
 """
+
+from PyQt6.QtCore import Qt
+from PyQt6.QtWidgets import QHeaderView, QTableView
+
+
+class PasswordTableView(QTableView):
+    # 估算列宽时最多抽取的行数
+    sample_rows = 200
+    min_column_width = 60
+    max_column_width = 360
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._fitted = False
+        self.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+        self.setSelectionMode(QTableView.SelectionMode.SingleSelection)
+        self.setSortingEnabled(True)
+        self.sortByColumn(-1, Qt.SortOrder.AscendingOrder)
+        self.setWordWrap(False)
+
+        # 统一行高，滚动时无需逐行计算
+        vertical = self.verticalHeader()
+        vertical.setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        vertical.setDefaultSectionSize(self.fontMetrics().height() + 8)
+        vertical.setVisible(False)
+
+        header = self.horizontalHeader()
+        header.setSectionResizeMode(QHeaderView.ResizeMode.Interactive)
+        header.setStretchLastSection(True)
+
+    def setModel(self, model):
+        super().setModel(model)
+        if model is not None:
+            model.modelReset.connect(self.fit_columns)
+            model.layoutChanged.connect(self._fit_if_empty)
+            model.rowsInserted.connect(self._fit_if_empty)
+        self.fit_columns()
+
+    def _fit_if_empty(self, *args):
+        # 只在第一次有数据时估算，之后保留用户调整过的列宽
+        if not self._fitted:
+            self.fit_columns()
+
+    def fit_columns(self):
+        """按均匀抽取的若干行估算每列宽度"""
+        model = self.model()
+        self._fitted = False
+        if model is None:
+            return
+
+        rows = model.rowCount()
+        if rows:
+            step = max(1, rows // self.sample_rows)
+            sample = range(0, rows, step)
+        else:
+            sample = range(0)
+
+        metrics = self.fontMetrics()
+        header_metrics = self.horizontalHeader().fontMetrics()
+        padding = 2 * self.style().pixelMetric(self.style().PixelMetric.PM_FocusFrameHMargin) + 16
+        for column in range(model.columnCount()):
+            title = model.headerData(column, Qt.Orientation.Horizontal) or ""
+            width = header_metrics.horizontalAdvance(str(title))
+            for row in sample:
+                text = model.index(row, column).data()
+                if text:
+                    width = max(width, metrics.horizontalAdvance(str(text)))
+            self.setColumnWidth(column, max(self.min_column_width, min(width + padding, self.max_column_width)))
+        self._fitted = rows > 0
@@ -0,0 +1,87 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/4/25 11:10
+@File: workers.py
+@Description: 在线程池中执行密钥派生、加解密和文件读写，避免阻塞界面
+"""
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from utils import trace
+
+
+class WorkerSignals(QObject):
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(object)
+    # (已完成, 总数)
+    progress = pyqtSignal(int, int)
+
+
+class Worker(QRunnable):
+    def __init__(self, fn, *args, **kwargs):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+
+    def run(self):
+        try:
+            with trace.span(getattr(self.fn, "__qualname__", "后台任务"), "worker"):
+                result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            self.signals.failed.emit(e)
+        else:
+            self.signals.finished.emit(result)
+
+
+class TaskRunner(QObject):
+    """
+    提交后台任务，结果通过信号回到界面线程。
+    busyChanged(是否忙碌, 提示文字) 可用于状态栏或对话框显示进度。
+    """
+    busyChanged = pyqtSignal(bool, str)
+    progress = pyqtSignal(int, int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool.globalInstance()
+        # 任务结束前保持对 Worker 的引用，防止信号对象被回收
+        self._workers = set()
+
+    @property
+    def busy(self) -> bool:
+        return bool(self._workers)
+
+    def submit(self, fn, *args, message="", on_done=None, on_error=None, with_progress=False, **kwargs):
+        """
+        在线程池中执行 fn(*args, **kwargs)。with_progress 为 True 时额外传入
+        progress=回调，任务可以调用 progress(done, total) 汇报进度。
+        """
+        worker = Worker(fn, *args, **kwargs)
+        if with_progress:
+            worker.kwargs["progress"] = worker.signals.progress.emit
+            worker.signals.progress.connect(self.progress)
+
+        worker.signals.finished.connect(lambda result: self._finish(worker, on_done, result))
+        worker.signals.failed.connect(lambda error: self._finish(worker, on_error or self._report, error))
+
+        self._workers.add(worker)
+        self.busyChanged.emit(True, message)
+        self.pool.start(worker)
+        return worker
+
+    def _finish(self, worker, callback, value):
+        self._workers.discard(worker)
+        if not self._workers:
+            self.busyChanged.emit(False, "")
+        if callback is not None:
+            callback(value)
+
+    @staticmethod
+    def _report(error):
+        trace.log(str(error), "后台任务失败")
+
+    def wait(self):
+        """等待所有已提交的任务结束（用于关闭窗口前）"""
+        self.pool.waitForDone()
@@ -0,0 +1,142 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/12 09:20
+@File: file_lock.py
+@Description: 进程间的建议性读写锁
+
+对单独的锁文件（例如 passwords.dat.lock）加锁，不锁数据文件本身：数据文件会被原子替换，
+锁在旧文件上就失效了。读取时加共享锁，多个进程可以同时读；写入时加独占锁。
+
+POSIX 使用 fcntl.flock。Windows 的 msvcrt.locking 只有独占锁，共享锁也按独占锁处理，
+读者之间会短暂互斥。锁只约束同样加锁的程序，不阻止其他程序直接读写文件。
+
+同一时刻只有一个线程持有 FileLock 对象：持有者线程可以嵌套加锁（只有最外层真正加锁），
+其他线程加锁时等待持有者释放，与其他进程之间则由文件锁互斥。已持有独占锁时可以再申请共享锁，
+反过来不行。持有者线程可以用 hand_over 把锁交给即将启动的线程，由后者释放。
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# Windows 上等待锁时的轮询间隔（秒）
+_POLL_INTERVAL = 0.05
+
+
+class FileLock:
+    def __init__(self, path):
+        self.path = os.fspath(path)
+        self._fd = None
+        self._depth = 0
+        self._exclusive = False
+        # 持有期间一直锁住；_owner、_depth 只由持有者线程读写
+        self._held = threading.Lock()
+        self._owner = None
+
+    @property
+    def locked(self) -> bool:
+        """当前线程是否持有锁"""
+        return self._owner is threading.current_thread()
+
+    def acquire(self, exclusive=True, blocking=True) -> bool:
+        """加锁；blocking 为 False 且锁被其他线程或进程持有时立即返回 False"""
+        if self.locked:
+            if exclusive and not self._exclusive:
+                raise RuntimeError("持有共享锁时不能再申请独占锁")
+            self._depth += 1
+            return True
+
+        if not self._held.acquire(blocking):
+            return False
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                locked = self._lock(fd, exclusive, blocking)
+            except BaseException:
+                os.close(fd)
+                raise
+            if not locked:
+                os.close(fd)
+                self._held.release()
+                return False
+        except BaseException:
+            self._held.release()
+            raise
+        self._fd = fd
+        self._depth = 1
+        self._exclusive = exclusive
+        self._owner = threading.current_thread()
+        return True
+
+    def release(self):
+        if not self.locked:
+            raise RuntimeError("当前线程没有持有锁")
+        self._depth -= 1
+        if self._depth == 0:
+            fd, self._fd = self._fd, None
+            self._owner = None
+            try:
+                self._unlock(fd)
+            finally:
+                os.close(fd)
+                self._held.release()
+
+    def hand_over(self, thread: threading.Thread):
+        """把最外层的锁交给尚未启动的线程，之后由它释放；当前线程不能再嵌套加锁"""
+        if not self.locked or self._depth != 1:
+            raise RuntimeError("只能移交最外层持有的锁")
+        self._owner = thread
+
+    @contextmanager
+    def shared(self):
+        self.acquire(exclusive=False)
+        try:
+            yield self
+        finally:
+            self.release()
+
+    @contextmanager
+    def exclusive(self):
+        self.acquire(exclusive=True)
+        try:
+            yield self
+        finally:
+            self.release()
+
+    @staticmethod
+    def _lock(fd, exclusive, blocking) -> bool:
+        if fcntl is not None:
+            flags = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+            if not blocking:
+                flags |= fcntl.LOCK_NB
+            try:
+                fcntl.flock(fd, flags)
+            except BlockingIOError:
+                return False
+            return True
+
+        # msvcrt 锁的是文件中的字节区间，固定锁住第一个字节
+        while True:
+            os.lseek(fd, 0, os.SEEK_SET)
+            try:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+                time.sleep(_POLL_INTERVAL)
+
+    @staticmethod
+    def _unlock(fd):
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
@@ -2,5 +2,128 @@
 @Author: Chan Sheen
 @Date: 2025/4/15 17:14
 @File: file_ops.py
-@Description: 
+@Description: 文件的原子写入与备份轮换
+
+atomic_write 的写入顺序：
+
+    1. 写入同目录下的临时文件（每次写入各用一个新文件名），flush + fsync
+    2. 轮换备份：path.bak.N-1 -> path.bak.N ...，再把当前文件硬链接为 path.bak.1
+    3. os.replace 把临时文件原子替换为正式文件
+    4. fsync 所在目录，让改名和链接本身也落盘
+
+任何一步中断，path 要么是旧内容要么是新内容，不会出现写了一半的文件。
+备份通过硬链接和改名完成，不复制文件内容；文件系统不支持硬链接时才退回复制。
 """
+
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager, nullcontext
+
+_sync_data = getattr(os, "fdatasync", os.fsync)
+
+
+def fsync_directory(path):
+    """把目录项的变化（新建、改名、删除）落盘；Windows 不支持对目录 fsync，直接跳过"""
+    if os.name == 'nt':
+        return
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def backup_path(path, number) -> str:
+    return f"{path}.bak.{number}"
+
+
+def rotate_backups(path, count):
+    """
+    保留最近 count 份旧版本：path.bak.1 最新，path.bak.{count} 最旧。
+    调用后 path.bak.1 与 path 指向同一份内容，随后替换 path 时它就成了上一个版本。
+    """
+    if count <= 0 or not os.path.exists(path):
+        return
+    for number in range(count - 1, 0, -1):
+        older = backup_path(path, number)
+        if os.path.exists(older):
+            os.replace(older, backup_path(path, number + 1))
+
+    newest = backup_path(path, 1)
+    try:
+        os.remove(newest)
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(path, newest)
+    except OSError:
+        # FAT、部分网络文件系统不支持硬链接
+        shutil.copy2(path, newest)
+
+
+def remove_backups(path):
+    """删除 path 的所有旧版本（path.bak.N 和旧格式迁移前留下的 path.v1.bak），返回删除的个数"""
+    prefix = f"{os.path.basename(path)}.bak."
+    legacy = f"{os.path.basename(path)}.v1.bak"
+    directory = os.path.dirname(path) or "."
+    removed = 0
+    for name in os.listdir(directory):
+        if name == legacy or name.startswith(prefix) and name[len(prefix):].isdigit():
+            os.remove(os.path.join(directory, name))
+            removed += 1
+    if removed:
+        fsync_directory(directory)
+    return removed
+
+
+@contextmanager
+def atomic_write(path, mode="wb", backups=0, lock=None, **open_kwargs):
+    """
+    以原子替换的方式写文件：
+
+        with atomic_write(path, backups=3) as f:
+            f.write(data)
+
+    with 块内抛出异常时临时文件被删除，path 保持原样。open_kwargs 原样传给 open()
+    （文本模式下的 encoding、newline 等）。lock 为上下文管理器时只在轮换备份和替换
+    期间持有，写临时文件不占用锁；进入 lock 时抛出异常同样放弃替换。
+
+    临时文件名由 mkstemp 生成，多个写入者（包括其他进程）同时写同一个 path 时互不干扰，
+    最后替换的一方生效。
+    """
+    path = os.fspath(path)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path) or ".", prefix=f"{os.path.basename(path)}.", suffix=".tmp"
+    )
+    try:
+        f = os.fdopen(fd, mode, **open_kwargs)
+    except BaseException:
+        os.close(fd)
+        os.remove(tmp_path)
+        raise
+    try:
+        yield f
+        f.flush()
+        _sync_data(f.fileno())
+    except BaseException:
+        f.close()
+        os.remove(tmp_path)
+        raise
+    f.close()
+
+    try:
+        with lock if lock is not None else nullcontext():
+            rotate_backups(path, backups)
+            os.replace(tmp_path, path)
+            fsync_directory(os.path.dirname(path) or ".")
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def replace_file(src, dst):
+    """原子地用 src 替换 dst（同一目录内），并让改名落盘"""
+    os.replace(src, dst)
+    fsync_directory(os.path.dirname(os.fspath(dst)) or ".")
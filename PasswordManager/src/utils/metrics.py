@@ -0,0 +1,51 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/4/29 10:20
+@File: metrics.py
+@Description: 延迟统计
+"""
+
+import bisect
+import math
+
+
+class LatencyHistogram:
+    """
+    按对数分桶记录耗时（毫秒），内存占用固定，可以长期累计。
+    每个桶覆盖约 10% 的范围，百分位数的误差在同一量级。
+    """
+
+    def __init__(self, min_ms=0.01, max_ms=60_000, growth=1.1):
+        count = math.ceil(math.log(max_ms / min_ms, growth)) + 1
+        self.bounds = [min_ms * growth ** i for i in range(count)]
+        self.counts = [0] * (count + 1)
+        self.total = 0
+        self.max = 0.0
+
+    def record(self, ms):
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.total += 1
+        self.max = max(self.max, ms)
+
+    def percentile(self, p) -> float:
+        """返回第 p 百分位所在桶的上界（不超过实际最大值）"""
+        if not self.total:
+            return 0.0
+        rank = math.ceil(self.total * p / 100)
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+    def reset(self):
+        self.counts = [0] * len(self.counts)
+        self.total = 0
+        self.max = 0.0
+
+    def summary(self) -> str:
+        return (
+            f"p50 {self.percentile(50):.2f}ms  p90 {self.percentile(90):.2f}ms  "
+            f"p99 {self.percentile(99):.2f}ms  max {self.max:.2f}ms  n={self.total}"
+        )
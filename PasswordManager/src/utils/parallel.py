@@ -0,0 +1,48 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/8 10:40
+@File: parallel.py
+@Description: 分块并行处理
+
+Fernet 等加密操作的大部分工作在 Python 中完成，多线程受 GIL 限制无法并行，
+批量加解密时把数据分块交给多个进程。进程通过 spawn 启动：调用方常在后台线程中，
+fork 出的子进程可能继承被其他线程持有的锁。
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import trace
+
+# 少于这个数量时不启动进程池，启动进程本身就要上百毫秒
+PARALLEL_THRESHOLD = 5000
+CHUNK_SIZE = 2000
+
+
+def map_chunks(fn, items, *args, workers=1, progress=None):
+    """
+    对 items 分块调用 fn(*args, chunk)（fn 返回与 chunk 等长的列表），按原顺序合并结果。
+    fn 必须是模块级函数，args 和数据会被发送给子进程。progress(done, total) 每块汇报一次。
+    进程池不可用（受限环境、打包后的程序未调用 freeze_support）时退回当前进程执行。
+    """
+    total = len(items)
+    chunks = [items[i:i + CHUNK_SIZE] for i in range(0, total, CHUNK_SIZE)]
+    if workers > 1 and total >= PARALLEL_THRESHOLD:
+        try:
+            result = []
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(min(workers, len(chunks)), mp_context=context) as pool:
+                for part in pool.map(fn, *([arg] * len(chunks) for arg in args), chunks):
+                    result.extend(part)
+                    if progress is not None:
+                        progress(len(result), total)
+            return result
+        except (OSError, RuntimeError) as e:
+            trace.log(f"无法使用多进程，改为单进程: {e}", "并行")
+
+    result = []
+    for chunk in chunks:
+        result.extend(fn(*args, chunk))
+        if progress is not None:
+            progress(len(result), total)
+    return result
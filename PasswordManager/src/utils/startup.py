@@ -0,0 +1,78 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/9 09:30
+@File: startup.py
+@Description: 启动耗时统计
+
+记录启动过程中各阶段（导入模块、创建窗口）的起止时间，以及登录对话框、主窗口
+第一次绘制的时刻，时间均相对于 main.py 开始执行。设置 PM_DEBUG=1 时在主窗口
+首帧后打印汇总，用于发现启动变慢的改动；也可以用 `python -X importtime` 查看
+每个模块的导入耗时。开启了性能跟踪（utils/trace.py）时，各阶段同时记入跟踪。
+
+本模块只依赖标准库，必须在 PyQt6 之前导入才能统计 PyQt6 本身的导入时间。
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from utils import trace
+
+
+class StartupProfile:
+    def __init__(self, started=None, enabled=False):
+        self.started = time.perf_counter() if started is None else started
+        self.enabled = enabled
+        # (名称, 开始, 耗时) 均为毫秒；首帧等时刻的耗时为 None
+        self.events = []
+        self._lock = threading.Lock()
+
+    def _now(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    @contextmanager
+    def phase(self, name):
+        """统计 with 块的耗时，可在后台线程中使用"""
+        start = self._now()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.events.append((name, start, self._now() - start))
+
+    def mark(self, name):
+        with self._lock:
+            self.events.append((name, self._now(), None))
+
+    def watch_first_frame(self, widget, name, on_done=None):
+        """widget 第一次绘制时记录时刻，随后调用 on_done()"""
+        from PyQt6.QtCore import QEvent, QObject
+
+        profile = self
+
+        class FirstPaintFilter(QObject):
+            def eventFilter(self, obj, event):
+                if event.type() == QEvent.Type.Paint:
+                    obj.removeEventFilter(self)
+                    profile.mark(name)
+                    if on_done is not None:
+                        on_done()
+                return False
+
+        widget.installEventFilter(FirstPaintFilter(widget))
+
+    def as_dict(self) -> dict:
+        """名称 -> 毫秒（阶段为耗时，时刻为距启动的时间）"""
+        return {name: round(start if duration is None else duration, 1) for name, start, duration in self.events}
+
+    def report(self):
+        events = sorted(self.events, key=lambda e: e[1])
+        for name, start, duration in events:
+            trace.tracer.add_span(name, start, duration or 0, "startup")
+        if not self.enabled:
+            return
+        for name, start, duration in events:
+            if duration is None:
+                trace.log(f"{start:8.1f}ms  {name}", "启动")
+            else:
+                trace.log(f"{start:8.1f}ms  {name} 用时 {duration:.1f}ms", "启动")
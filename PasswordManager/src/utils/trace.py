@@ -0,0 +1,231 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/14 09:40
+@File: trace.py
+@Description: 耗时埋点与日志
+
+热点路径（密钥派生、解密、解析、保存、搜索、模型重建、视图刷新）用 span() 包起来，
+计数类的指标用 count()，日志统一走 log()：
+
+    from utils import trace
+
+    with trace.span("保存", entries=len(entries)):
+        ...
+    trace.count("密码解密")
+
+    @trace.traced("写快照", "storage")
+    def _write_snapshot(...): ...
+
+    trace.log("已锁定", "代理")        # 输出 "[代理] 已锁定"
+
+默认关闭，此时 span() 直接返回一个共用的空上下文，count() 立即返回，代价只是一次
+属性判断。enable() 之后（PM_DEBUG=1 或设置 PM_TRACE=文件路径）记录每个 span 的
+起止时间、线程和参数，以及日志和计数器的变化，可以导出为 Chrome 跟踪格式
+（chrome://tracing 或 https://ui.perfetto.dev 打开）；PM_TRACE 指定的文件在程序退出时写入。
+log() 无论是否开启都会输出，开启时同时记入跟踪。
+
+事件放在定长的环形缓冲区中，长时间运行只保留最近的部分。本模块只依赖标准库，
+命令行和界面都可以使用，可在任意线程中调用。
+"""
+
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+# 跟踪中最多保留的事件数
+DEFAULT_CAPACITY = 50_000
+# recent 中保留的最近完成的操作数（状态栏浮层显示）
+RECENT_SIZE = 50
+
+
+class _NullSpan:
+    """关闭时 span() 返回的空上下文"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "category", "args", "start")
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer._finish(self, end)
+        return False
+
+    def set(self, **args):
+        """补充只有在执行过程中才知道的参数（例如读到的条目数）"""
+        self.args.update(args)
+
+
+class Tracer:
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.enabled = False
+        self.origin = time.perf_counter()
+        self.events = deque(maxlen=capacity)
+        # 最近完成的 (名称, 毫秒, 线程名)，新的在后
+        self.recent = deque(maxlen=RECENT_SIZE)
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._export_path = None
+
+    # ------------------------------------------------------------ 记录
+
+    def span(self, name, category="", **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, category, args)
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            value = self.counters[name] = self.counters.get(name, 0) + n
+            self.events.append({
+                "name": name, "ph": "C", "ts": self._ts(time.perf_counter()),
+                "pid": self._pid, "tid": threading.get_ident(), "args": {"value": value},
+            })
+
+    def log(self, message, tag=None):
+        print(f"[{tag}] {message}" if tag else message)
+        if self.enabled:
+            with self._lock:
+                self.events.append({
+                    "name": tag or "日志", "cat": "log", "ph": "i", "s": "t",
+                    "ts": self._ts(time.perf_counter()), "pid": self._pid, "tid": threading.get_ident(),
+                    "args": {"message": str(message)},
+                })
+
+    def add_span(self, name, start_ms, duration_ms, category=""):
+        """补记已经结束的阶段（时间为相对 origin 的毫秒），用于启动计时等事后汇总的数据"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.events.append({
+                "name": name, "cat": category, "ph": "X",
+                "ts": round(start_ms * 1000, 1), "dur": round(duration_ms * 1000, 1),
+                "pid": self._pid, "tid": threading.get_ident(),
+            })
+
+    def _ts(self, t) -> float:
+        return round((t - self.origin) * 1_000_000, 1)
+
+    def _finish(self, span, end):
+        duration = end - span.start
+        thread = threading.current_thread()
+        event = {
+            "name": span.name, "cat": span.category, "ph": "X",
+            "ts": self._ts(span.start), "dur": round(duration * 1_000_000, 1),
+            "pid": self._pid, "tid": thread.ident,
+        }
+        if span.args:
+            event["args"] = span.args
+        with self._lock:
+            self.events.append(event)
+            self.recent.append((span.name, duration * 1000, thread.name))
+
+    # ------------------------------------------------------------ 开关与导出
+
+    def enable(self, export_path=None, origin=None):
+        """开始记录；export_path 不为空时在程序退出时导出到该文件"""
+        if origin is not None:
+            self.origin = origin
+        self.enabled = True
+        if export_path and self._export_path is None:
+            atexit.register(self._export_at_exit)
+        if export_path:
+            self._export_path = os.fspath(export_path)
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        with self._lock:
+            self.events.clear()
+            self.recent.clear()
+            self.counters.clear()
+
+    def snapshot(self):
+        """当前的 (最近完成的操作, 计数器) 副本，供界面在自己的线程中显示"""
+        with self._lock:
+            return list(self.recent), dict(self.counters)
+
+    def chrome_trace(self) -> dict:
+        with self._lock:
+            events = list(self.events)
+        names = {t.ident: t.name for t in threading.enumerate()}
+        # 线程名元数据，跟踪视图中按名称显示各线程
+        meta = [
+            {"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid, "args": {"name": name}}
+            for tid, name in names.items()
+        ]
+        return {"traceEvents": meta + events, "displayTimeUnit": "ms"}
+
+    def export(self, path):
+        """把已记录的事件按 Chrome 跟踪格式写入 path"""
+        from utils.file_ops import atomic_write
+        with atomic_write(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f, ensure_ascii=False)
+
+    def _export_at_exit(self):
+        if self._export_path and self.events:
+            try:
+                self.export(self._export_path)
+                # 退出时 stdout 可能是命令行的 JSON 输出，提示写到 stderr
+                print(f"[跟踪] 已写入 {self._export_path}", file=sys.stderr)
+            except OSError as e:
+                print(f"[跟踪] 写入失败: {e}", file=sys.stderr)
+
+
+# 进程内共用一个 Tracer，各模块通过下面的函数使用
+tracer = Tracer()
+span = tracer.span
+count = tracer.count
+log = tracer.log
+enable = tracer.enable
+
+
+def enabled() -> bool:
+    return tracer.enabled
+
+
+def traced(name, category=""):
+    """装饰器：每次调用记为一个 span；关闭时只多一层函数调用"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return fn(*args, **kwargs)
+            with _Span(tracer, name, category, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
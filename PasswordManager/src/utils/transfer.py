@@ -0,0 +1,433 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/6 14:30
+@File: transfer.py
+@Description: 流式导入导出
+
+导入是一条生成器流水线，每次只处理一行：
+
+    读取文件 -> 映射字段 -> 去重 -> 加密密码 -> 按批追加到保险库
+
+文件内容不会整体读入内存，明文密码加密后即被丢弃，百万行的文件也只占用固定的
+缓冲区（保险库本身随导入的条目增长）。导入只追加新条目，不覆盖已有数据：
+名称、网址、账号和密码都相同的条目视为重复，跳过；密码不同则两条都保留。
+
+支持的格式：
+
+    pmx        本程序的加密导出（JSON Lines，每行一个 Fernet 密文，密钥由导出密码派生）
+    csv        通用 CSV：name,url,username,password,notes,category（CSV 导出也用这个格式）
+    chrome     Chrome / Edge / Brave 导出的 CSV
+    firefox    Firefox 导出的 CSV
+    bitwarden  Bitwarden 导出的 CSV
+    lastpass   LastPass 导出的 CSV
+    1password  1Password 导出的 CSV
+    keepass    KeePass / KeePassXC 导出的 CSV
+
+CSV 按表头自动识别格式。分类在 CSV 中写成以 / 分隔的路径，例如 "工作/邮箱"，
+导入时不存在的分类会自动创建。某一级名称本身含有 / 或反斜杠时，本程序导出的 CSV 把路径写成
+JSON 数组，例如 ["工作", "a/b"]，导入 csv 格式时按数组还原。
+"""
+
+import base64
+import csv
+import io
+import json
+import os
+import re
+from itertools import islice
+from urllib.parse import urlsplit
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from core import kdf as kdfs
+from core.category_index import CategoryIndex
+from core.record import PasswordRecord
+from core.repository import new_entry_id
+from core.secret_cache import wipe
+from utils import trace
+from utils.file_ops import atomic_write
+
+NATIVE_FORMAT = "pmx"
+_NATIVE_MAGIC = "password-manager-export"
+_NATIVE_VERSION = 1
+
+# 各格式中本程序字段对应的列名（小写）；不在映射中的字段留空
+CSV_FORMATS = {
+    "csv": {"name": "name", "url": "url", "username": "username", "password": "password",
+            "notes": "notes", "category": "category"},
+    "chrome": {"name": "name", "url": "url", "username": "username", "password": "password", "notes": "note"},
+    "firefox": {"url": "url", "username": "username", "password": "password"},
+    "bitwarden": {"name": "name", "url": "login_uri", "username": "login_username",
+                  "password": "login_password", "notes": "notes", "category": "folder"},
+    "lastpass": {"name": "name", "url": "url", "username": "username", "password": "password",
+                 "notes": "extra", "category": "grouping"},
+    "1password": {"name": "title", "url": "url", "username": "username", "password": "password", "notes": "notes"},
+    "keepass": {"name": "title", "url": "url", "username": "username", "password": "password",
+                "notes": "notes", "category": "group"},
+}
+# 导出的分组路径以根分组开头（"Root/工作"），导入时去掉
+_ROOT_GROUP_FORMATS = {"keepass"}
+_CSV_COLUMNS = ["name", "url", "username", "password", "notes", "category"]
+
+# 每批追加的条目数，也是汇报进度的间隔
+BATCH_SIZE = 1000
+
+
+class ImportResult:
+    def __init__(self, fmt):
+        self.format = fmt
+        self.added = 0
+        # 与已有条目完全相同而跳过的
+        self.duplicates = 0
+        # 账号和密码都为空（安全笔记、信用卡等）而跳过的
+        self.skipped = 0
+        self.categories_created = 0
+
+    def __repr__(self):
+        return (f"ImportResult(format={self.format!r}, added={self.added}, "
+                f"duplicates={self.duplicates}, skipped={self.skipped})")
+
+
+def detect_format(path) -> str:
+    """根据扩展名和 CSV 表头判断文件格式"""
+    if os.fspath(path).lower().endswith("." + NATIVE_FORMAT):
+        return NATIVE_FORMAT
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        header = next(csv.reader(f), None)
+    if not header:
+        raise ValueError("文件为空或不是 CSV 文件")
+    columns = {column.strip().lower() for column in header}
+    # 选映射列最多且全部出现在表头中的格式，例如 KeePass 的表头同时满足 1Password
+    candidates = [fmt for fmt, mapping in CSV_FORMATS.items() if set(mapping.values()) <= columns]
+    if not candidates:
+        raise ValueError(f"无法识别的 CSV 表头: {', '.join(header)}")
+    return max(candidates, key=lambda fmt: len(CSV_FORMATS[fmt]))
+
+
+def split_category_path(path, json_list=False) -> tuple:
+    """把 CSV 中的分类文本拆成路径元组；json_list 为 True 时识别 format_category_path 写出的 JSON 数组"""
+    if json_list and path and path.startswith("["):
+        try:
+            parts = json.loads(path)
+        except ValueError:
+            parts = None
+        if isinstance(parts, list) and all(isinstance(part, str) for part in parts):
+            return tuple(part.strip() for part in parts if part.strip())
+    return tuple(part.strip() for part in re.split(r"[/\\]", path or "") if part.strip())
+
+
+def format_category_path(path) -> str:
+    """分类路径写成 CSV 中的文本；以 / 连接会产生歧义时写成 JSON 数组"""
+    if any("/" in part or "\\" in part for part in path) or (path and path[0].startswith("[")):
+        return json.dumps(list(path), ensure_ascii=False)
+    return "/".join(path)
+
+
+# ---------------------------------------------------------------- 读取
+
+
+def read_entries(path, fmt=None, password=None, progress=None):
+    """
+    逐条产出文件中的条目，每条为 dict：
+    name、url、username、password、notes 及 category（分类路径元组）。
+    progress(已读 KiB, 总 KiB) 按批汇报读取进度。
+    """
+    fmt = fmt or detect_format(path)
+    total = max(1, os.path.getsize(path) // 1024)
+    with open(path, "rb") as raw:
+        text = io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")
+        if fmt == NATIVE_FORMAT:
+            items = _read_native(text, password)
+        elif fmt in CSV_FORMATS:
+            items = _read_csv(text, fmt)
+        else:
+            raise ValueError(f"不支持的格式: {fmt}")
+        for count, item in enumerate(items, 1):
+            if progress is not None and count % BATCH_SIZE == 0:
+                # 文本层按块预读，底层文件的位置略超前于实际解析到的位置
+                progress(min(raw.tell() // 1024, total), total)
+            yield item
+        if progress is not None:
+            progress(total, total)
+
+
+def _read_csv(f, fmt):
+    mapping = CSV_FORMATS[fmt]
+    reader = csv.reader(f)
+    header = [column.strip().lower() for column in next(reader, [])]
+    columns = {field: header.index(column) for field, column in mapping.items()}
+    width = len(header)
+    strip_root = fmt in _ROOT_GROUP_FORMATS
+    json_list = fmt == "csv"
+    # 分类列的取值很少，解析结果按原文缓存，同一分类的条目共用一个路径元组
+    paths = {}
+    for row in reader:
+        if len(row) < width:
+            row += [""] * (width - len(row))
+        item = {field: row[i] for field, i in columns.items()}
+        text = item.pop("category", "")
+        category = paths.get(text)
+        if category is None:
+            category = split_category_path(text, json_list)[1 if strip_root else 0:]
+            if len(paths) < 10_000:
+                paths[text] = category
+        item["category"] = category
+        yield _normalize(item)
+
+
+def _read_native(f, password):
+    if not password:
+        raise ValueError("导入加密文件需要导出密码")
+    try:
+        header = json.loads(f.readline())
+    except ValueError:
+        header = None
+    if not isinstance(header, dict) or header.get("format") != _NATIVE_MAGIC:
+        raise ValueError("不是本程序导出的文件")
+    if header.get("version") != _NATIVE_VERSION:
+        raise ValueError(f"不支持的导出文件版本: {header.get('version')}")
+
+    kdf = kdfs.kdf_from_dict(header["kdf"])
+    fernet = Fernet(base64.urlsafe_b64encode(kdf.derive(password.encode(), bytes.fromhex(header["salt"]))))
+    for line_no, line in enumerate(f, 2):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            obj = json.loads(fernet.decrypt(line.encode("ascii")))
+        except InvalidToken:
+            if line_no == 2:
+                raise ValueError("导出密码错误") from None
+            raise ValueError(f"第 {line_no} 行已损坏") from None
+        if obj.get("type") == "category":
+            # 没有条目的分类也要保留，以空条目的形式交给下游创建
+            yield {"category": tuple(obj.get("path") or ()), "placeholder": True}
+        elif obj.get("type") == "entry":
+            obj["category"] = tuple(obj.get("category") or ())
+            yield _normalize(obj)
+
+
+def _normalize(item):
+    entry = {
+        "name": (item.get("name") or "").strip(),
+        "url": (item.get("url") or "").strip(),
+        "username": (item.get("username") or "").strip(),
+        "password": item.get("password") or "",
+        "notes": item.get("notes") or "",
+        "category": item.get("category") or (),
+    }
+    if not entry["name"]:
+        # Firefox 等格式没有名称列，用网址的主机名代替
+        entry["name"] = urlsplit(entry["url"]).hostname or entry["url"] or entry["username"]
+    return entry
+
+
+# ---------------------------------------------------------------- 导入
+
+
+def entry_key(entry):
+    """判断重复时比较的字段（不含密码，密码只在这些字段相同时才解密比较）"""
+    return entry.name, entry.url, entry.username
+
+
+class _Merger:
+    """把条目合并进仓库：去重、解析分类路径、加密密码"""
+
+    def __init__(self, storage, repository, category_index, result):
+        self.storage = storage
+        self.repository = repository
+        self.category_index = category_index
+        self.result = result
+        # 名称/网址/账号 -> 条目 ID（同一键有多条时为 ID 列表）
+        self._keys = {}
+        for entry in repository.passwords:
+            self._remember(entry_key(entry), entry.id)
+        self._paths = {}
+        for cat in category_index.categories:
+            self._paths.setdefault(category_index.path(cat['id']), cat['id'])
+
+    def _remember(self, key, entry_id):
+        current = self._keys.get(key)
+        if current is None:
+            self._keys[key] = entry_id
+        elif isinstance(current, list):
+            current.append(entry_id)
+        else:
+            self._keys[key] = [current, entry_id]
+
+    def is_duplicate(self, item):
+        """仓库中已有名称、网址、账号和密码都相同的条目"""
+        ids = self._keys.get((item["name"], item["url"], item["username"]))
+        if ids is None:
+            return False
+        password = item["password"].encode("utf-8")
+        for entry_id in ids if isinstance(ids, list) else (ids,):
+            entry = self.repository.get(entry_id)
+            if entry is None:
+                continue
+            if not entry.encrypted_password:
+                if not password:
+                    return True
+                continue
+            existing = self.storage.decrypt_secret(entry_id, entry.encrypted_password)
+            try:
+                if existing == password:
+                    return True
+            finally:
+                wipe(existing)
+        return False
+
+    def category_id(self, path):
+        """分类路径对应的 ID，不存在的各级分类依次创建（调用方持有存储锁）"""
+        if not path:
+            return None
+        category_id = self._paths.get(path)
+        if category_id is None:
+            parent_id = self.category_id(path[:-1])
+            category_id = self.category_index.add(path[-1], parent_id)['id']
+            self._paths[path] = category_id
+            self.result.categories_created += 1
+        return category_id
+
+    def encrypt(self, items):
+        """跳过重复条目，把其余条目加密成记录（不修改仓库，可在锁外执行）"""
+        for item in items:
+            if item.get("placeholder"):
+                yield item, None
+                continue
+            if not item["username"] and not item["password"]:
+                self.result.skipped += 1
+                continue
+            if self.is_duplicate(item):
+                self.result.duplicates += 1
+                continue
+            entry_id = new_entry_id()
+            record = PasswordRecord.from_dict({
+                "id": entry_id,
+                "name": item["name"],
+                "url": item["url"],
+                "username": item["username"],
+                "encrypted_password": self.storage.encrypt_secret(entry_id, item["password"]),
+                "notes": item["notes"],
+            })
+            # 同一文件中后面的行也要和前面导入的比较
+            self._remember(entry_key(record), entry_id)
+            yield item, record
+
+    def append(self, batch):
+        with self.storage.lock:
+            for item, record in batch:
+                category_id = self.category_id(item["category"])
+                if record is None:
+                    continue
+                record.category_id = category_id
+                self.repository.put(record)
+                self.result.added += 1
+
+
+def import_file(storage, path, repository, category_index, fmt=None, password=None, progress=None):
+    """
+    把文件中的条目合并进已解锁的保险库，返回 ImportResult。
+    repository、category_index 应当是会话数据上正在使用的索引，新条目追加在
+    repository.passwords 末尾；调用方随后负责保存（或交给自动保存）。
+    """
+    fmt = fmt or detect_format(path)
+    result = ImportResult(fmt)
+    merger = _Merger(storage, repository, category_index, result)
+    pending = merger.encrypt(read_entries(path, fmt, password, progress))
+    while True:
+        batch = list(islice(pending, BATCH_SIZE))
+        if not batch:
+            break
+        # 加密在锁外完成，追加时才持有锁，后台保存最多等待一批
+        merger.append(batch)
+    if result.added or result.categories_created:
+        storage.session.mark_dirty()
+    trace.log(f"{path}: {result}", "导入")
+    return result
+
+
+# ---------------------------------------------------------------- 导出
+
+
+def export_file(storage, path, fmt=NATIVE_FORMAT, password=None, progress=None) -> int:
+    """
+    导出全部条目，返回导出的条数。CSV 为明文，pmx 用 password 派生的密钥逐行加密。
+    写入临时文件后原子替换，导出中断不会留下不完整的文件。
+    """
+    if fmt not in (NATIVE_FORMAT, "csv"):
+        raise ValueError(f"不支持导出为 {fmt}")
+    if fmt == NATIVE_FORMAT and not password:
+        raise ValueError("加密导出需要设置导出密码")
+
+    data = storage.load_data()
+    with storage.lock:
+        # 记录视为不可变，复制列表即得到一致的快照，之后的修改不影响导出
+        entries = list(data.get("passwords", []))
+        categories = [dict(cat) for cat in data.get("categories", [])]
+    index = CategoryIndex(categories)
+    paths = {}
+
+    def path_of(category_id):
+        if category_id not in index:
+            return ()
+        if category_id not in paths:
+            parent = index.parent(category_id)
+            paths[category_id] = (path_of(parent) if parent is not None else ()) + (index.name(category_id),)
+        return paths[category_id]
+
+    with atomic_write(path, "w", encoding="utf-8", newline="") as f:
+        if os.name != 'nt':
+            # 文件中含有密码，只允许本人读取
+            os.chmod(f.name, 0o600)
+        if fmt == NATIVE_FORMAT:
+            write = _native_writer(f, storage, password)
+            for cat in categories:
+                write({"type": "category", "path": list(path_of(cat['id']))})
+        else:
+            writer = csv.writer(f)
+            writer.writerow(_CSV_COLUMNS)
+
+        total = len(entries)
+        for count, entry in enumerate(entries, 1):
+            secret = storage.decrypt_secret(entry.id, entry.encrypted_password) if entry.encrypted_password else bytearray()
+            try:
+                item = {
+                    "name": entry.name,
+                    "url": entry.url,
+                    "username": entry.username,
+                    "password": secret.decode("utf-8"),
+                    "notes": entry.notes,
+                }
+            finally:
+                wipe(secret)
+            category = path_of(entry.category_id)
+            if fmt == NATIVE_FORMAT:
+                item["type"] = "entry"
+                item["category"] = list(category)
+                write(item)
+            else:
+                item["category"] = format_category_path(category)
+                writer.writerow([item[column] for column in _CSV_COLUMNS])
+            if progress is not None and (count % BATCH_SIZE == 0 or count == total):
+                progress(count, total)
+
+    trace.log(f"已导出 {len(entries)} 条到 {path}", "导出")
+    return len(entries)
+
+
+def _native_writer(f, storage, password):
+    salt = os.urandom(16)
+    kdf = storage.kdf
+    f.write(json.dumps({
+        "format": _NATIVE_MAGIC,
+        "version": _NATIVE_VERSION,
+        "kdf": kdf.to_dict(),
+        "salt": salt.hex(),
+    }) + "\n")
+    fernet = Fernet(base64.urlsafe_b64encode(kdf.derive(password.encode(), salt)))
+
+    def write(obj):
+        f.write(fernet.encrypt(json.dumps(obj, ensure_ascii=False).encode("utf-8")).decode("ascii"))
+        f.write("\n")
+    return write
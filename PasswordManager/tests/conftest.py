@@ -0,0 +1,71 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/16 10:00
+@File: conftest.py
+@Description: 测试共用的保险库夹具
+
+每个测试在自己的临时目录中建保险库（配置目录即该目录），不碰用户真正的数据。
+密钥派生用最低参数的 PBKDF2，解锁只需几十毫秒。
+"""
+
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from config.app_config import AppConfig  # noqa: E402
+from core.record import PasswordRecord  # noqa: E402
+from core.repository import new_entry_id  # noqa: E402
+from core.secure_storage import SecureStorage  # noqa: E402
+from core.session import VaultSession  # noqa: E402
+
+PASSWORD = "pw"
+
+
+class _TestConfig(AppConfig):
+    def __init__(self, directory):
+        self._directory = Path(directory)
+        super().__init__()
+        self.kdf_algorithm = "pbkdf2-sha256"
+        self.kdf_target_ms = 1
+        self.crypto_workers = 1
+
+    def _get_config_path(self):
+        return self._directory
+
+
+def open_storage(directory):
+    return SecureStorage(_TestConfig(directory))
+
+
+def create_vault(storage, count=20):
+    """在 storage 中新建保险库并写入 count 个条目，返回数据"""
+    salt = storage.initialize_master_key(PASSWORD)
+    data = {"passwords": [], "categories": [{"id": 1, "name": "工作", "parent_id": None}], "master_salt": salt.hex()}
+    storage.session = VaultSession(data)
+    for i in range(count):
+        entry_id = new_entry_id()
+        data["passwords"].append(PasswordRecord(
+            id=entry_id, name=f"条目 {i}", url=f"https://site{i}.example.com", username=f"user{i}",
+            encrypted_password=storage.encrypt_secret(entry_id, f"secret-{i}"),
+            notes="备注" * (i % 3), category_id=1 if i % 2 else None
+        ))
+    storage.save_data(data)
+    return data
+
+
+def unlocked(directory, password=PASSWORD):
+    """新开一个实例解锁并加载保险库"""
+    storage = open_storage(directory)
+    assert storage.unlock(password)
+    storage.load_data()
+    return storage
+
+
+def snapshot_of(data):
+    """数据的可比较形式（条目转成 dict）"""
+    return {
+        **{k: v for k, v in data.items() if k != "passwords"},
+        "passwords": [entry.to_dict() for entry in data.get("passwords", [])],
+    }
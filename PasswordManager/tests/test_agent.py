@@ -0,0 +1,109 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/16 11:30
+@File: test_agent.py
+@Description: 代理与界面共用仓库时的加锁、请求处理与错误响应
+"""
+
+import json
+import threading
+import time
+
+import pytest
+
+from core.agent import AGENT_SUPPORTED, AgentClient, AgentServer, agent_running
+from core.commands import CommandError, VaultCommands
+from conftest import create_vault, open_storage, unlocked
+
+
+def test_queries_wait_for_storage_lock(tmp_path):
+    create_vault(open_storage(tmp_path))
+    storage = unlocked(tmp_path)
+    data = storage.load_data()
+    server = AgentServer(VaultCommands(storage), tmp_path / "agent.sock")
+    responses = []
+    query = threading.Thread(target=lambda: responses.append(server._dispatch(b'{"op": "list"}')))
+
+    with storage.lock:
+        # 界面修改仓库期间，代理的查询必须等待
+        query.start()
+        query.join(0.2)
+        assert query.is_alive()
+        data["passwords"].pop()
+
+    query.join(5)
+    response = json.loads(responses[0])
+    assert response["ok"]
+    assert len(response["result"]) == len(data["passwords"])
+
+
+def _request(server, **request):
+    return json.loads(server._dispatch(json.dumps(request).encode("utf-8")))
+
+
+def test_unexpected_errors_become_error_responses(tmp_path, monkeypatch):
+    create_vault(open_storage(tmp_path))
+    storage = unlocked(tmp_path)
+    server = AgentServer(VaultCommands(storage), tmp_path / "agent.sock")
+
+    def broken(entry):
+        raise RuntimeError("解密失败")
+
+    monkeypatch.setattr(storage, "reveal_secret", broken)
+    response = _request(server, op="get", entry="条目 1")
+    assert response == {"ok": False, "error": "解密失败"}
+    assert _request(server, op="ping") == {"ok": True, "result": "pong"}
+
+
+def test_get_other_field_does_not_decrypt(tmp_path, monkeypatch):
+    create_vault(open_storage(tmp_path))
+    storage = unlocked(tmp_path)
+    server = AgentServer(VaultCommands(storage), tmp_path / "agent.sock")
+    revealed = []
+    original = storage.reveal_secret
+    monkeypatch.setattr(storage, "reveal_secret", lambda entry: revealed.append(entry.id) or original(entry))
+
+    assert _request(server, op="get", entry="条目 1", field="username")["result"] == "user1"
+    assert revealed == []
+    assert _request(server, op="get", entry="条目 1", field="password")["result"] == "secret-1"
+    assert len(revealed) == 1
+
+
+@pytest.mark.skipif(not AGENT_SUPPORTED, reason="需要 Unix 域套接字")
+def test_slow_query_does_not_block_other_clients(tmp_path):
+    create_vault(open_storage(tmp_path))
+    storage = unlocked(tmp_path)
+    path = tmp_path / "agent.sock"
+    server = AgentServer(VaultCommands(storage), path)
+    server.start_in_thread()
+    try:
+        deadline = time.monotonic() + 5
+        while not agent_running(path):
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+
+        responses = []
+
+        def query():
+            with AgentClient(path) as client:
+                responses.append(client.request("list"))
+
+        slow = threading.Thread(target=query)
+        with storage.lock:
+            # 查询在等存储锁，其他连接照常得到响应
+            slow.start()
+            slow.join(0.2)
+            assert slow.is_alive()
+            with AgentClient(path, timeout=2) as client:
+                assert client.request("ping") == "pong"
+                with pytest.raises(CommandError):
+                    client.request("nope")
+        slow.join(5)
+        assert len(responses[0]) == 20
+
+        with AgentClient(path) as client:
+            assert client.request("lock") == "locked"
+        server.stop(wait=True)
+        assert not server.running
+    finally:
+        server.stop(wait=True)
@@ -0,0 +1,53 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/17 17:40
+@File: test_benchmarks.py
+@Description: 压测工具本身：合成保险库的生成与基线比较
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+
+from bench_vault import compare  # noqa: E402
+from vault_gen import MASTER_PASSWORD, VaultSpec, generate_vault, open_storage  # noqa: E402
+
+
+def _results(**metrics):
+    return {"results": {"1000": metrics}}
+
+
+def test_compare_flags_only_real_regressions():
+    baseline = _results(load_ms=100.0, search_ms=0.5, load_rss_mb=40.0, file_kb=300.0, window_ms=None)
+    current = _results(load_ms=130.0, search_ms=1.5, load_rss_mb=52.0, file_kb=400.0, window_ms=900.0, new_ms=1.0)
+    rows = {name: (base, value, regressed) for _, name, base, value, regressed in compare(baseline, current, 0.25)}
+    # 超出容差且超过噪声下限才算退化；基线或当前缺少的指标不比较
+    assert rows == {
+        "load_ms": (100.0, 130.0, True),
+        "search_ms": (0.5, 1.5, False),
+        "load_rss_mb": (40.0, 52.0, True),
+        "file_kb": (300.0, 400.0, True),
+    }
+    assert not any(row[-1] for row in compare(current, current, 0.0))
+
+
+def test_generated_vault_follows_spec(tmp_path):
+    spec = VaultSpec(entries=60, categories=12, depth=2, seed=3)
+    storage = open_storage(tmp_path / "a", kdf="pbkdf2-sha256")
+    storage.config.kdf_target_ms = 1
+    data = generate_vault(storage, spec)
+    assert len(data["passwords"]) == 60 and len(data["categories"]) == 12
+    parents = {cat["id"]: cat["parent_id"] for cat in data["categories"]}
+    assert all(parents.get(parent) is None for parent in parents.values() if parent is not None)
+
+    # 同一个种子生成相同的内容（条目 ID 和密文除外）
+    other = open_storage(tmp_path / "b", kdf="pbkdf2-sha256")
+    other.config.kdf_target_ms = 1
+    again = generate_vault(other, spec)
+    assert [e.name for e in again["passwords"]] == [e.name for e in data["passwords"]]
+
+    reader = open_storage(tmp_path / "a")
+    assert reader.unlock(MASTER_PASSWORD)
+    loaded = reader.load_data()["passwords"]
+    assert len(loaded) == 60 and len(reader.reveal_secret(loaded[0])) == spec.password_len
@@ -0,0 +1,51 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/17 17:20
+@File: test_category_index.py
+@Description: 分类层级索引的查找、子树与增删移动
+"""
+
+import pytest
+
+from core.category_index import CategoryIndex
+
+
+def _index():
+    return CategoryIndex([
+        {"id": 1, "name": "工作", "parent_id": None},
+        {"id": 2, "name": "邮箱", "parent_id": 1},
+        {"id": 3, "name": "内网", "parent_id": 2},
+        {"id": 4, "name": "个人", "parent_id": None},
+        # 父分类不存在时按顶层分类处理
+        {"id": 5, "name": "孤儿", "parent_id": 99},
+    ])
+
+
+def test_paths_and_subtrees():
+    index = _index()
+    assert index.path(3) == ("工作", "邮箱", "内网")
+    assert index.find(("工作", "邮箱")) == 2
+    assert index.find(("工作", "不存在")) is None
+    assert index.children() == [1, 4, 5]
+    assert sorted(index.subtree(1)) == [1, 2, 3]
+    assert index.in_subtree(3, 1) and not index.in_subtree(4, 1)
+
+
+def test_add_move_and_remove_keep_data_in_sync():
+    index = _index()
+    added = index.add("新分类", 4)
+    assert added["id"] == 6 and index.categories[-1] is added
+    assert sorted(index.subtree(4)) == [4, 6]
+
+    index.move(2, 4)
+    assert index.path(3) == ("个人", "邮箱", "内网")
+    assert sorted(index.subtree(1)) == [1]
+    with pytest.raises(ValueError):
+        index.move(4, 3)
+
+    # 删除后子分类上移一级，数据列表同步更新
+    assert index.remove(2) == 4
+    assert index.path(3) == ("个人", "内网")
+    assert 2 not in {cat["id"] for cat in index.categories}
+    with pytest.raises(KeyError):
+        index.add("x", 2)
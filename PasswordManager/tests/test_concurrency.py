@@ -0,0 +1,134 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/16 10:20
+@File: test_concurrency.py
+@Description: 两个实例同时写保险库
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+import core.container
+from utils.file_lock import FileLock
+from utils.file_ops import atomic_write
+from conftest import PASSWORD, create_vault, open_storage, snapshot_of, unlocked
+
+
+@contextmanager
+def _slow_background_writes(monkeypatch, delay=0.5):
+    """后台线程（压缩）写快照时在替换前停顿，放大与其他写入者重叠的时间窗口"""
+    original = core.container.atomic_write
+
+    @contextmanager
+    def slow(*args, **kwargs):
+        with original(*args, **kwargs) as f:
+            yield f
+            if threading.current_thread() is not threading.main_thread():
+                time.sleep(delay)
+
+    monkeypatch.setattr(core.container, "atomic_write", slow)
+    yield
+
+
+def test_rekey_during_foreign_compaction(tmp_path, monkeypatch):
+    create_vault(open_storage(tmp_path))
+    a = unlocked(tmp_path)
+    b = unlocked(tmp_path)
+
+    data = a.load_data()
+    data["passwords"][0] = data["passwords"][0].replace(notes="压缩前的修改")
+    a.session.mark_dirty()
+    a.save_data(data)
+
+    with _slow_background_writes(monkeypatch):
+        a.compact()
+        assert a._compactor is not None
+        # B 应等 A 的压缩结束后再整体重写快照
+        b.rekey("pw2", rotate_secrets=True)
+        a._wait_for_compaction()
+
+    fresh = open_storage(tmp_path)
+    assert not fresh.unlock(PASSWORD)
+    assert fresh.unlock("pw2")
+    loaded = fresh.load_data()
+    assert snapshot_of(loaded)["passwords"][0]["notes"] == "压缩前的修改"
+    assert len(loaded["passwords"]) == len(data["passwords"])
+    assert fresh.reveal_secret(loaded["passwords"][1]) == "secret-1"
+
+
+def test_save_during_own_compaction(tmp_path, monkeypatch):
+    create_vault(open_storage(tmp_path))
+    a = unlocked(tmp_path)
+    data = a.load_data()
+    data["passwords"][0] = data["passwords"][0].replace(notes="压缩前的修改")
+    a.session.mark_dirty()
+    a.save_data(data)
+
+    with _slow_background_writes(monkeypatch):
+        a.compact()
+        compactor = a._compactor
+        assert compactor is not None
+        # 压缩锁属于压缩线程，主线程不能把它当作自己嵌套持有的锁
+        assert not a._compaction_lock.locked
+        assert not a._needs_recovery()
+
+        data["passwords"][1] = data["passwords"][1].replace(notes="压缩期间的修改")
+        a.session.mark_dirty()
+        a.save_data(data)
+        # 增量提交追加到 .journal.new，不等压缩结束
+        assert compactor.is_alive()
+
+        # 整体重写快照要等本进程的压缩结束
+        a.rekey("pw2")
+        assert not compactor.is_alive()
+
+    fresh = open_storage(tmp_path)
+    assert fresh.unlock("pw2")
+    loaded = snapshot_of(fresh.load_data())
+    assert loaded["passwords"][0]["notes"] == "压缩前的修改"
+    assert loaded["passwords"][1]["notes"] == "压缩期间的修改"
+
+
+def test_file_lock_excludes_other_threads(tmp_path):
+    lock = FileLock(tmp_path / "test.lock")
+    results = []
+
+    def try_acquire():
+        acquired = lock.acquire(blocking=False)
+        results.append(acquired)
+        if acquired:
+            lock.release()
+
+    with lock.exclusive():
+        with lock.shared():
+            assert lock.locked
+        worker = threading.Thread(target=try_acquire)
+        worker.start()
+        worker.join()
+    assert results == [False]
+
+    # 移交给另一个线程后由它释放，原线程不再持有
+    lock.acquire()
+    worker = threading.Thread(target=lock.release)
+    lock.hand_over(worker)
+    assert not lock.locked
+    worker.start()
+    worker.join()
+    assert lock.acquire(blocking=False)
+    lock.release()
+
+
+def test_interleaved_atomic_writes(tmp_path):
+    path = tmp_path / "passwords.dat"
+    path.write_bytes(b"old")
+    first = atomic_write(path)
+    second = atomic_write(path)
+    f1, f2 = first.__enter__(), second.__enter__()
+    f1.write(b"A" * 1000)
+    f2.write(b"B" * 10)
+    second.__exit__(None, None, None)
+    first.__exit__(None, None, None)
+    # 各自的临时文件互不干扰，最后替换的一方完整生效
+    assert path.read_bytes() == b"A" * 1000
+    assert not list(tmp_path.glob("*.tmp"))
@@ -0,0 +1,141 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/17 09:40
+@File: test_container.py
+@Description: 容器文件的读写、旧版本兼容与头部校验
+"""
+
+import io
+import os
+
+import pytest
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from core.container import (_PREFIX, KIND_ENTRY, KIND_META, MAGIC, UNSIGNED_VERSION, VERSION, VaultContainer,
+                            encode_record, record_digest, record_key)
+from conftest import create_vault, open_storage, snapshot_of, unlocked
+
+
+def _records(names):
+    records = [(KIND_META, encode_record({"categories": []}))]
+    records += [(KIND_ENTRY, encode_record({"name": name})) for name in names]
+    return [(kind, record_digest(kind, plain), plain) for kind, plain in records]
+
+
+def _write_unsigned(path, key, header, records):
+    """按版本 3 的布局（附加数据只有记录类型，头部没有校验码）写出容器"""
+    aead = AESGCM(record_key(key))
+    blobs = []
+    for kind, _, plain in records:
+        nonce = os.urandom(12)
+        blobs.append((kind, nonce + aead.encrypt(nonce, plain, bytes((kind,)))))
+
+    capacity = 4096
+    offset = _PREFIX.size + capacity
+    slots = []
+    for kind, blob in blobs:
+        slots.append((kind, (offset, len(blob))))
+        offset += len(blob)
+    with open(path, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, UNSIGNED_VERSION, capacity))
+        f.write(VaultContainer(path)._build_head(header, slots).ljust(capacity, b"\0"))
+        for _, blob in blobs:
+            f.write(blob)
+
+
+def _slots(raw):
+    """文件内容中的索引条目 (类型, 偏移, 长度)"""
+    return VaultContainer("")._read_head(io.BytesIO(raw))[1]
+
+
+def _read_all(container, key):
+    return [(kind, digest, plain) for kind, digest, plain in container.iter_records(key)]
+
+
+def test_round_trip(tmp_path):
+    key = Fernet.generate_key()
+    container = VaultContainer(tmp_path / "passwords.dat")
+    records = _records(["a", "b", "c"])
+    container.save(key, {"generation": 3}, records)
+
+    reader = VaultContainer(tmp_path / "passwords.dat")
+    assert reader.read_header() == {"generation": 3}
+    assert reader.read_version() == VERSION
+    assert _read_all(reader, key) == records
+    assert reader.load_meta(key) == {"categories": []}
+
+
+def test_unchanged_records_reuse_ciphertext(tmp_path):
+    key = Fernet.generate_key()
+    path = tmp_path / "passwords.dat"
+    container = VaultContainer(path)
+    records = _records(["a", "b"])
+    container.save(key, {"generation": 1}, records)
+    before = path.read_bytes()
+
+    # 未变化的记录不提供明文，密文从旧文件复制
+    _read_all(container, key)
+    added = _records(["c"])[1]
+    container.save(key, {"generation": 2}, [(kind, digest, None) for kind, digest, _ in records] + [added])
+    after = path.read_bytes()
+    for _, offset, length in _slots(after)[:2]:
+        assert after[offset:offset + length] in before
+    assert _read_all(VaultContainer(path), key) == records + [added]
+
+
+def test_unsigned_version_is_readable(tmp_path):
+    key = Fernet.generate_key()
+    path = tmp_path / "passwords.dat"
+    records = _records(["a", "b"])
+    _write_unsigned(path, key, {"generation": 1}, records)
+
+    container = VaultContainer(path)
+    assert _read_all(container, key) == records
+    assert container.version == UNSIGNED_VERSION
+    # 旧版本的密文附加数据不同，写快照时全部重新加密
+    assert not container.has_blob(records[0][1])
+
+
+def test_downgraded_version_cannot_bypass_manifest(tmp_path):
+    key = Fernet.generate_key()
+    path = tmp_path / "passwords.dat"
+    VaultContainer(path).save(key, {"generation": 1}, _records(["a"]))
+
+    raw = bytearray(path.read_bytes())
+    magic, _, capacity = _PREFIX.unpack_from(raw)
+    _PREFIX.pack_into(raw, 0, magic, UNSIGNED_VERSION, capacity)
+    path.write_bytes(bytes(raw))
+    with pytest.raises(InvalidTag):
+        _read_all(VaultContainer(path), key)
+
+
+def test_record_from_older_snapshot_is_rejected(tmp_path):
+    key = Fernet.generate_key()
+    path = tmp_path / "passwords.dat"
+    VaultContainer(path).save(key, {"generation": 1}, _records(["a", "b"]))
+    older = path.read_bytes()
+    VaultContainer(path).save(key, {"generation": 2}, _records(["a", "x"]))
+
+    # 把旧快照中等长的密文换进新快照的同一位置：单条记录能解密，但校验码不符
+    newer = bytearray(path.read_bytes())
+    _, offset, length = _slots(newer)[2]
+    _, old_offset, old_length = _slots(older)[2]
+    assert length == old_length
+    newer[offset:offset + length] = older[old_offset:old_offset + length]
+    path.write_bytes(bytes(newer))
+    with pytest.raises(ValueError, match="校验失败"):
+        _read_all(VaultContainer(path), key)
+
+
+def test_unsigned_vault_migrates_to_current_version(tmp_path):
+    data = create_vault(open_storage(tmp_path), count=5)
+    path = tmp_path / "passwords.dat"
+    storage = unlocked(tmp_path)
+    header = storage.container.read_header()
+    _write_unsigned(path, storage.key, header, _read_all(storage.container, storage.key))
+
+    assert snapshot_of(unlocked(tmp_path).load_data()) == snapshot_of(data)
+    assert VaultContainer(path).read_version() == VERSION
+
@@ -0,0 +1,56 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/17 17:00
+@File: test_file_ops.py
+@Description: 原子写入与备份轮换
+"""
+
+from pathlib import Path
+
+import pytest
+
+from utils.file_ops import atomic_write, backup_path, remove_backups
+
+
+def test_failed_write_leaves_original(tmp_path):
+    path = tmp_path / "passwords.dat"
+    path.write_bytes(b"old")
+    with pytest.raises(RuntimeError):
+        with atomic_write(path, backups=2) as f:
+            f.write(b"half")
+            raise RuntimeError("中断")
+    assert path.read_bytes() == b"old"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["passwords.dat"]
+
+
+def test_failed_lock_abandons_replace(tmp_path):
+    path = tmp_path / "passwords.dat"
+    path.write_bytes(b"old")
+
+    class Refuse:
+        def __enter__(self):
+            raise RuntimeError("锁被占用")
+
+        def __exit__(self, *exc):
+            return False
+
+    with pytest.raises(RuntimeError):
+        with atomic_write(path, lock=Refuse()) as f:
+            f.write(b"new")
+    assert path.read_bytes() == b"old"
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_backups_rotate_and_keep_newest(tmp_path):
+    path = tmp_path / "passwords.dat"
+    for version in range(5):
+        with atomic_write(path, backups=3) as f:
+            f.write(b"v%d" % version)
+    assert path.read_bytes() == b"v4"
+    assert [Path(backup_path(path, n)).read_bytes() for n in (1, 2, 3)] == [b"v3", b"v2", b"v1"]
+    assert not (tmp_path / "passwords.dat.bak.4").exists()
+
+    (tmp_path / "passwords.dat.v1.bak").write_bytes(b"legacy")
+    (tmp_path / "passwords.dat.bak.old").write_bytes(b"keep")
+    assert remove_backups(path) == 4
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["passwords.dat", "passwords.dat.bak.old"]
@@ -0,0 +1,125 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/16 14:00
+@File: test_journal.py
+@Description: 日志的追加、重放与尾部处理
+"""
+
+import os
+
+import pytest
+from cryptography.fernet import Fernet
+
+from core.journal import VaultJournal
+from conftest import create_vault, open_storage, snapshot_of, unlocked
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = VaultJournal(tmp_path / "passwords.dat.journal")
+    journal.create(7)
+    return journal
+
+
+def _replay(path, fernet):
+    return list(VaultJournal(path).replay(fernet))
+
+
+def test_replay_returns_frames_in_order(journal):
+    fernet = Fernet(Fernet.generate_key())
+    for i in range(3):
+        journal.append(fernet, [{"op": "meta", "meta": {"n": i}}])
+
+    reader = VaultJournal(journal.path)
+    assert [ops[0]["meta"]["n"] for ops in reader.replay(fernet)] == [0, 1, 2]
+    assert reader.base == 7 and reader.frames == 3 and reader.size == journal.size
+
+    journal.append(fernet, [{"op": "meta", "meta": {"n": 3}}])
+    assert [ops[0]["meta"]["n"] for ops in reader.replay(fernet, reader.size)] == [3]
+    assert reader.frames == 4
+
+
+def _tear(journal, fernet):
+    """在日志末尾写半个帧：长度前缀完整，令牌只写了一部分"""
+    frame = fernet.encrypt(b"[]")
+    with open(journal.path, "ab") as f:
+        f.write(len(frame).to_bytes(4, "big") + frame[:10])
+
+
+def test_torn_tail_is_truncated_by_next_append(journal):
+    fernet = Fernet(Fernet.generate_key())
+    journal.append(fernet, [{"op": "meta", "meta": {}}])
+    committed = journal.size
+    _tear(journal, fernet)
+    torn = journal.path.stat().st_size
+
+    # 重放只读文件（读者只持有共享锁），尾部留给下一个写入者处理
+    writer = VaultJournal(journal.path)
+    assert len(list(writer.replay(fernet))) == 1
+    assert writer.size == committed
+    assert journal.path.stat().st_size == torn
+
+    writer.append(fernet, [{"op": "meta", "meta": {"n": 1}}])
+    assert len(_replay(journal.path, fernet)) == 2
+    assert journal.path.stat().st_size == writer.size
+
+
+def test_append_keeps_frames_added_after_replay(journal):
+    fernet = Fernet(Fernet.generate_key())
+    journal.append(fernet, [{"op": "meta", "meta": {}}])
+    _tear(journal, fernet)
+    stale = VaultJournal(journal.path)
+    list(stale.replay(fernet))
+
+    # 重放之后文件又有变化时不按旧的位置截断
+    with open(journal.path, "ab") as f:
+        f.write(b"x")
+    size = journal.path.stat().st_size
+    stale.append(fernet, [])
+    assert journal.path.stat().st_size > size
+
+
+def test_corrupt_frame_raises_without_truncating(journal):
+    fernet = Fernet(Fernet.generate_key())
+    for i in range(3):
+        journal.append(fernet, [{"op": "meta", "meta": {"n": i}}])
+    data = bytearray(journal.path.read_bytes())
+    # 破坏第一帧令牌中间的一个字节，之后的两帧仍是完整的已提交帧
+    first = data.index(b"gAAAA")
+    data[first + 20] ^= 1
+    journal.path.write_bytes(bytes(data))
+    size = len(data)
+
+    with pytest.raises(ValueError):
+        _replay(journal.path, fernet)
+    assert journal.path.stat().st_size == size
+
+
+def test_wrong_key_raises(journal):
+    journal.append(Fernet(Fernet.generate_key()), [])
+    with pytest.raises(ValueError):
+        _replay(journal.path, Fernet(Fernet.generate_key()))
+    assert journal.path.stat().st_size == journal.size
+
+
+def test_vault_reader_leaves_torn_tail_for_writer(tmp_path):
+    create_vault(open_storage(tmp_path))
+    writer = unlocked(tmp_path)
+    data = writer.load_data()
+    data["passwords"][0] = data["passwords"][0].replace(notes="已提交")
+    writer.session.mark_dirty()
+    writer.save_data(data)
+    _tear(writer.journal, Fernet(writer.key))
+    torn = writer.journal.path
+    size = os.path.getsize(torn)
+
+    reader = unlocked(tmp_path)
+    assert snapshot_of(reader.load_data()) == snapshot_of(data)
+    assert os.path.getsize(torn) == size
+
+    data = reader.load_data()
+    data["passwords"][1] = data["passwords"][1].replace(notes="截断后追加")
+    reader.session.mark_dirty()
+    reader.save_data(data)
+    assert os.path.getsize(torn) == reader.journal.size
+    assert snapshot_of(unlocked(tmp_path).load_data()) == snapshot_of(data)
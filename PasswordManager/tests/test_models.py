@@ -0,0 +1,55 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/16 16:30
+@File: test_models.py
+@Description: 表格模型的按需加载
+"""
+
+import os
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import pytest  # noqa: E402
+from PyQt6.QtCore import QCoreApplication  # noqa: E402
+
+from core.category_index import CategoryIndex  # noqa: E402
+from core.models import PasswordTableModel  # noqa: E402
+from core.record import PasswordRecord  # noqa: E402
+from core.repository import PasswordRepository  # noqa: E402
+
+
+@pytest.fixture(scope="module", autouse=True)
+def app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+def _model(count):
+    entries = [PasswordRecord(id=f"e{i}", name=f"条目 {i}") for i in range(count)]
+    return PasswordTableModel(PasswordRepository(entries), CategoryIndex([]))
+
+
+def test_put_entry_before_fully_loaded_does_not_reset():
+    model = _model(PasswordTableModel.fetch_batch + 500)
+    resets, inserts = [], []
+    model.modelReset.connect(lambda: resets.append(True))
+    model.rowsInserted.connect(lambda parent, first, last: inserts.append((first, last)))
+
+    model.put_entry(PasswordRecord(id="new", name="新条目"))
+    assert resets == [] and inserts == []
+    assert model.rowCount() == PasswordTableModel.fetch_batch
+
+    while model.canFetchMore():
+        model.fetchMore()
+    assert not resets
+    assert model.rowCount() == len(model.passwords)
+    assert model.entry_id_at(model.rowCount() - 1) == "new"
+    assert model.data(model.index(model.rowCount() - 1, 0)) == "新条目"
+
+
+def test_put_entry_when_fully_loaded_inserts_row():
+    model = _model(10)
+    inserts = []
+    model.rowsInserted.connect(lambda parent, first, last: inserts.append((first, last)))
+    model.put_entry(PasswordRecord(id="new", name="新条目"))
+    assert inserts == [(10, 10)]
+    assert model.rowCount() == 11
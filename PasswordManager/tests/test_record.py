@@ -0,0 +1,86 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/16 15:00
+@File: test_record.py
+@Description: 条目记录的二进制序列化
+"""
+
+import base64
+import os
+
+import pytest
+
+from core.container import encode_record
+from core.record import ENTRY_SCHEMA, PasswordRecord
+
+
+def _token():
+    return base64.urlsafe_b64encode(b"\x01" + os.urandom(12 + 16 + 16)).decode("ascii")
+
+
+def _round_trip(record):
+    plain = record.serialize()
+    decoded = PasswordRecord.decode(plain)
+    # 读回的记录再次序列化结果不变，摘要才能在进程之间保持一致
+    assert decoded.serialize() == plain
+    # 日志中以 dict 传递的记录重新序列化也得到同样的结果
+    assert PasswordRecord.from_dict(record.to_dict()).serialize() == plain
+    return plain, decoded
+
+
+def test_binary_round_trip():
+    record = PasswordRecord("id-1", "名称", "https://example.com", "用户", _token(), "备注\n第二行", 42)
+    plain, decoded = _round_trip(record)
+    assert plain[0] == ENTRY_SCHEMA
+    assert decoded.to_dict() == record.to_dict()
+    assert len(plain) < len(encode_record(record.to_dict()))
+
+
+def test_extra_fields_and_missing_category():
+    record = PasswordRecord("id-2", category_id=None, extra={"totp": "abc", "tags": ["a", "b"]})
+    plain, decoded = _round_trip(record)
+    assert plain[0] == ENTRY_SCHEMA
+    assert decoded.category_id is None
+    assert decoded.extra == record.extra
+
+
+@pytest.mark.parametrize("category_id", ["7", 1.5, True, 2 ** 63])
+def test_unusual_category_falls_back_to_json(category_id):
+    record = PasswordRecord("id-3", "n", encrypted_password=_token(), category_id=category_id)
+    plain, decoded = _round_trip(record)
+    assert plain.startswith(b"{")
+    assert decoded.category_id == category_id and type(decoded.category_id) is type(category_id)
+
+
+def test_oversize_field_falls_back_to_json():
+    record = PasswordRecord("id-4", "长" * 30000, notes="x")
+    plain, decoded = _round_trip(record)
+    assert plain.startswith(b"{")
+    assert decoded.name == record.name
+
+
+@pytest.mark.parametrize("secret", ["not base64!", "abc=", "a===", "YWJj\n", "密文"])
+def test_non_canonical_secret_kept_verbatim(secret):
+    record = PasswordRecord("id-5", "n", encrypted_password=secret, category_id=1)
+    _, decoded = _round_trip(record)
+    assert decoded.encrypted_password == secret
+
+
+def test_empty_values_normalized_consistently():
+    record = PasswordRecord(None, None, None, None, None, None, None)
+    _, decoded = _round_trip(record)
+    assert (decoded.name, decoded.url, decoded.notes) == ("", "", "")
+
+
+def test_decode_reads_json_records():
+    obj = {"id": "id-6", "name": "n", "url": "u", "username": "", "encrypted_password": "t", "notes": "",
+           "category_id": 3, "custom": 1}
+    decoded = PasswordRecord.decode(encode_record(obj))
+    assert decoded.to_dict() == obj
+
+
+def test_unknown_schema_rejected():
+    plain = bytearray(PasswordRecord("id-7").serialize())
+    plain[0] = ENTRY_SCHEMA + 1
+    with pytest.raises(ValueError):
+        PasswordRecord.decode(bytes(plain))
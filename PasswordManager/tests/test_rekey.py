@@ -0,0 +1,116 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/16 11:00
+@File: test_rekey.py
+@Description: 更换主密码与升级密钥派生参数
+"""
+
+import base64
+import json
+import os
+import shutil
+
+import pytest
+from cryptography.fernet import Fernet
+
+from core import kdf as kdfs
+from core.record import PasswordRecord
+from core.repository import new_entry_id
+from conftest import PASSWORD, create_vault, open_storage, snapshot_of, unlocked
+
+
+def _backups(directory):
+    return sorted(p.name for p in directory.glob("passwords.dat.bak.*"))
+
+
+def test_change_password_replaces_records_and_drops_old_backups(tmp_path):
+    create_vault(open_storage(tmp_path))
+    storage = unlocked(tmp_path)
+    data = storage.load_data()
+    data["passwords"][0] = data["passwords"][0].replace(notes="x")
+    storage.session.mark_dirty()
+    storage.save_data(data)
+    storage.compact(wait=True)
+    assert _backups(tmp_path)
+
+    old_records = list(data["passwords"])
+    old_tokens = [entry.encrypted_password for entry in old_records]
+    storage.rekey("pw2", rotate_secrets=True)
+
+    # 旧记录保持不变，会话换成了新的数据对象
+    assert [entry.encrypted_password for entry in old_records] == old_tokens
+    new_data = storage.load_data()
+    assert new_data is not data
+    assert all(a.encrypted_password != b.encrypted_password for a, b in zip(old_records, new_data["passwords"]))
+    assert _backups(tmp_path) == []
+
+    fresh = unlocked(tmp_path, "pw2")
+    assert snapshot_of(fresh.load_data()) == snapshot_of(new_data)
+    assert fresh.reveal_secret(fresh.load_data()["passwords"][3]) == "secret-3"
+
+
+def test_no_file_opens_with_old_password_after_change(tmp_path):
+    # 从旧版单一数据块格式迁移来的保险库，迁移时留下了 .v1.bak
+    salt = os.urandom(16)
+    key = base64.urlsafe_b64encode(kdfs.legacy_kdf().derive(PASSWORD.encode(), salt))
+    data = {"passwords": [], "categories": [], "master_salt": salt.hex()}
+    token = Fernet(key).encrypt(json.dumps(data).encode("utf-8")).decode("ascii")
+    (tmp_path / "passwords.dat").write_text(json.dumps({"salt": salt.hex(), "data": token}), encoding="utf-8")
+    storage = unlocked(tmp_path)
+    data = storage.load_data()
+    entry_id = new_entry_id()
+    data["passwords"].append(PasswordRecord(id=entry_id, name="条目",
+                                            encrypted_password=storage.encrypt_secret(entry_id, "secret")))
+    storage.session.mark_dirty()
+    storage.save_data(data)
+    storage.compact(wait=True)
+    assert (tmp_path / "passwords.dat.v1.bak").exists()
+
+    storage.rekey("pw2", rotate_secrets=True)
+
+    # 剩下的每份数据文件（当前文件和各种备份）都打不开
+    probe = tmp_path / "probe"
+    for path in [tmp_path / "passwords.dat", *tmp_path.glob("passwords.dat.bak.*"), *tmp_path.glob("*.v1.bak")]:
+        probe.mkdir()
+        shutil.copy(path, probe / "passwords.dat")
+        assert not open_storage(probe).unlock(PASSWORD), path.name
+        shutil.rmtree(probe)
+    fresh = unlocked(tmp_path, "pw2")
+    assert fresh.reveal_secret(fresh.load_data()["passwords"][0]) == "secret"
+
+
+def test_failed_rekey_leaves_session_untouched(tmp_path, monkeypatch):
+    create_vault(open_storage(tmp_path))
+    storage = unlocked(tmp_path)
+    data = storage.load_data()
+    before = snapshot_of(data)
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(storage.container, "save", fail)
+    with pytest.raises(OSError):
+        storage.rekey("pw2", rotate_secrets=True)
+    monkeypatch.undo()
+
+    assert storage.load_data() is data
+    assert snapshot_of(data) == before
+    assert storage.reveal_secret(data["passwords"][0]) == "secret-0"
+    # 下一次保存按旧密钥重写快照
+    data["passwords"].pop()
+    storage.session.mark_dirty()
+    storage.save_data(data)
+    assert len(unlocked(tmp_path, PASSWORD).load_data()["passwords"]) == len(data["passwords"])
+
+
+def test_kdf_upgrade_drops_weak_backups(tmp_path):
+    create_vault(open_storage(tmp_path))
+    storage = unlocked(tmp_path)
+    storage.compact(wait=True)
+    storage.rekey(PASSWORD, kdf=kdfs.calibrate("scrypt", 1))
+    # 旧备份只由较弱的 PBKDF2 保护，升级成功后一并删除
+    assert _backups(tmp_path) == []
+    assert storage.container.read_header()["kdf"]["name"] == "scrypt"
+    fresh = unlocked(tmp_path)
+    assert fresh.kdf.name == "scrypt"
+    assert fresh.reveal_secret(fresh.load_data()["passwords"][2]) == "secret-2"
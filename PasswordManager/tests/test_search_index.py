@@ -0,0 +1,77 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/17 16:00
+@File: test_search_index.py
+@Description: 倒排索引的查询结果与逐条子串匹配一致
+"""
+
+import random
+
+import pytest
+
+from core.record import PasswordRecord
+from core.search_index import SEARCH_FIELDS, SearchIndex
+
+_WORDS = ["github", "gmail", "git", "mail", "工作", "邮箱", "工作邮箱", "银行", "a", "ab", "Admin", "ÉCOLE"]
+
+
+def _entries(count=300, seed=7):
+    rng = random.Random(seed)
+    return {
+        f"e{i}": PasswordRecord(
+            id=f"e{i}",
+            name=" ".join(rng.sample(_WORDS, 2)),
+            url=f"https://{rng.choice(_WORDS)}.example.com",
+            username=rng.choice(_WORDS) + str(i),
+            notes=rng.choice(["", "备注 " + rng.choice(_WORDS)]),
+        )
+        for i in range(count)
+    }
+
+
+def _scan(entries, query):
+    """逐条核对：每个词是某个字段的子串（^ 开头时为字段前缀），不区分大小写"""
+    def matches(entry, term):
+        values = [(getattr(entry, field) or "").casefold() for field in SEARCH_FIELDS]
+        if term.startswith("^"):
+            return any(value.startswith(term[1:]) for value in values)
+        return any(term in value for value in values)
+
+    terms = [term for term in query.casefold().split() if term.strip("^")]
+    return {key for key, entry in entries.items() if all(matches(entry, term) for term in terms)}
+
+
+@pytest.mark.parametrize("query", [
+    "git", "GitHub", "^git", "^mail", "mail", "工作", "邮", "工作 邮箱", "a", "^a", "ab 工", "école",
+    "example.com", "nothing", "^", "",
+])
+def test_search_matches_linear_scan(query):
+    entries = _entries()
+    index = SearchIndex()
+    index.rebuild(entries.items())
+    assert index.search(query) == _scan(entries, query)
+
+
+def test_incremental_updates_and_candidates():
+    entries = _entries()
+    index = SearchIndex()
+    index.rebuild(entries.items())
+
+    entries["e1"] = entries["e1"].replace(name="全新名称")
+    index.update("e1", entries["e1"])
+    index.remove("e2")
+    del entries["e2"]
+    index.add("new", PasswordRecord(id="new", name="全新条目"))
+    entries["new"] = PasswordRecord(id="new", name="全新条目")
+    assert index.search("全新") == _scan(entries, "全新") == {"e1", "new"}
+    assert index.search("git") == _scan(entries, "git")
+
+    # 在上一次结果内继续缩小
+    previous = index.search("g")
+    assert index.search("gmail", candidates=previous) == _scan(entries, "gmail")
+
+
+def test_cancelled_search_returns_none():
+    index = SearchIndex()
+    index.rebuild(_entries(3000).items())
+    assert index.search("a", cancelled=lambda: True) is None
@@ -0,0 +1,54 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/17 16:30
+@File: test_secret_cache.py
+@Description: 明文缓存的容量、过期与清零
+"""
+
+import core.secret_cache
+from core.secret_cache import SecretCache
+from conftest import create_vault, open_storage, unlocked
+
+
+def test_evicted_and_cleared_plaintexts_are_wiped():
+    cache = SecretCache(capacity=2, ttl=60)
+    buffers = [bytearray(b"secret-%d" % i) for i in range(3)]
+    for i, buffer in enumerate(buffers):
+        cache.put(i, buffer)
+    # 最久未用的一项被挤出并清零
+    assert cache.get(0) is None
+    assert buffers[0] == bytes(len(buffers[0]))
+    assert cache.get(1) == b"secret-1"
+
+    cache.invalidate(lambda key: key == 1)
+    assert buffers[1] == bytes(len(buffers[1]))
+    cache.clear()
+    assert len(cache) == 0 and buffers[2] == bytes(len(buffers[2]))
+
+
+def test_expired_items_are_purged(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(core.secret_cache.time, "monotonic", lambda: now[0])
+    cache = SecretCache(capacity=4, ttl=10)
+    first, second = bytearray(b"a"), bytearray(b"b")
+    cache.put("a", first)
+    now[0] += 5
+    cache.put("b", second)
+    now[0] += 6
+    assert cache.purge() == 1
+    assert first == b"\0" and cache.get("b") == b"b"
+    now[0] += 5
+    assert cache.get("b") is None and second == b"\0"
+
+
+def test_storage_decrypts_once_and_forgets_on_change(tmp_path):
+    create_vault(open_storage(tmp_path))
+    storage = unlocked(tmp_path)
+    entry = storage.load_data()["passwords"][3]
+    assert storage.reveal_secret(entry) == "secret-3"
+    assert len(storage.secret_cache) == 1
+    assert storage.reveal_secret(entry) == "secret-3"
+    assert len(storage.secret_cache) == 1
+
+    storage.forget_secret(entry.id)
+    assert len(storage.secret_cache) == 0
@@ -0,0 +1,215 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/16 15:30
+@File: test_storage.py
+@Description: 保险库的读写、旧格式迁移、日志重放与压缩恢复
+"""
+
+import base64
+import json
+import os
+import threading
+
+import pytest
+from cryptography.fernet import Fernet
+
+from core import kdf as kdfs
+from core.container import (_PREFIX, FERNET_VERSION, KIND_ENTRY, KIND_META, MAGIC, VERSION, VaultContainer,
+                            encode_record, record_digest)
+from core.journal import VaultJournal
+from core.secure_storage import SecureStorage
+from conftest import PASSWORD, create_vault, open_storage, snapshot_of, unlocked
+
+
+def _entry(i):
+    return {"id": f"e{i}", "name": f"条目 {i}", "url": f"https://{i}.example.com", "username": f"u{i}",
+            "encrypted_password": "", "notes": "", "category_id": 1 if i % 2 else None}
+
+
+def _legacy_key(salt):
+    raw = kdfs.legacy_kdf().derive(PASSWORD.encode(), salt)
+    return raw, base64.urlsafe_b64encode(raw)
+
+
+def _write_v2_vault(path, entries, generation=1):
+    """按版本 2 的布局（逐条 Fernet 加密的 JSON 记录）写出容器，返回 Fernet 密钥"""
+    salt = os.urandom(16)
+    raw, key = _legacy_key(salt)
+    header = {"salt": salt.hex(), "kdf": kdfs.legacy_kdf().to_dict(),
+              "check": SecureStorage._compute_key_check(raw), "generation": generation}
+    meta = {"categories": [{"id": 1, "name": "工作", "parent_id": None}], "master_salt": salt.hex()}
+    fernet = Fernet(key)
+    blobs = [(KIND_META, fernet.encrypt(encode_record(meta)))]
+    blobs += [(KIND_ENTRY, fernet.encrypt(encode_record(entry))) for entry in entries]
+
+    container = VaultContainer(path)
+    capacity = 4096
+    offset = _PREFIX.size + capacity
+    slots = []
+    for kind, blob in blobs:
+        slots.append((kind, (offset, len(blob))))
+        offset += len(blob)
+    with open(path, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, FERNET_VERSION, capacity))
+        f.write(container._build_head(header, slots).ljust(capacity, b"\0"))
+        for _, blob in blobs:
+            f.write(blob)
+    return key
+
+
+def test_new_vault_round_trip(tmp_path):
+    data = create_vault(open_storage(tmp_path))
+    assert VaultContainer(tmp_path / "passwords.dat").read_version() == VERSION
+    storage = unlocked(tmp_path)
+    assert snapshot_of(storage.load_data()) == snapshot_of(data)
+    assert storage.reveal_secret(storage.load_data()["passwords"][4]) == "secret-4"
+    assert not open_storage(tmp_path).unlock("wrong")
+
+
+def test_legacy_v1_migrates_to_current_format(tmp_path):
+    salt = os.urandom(16)
+    _, key = _legacy_key(salt)
+    data = {"passwords": [_entry(i) for i in range(5)], "categories": [], "master_salt": salt.hex()}
+    token = Fernet(key).encrypt(json.dumps(data).encode("utf-8")).decode("ascii")
+    (tmp_path / "passwords.dat").write_text(json.dumps({"salt": salt.hex(), "data": token}), encoding="utf-8")
+
+    storage = open_storage(tmp_path)
+    assert storage.unlock(PASSWORD)
+    assert snapshot_of(storage.load_data())["passwords"] == data["passwords"]
+    assert VaultContainer(tmp_path / "passwords.dat").read_version() == VERSION
+    assert (tmp_path / "passwords.dat.v1.bak").exists()
+    assert snapshot_of(unlocked(tmp_path).load_data())["passwords"] == data["passwords"]
+
+
+def test_v2_with_journal_migrates_to_current_format(tmp_path):
+    path = tmp_path / "passwords.dat"
+    entries = [_entry(i) for i in range(6)]
+    key = _write_v2_vault(path, entries)
+
+    # 版本 2 时期的日志：条目摘要按 JSON 序列化计算
+    edited = dict(entries[2], notes="改过", category_id="7", extra_field=[1])
+    journal = VaultJournal(f"{path}.journal")
+    journal.create(1)
+    journal.append(Fernet(key), [{
+        "op": "splice", "at": 2,
+        "remove": [record_digest(KIND_ENTRY, encode_record(entries[2])).hex()],
+        "insert": [edited, _entry(99)],
+    }])
+    expected = entries[:2] + [edited, _entry(99)] + entries[3:]
+
+    storage = open_storage(tmp_path)
+    assert storage.verify_password(PASSWORD)
+    assert storage.unlock(PASSWORD)
+    assert snapshot_of(storage.load_data())["passwords"] == expected
+    assert VaultContainer(path).read_version() == VERSION
+    assert storage.journal.frames == 0
+
+    # 迁移后继续修改、重放日志、压缩
+    data = storage.load_data()
+    data["passwords"][0] = data["passwords"][0].replace(name="新名称")
+    storage.session.mark_dirty()
+    storage.save_data(data)
+    reader = unlocked(tmp_path)
+    assert snapshot_of(reader.load_data()) == snapshot_of(data)
+    storage.compact(wait=True)
+    assert snapshot_of(unlocked(tmp_path).load_data()) == snapshot_of(data)
+
+
+def test_journal_replay_and_incremental_sync(tmp_path):
+    create_vault(open_storage(tmp_path))
+    writer = unlocked(tmp_path)
+    reader = unlocked(tmp_path)
+    data = writer.load_data()
+
+    del data["passwords"][3]
+    data["passwords"][0] = data["passwords"][0].replace(notes="第一次")
+    writer.session.mark_dirty()
+    writer.save_data(data)
+    data["categories"].append({"id": 2, "name": "个人", "parent_id": None})
+    data["passwords"].append(data["passwords"][1].replace(id="copy", name="副本"))
+    writer.session.mark_dirty()
+    writer.save_data(data)
+    assert writer.journal.frames == 2
+
+    state = reader.read_external()
+    assert state is not None and state.changed is not None
+    reader.apply_external(state)
+    assert snapshot_of(reader.load_data()) == snapshot_of(data)
+    assert snapshot_of(unlocked(tmp_path).load_data()) == snapshot_of(data)
+
+
+def test_interrupted_compaction_is_recovered(tmp_path, monkeypatch):
+    create_vault(open_storage(tmp_path))
+    storage = unlocked(tmp_path)
+    data = storage.load_data()
+    data["passwords"][0] = data["passwords"][0].replace(notes="压缩前")
+    storage.session.mark_dirty()
+    storage.save_data(data)
+
+    resume = threading.Event()
+
+    def interrupted(*args, **kwargs):
+        # 模拟压缩写到一半进程退出：快照没有替换
+        resume.wait(5)
+        raise OSError("killed")
+
+    monkeypatch.setattr(storage.container, "save", interrupted)
+    storage.compact()
+    # 压缩期间的提交写在 .journal.new 中
+    data["passwords"][1] = data["passwords"][1].replace(notes="压缩期间")
+    storage.session.mark_dirty()
+    storage.save_data(data)
+    resume.set()
+    storage.compact(wait=True)
+    monkeypatch.undo()
+    assert os.path.exists(f"{tmp_path / 'passwords.dat'}.journal.new")
+
+    other = unlocked(tmp_path)
+    loaded = other.load_data()
+    assert snapshot_of(loaded) == snapshot_of(data)
+    # 下一次写入时把中断的压缩折叠回快照
+    loaded["passwords"][2] = loaded["passwords"][2].replace(notes="恢复时")
+    other.session.mark_dirty()
+    other.save_data(loaded)
+    assert not os.path.exists(f"{tmp_path / 'passwords.dat'}.journal.new")
+    assert snapshot_of(unlocked(tmp_path).load_data()) == snapshot_of(loaded)
+
+
+def test_tampered_record_is_rejected(tmp_path):
+    create_vault(open_storage(tmp_path))
+    path = tmp_path / "passwords.dat"
+    raw = bytearray(path.read_bytes())
+    raw[-5] ^= 1
+    path.write_bytes(bytes(raw))
+    storage = open_storage(tmp_path)
+    assert storage.unlock(PASSWORD)
+    with pytest.raises(Exception):
+        storage.load_data()
+
+
+def _tamper_head(path, edit):
+    """按 edit(头部, 索引) 改写头部区，保留原来的校验码（篡改者无法重新计算）"""
+    container = VaultContainer(path)
+    raw = path.read_bytes()
+    with open(path, "rb") as f:
+        header, slots, (_, mac) = container._read_head(f)
+    header, slots = edit(header, [(kind, (offset, length)) for kind, offset, length in slots])
+    capacity = container.head_capacity
+    head = (container._build_head(header, slots) + mac).ljust(capacity, b"\0")
+    path.write_bytes(raw[:_PREFIX.size] + head + raw[_PREFIX.size + capacity:])
+
+
+@pytest.mark.parametrize("edit", [
+    lambda header, slots: (header, slots[:-1]),
+    lambda header, slots: (header, slots + [slots[1]]),
+    lambda header, slots: (header, [slots[0], slots[2], slots[1]] + slots[3:]),
+    lambda header, slots: ({**header, "generation": header["generation"] + 1}, slots),
+], ids=["delete_slot", "duplicate_slot", "reorder_slots", "change_generation"])
+def test_tampered_head_is_rejected(tmp_path, edit):
+    create_vault(open_storage(tmp_path))
+    _tamper_head(tmp_path / "passwords.dat", edit)
+    storage = open_storage(tmp_path)
+    assert storage.unlock(PASSWORD)
+    with pytest.raises(ValueError, match="校验失败"):
+        storage.load_data()
+    assert storage.session is None
@@ -0,0 +1,61 @@
+"""
+@Author: Chan Sheen
+@Date: 2025/5/17 14:20
+@File: test_transfer.py
+@Description: CSV 导入导出中的分类路径与命令行的错误处理
+"""
+
+import csv
+
+import cli
+from core.commands import VaultCommands
+from utils.transfer import format_category_path, split_category_path
+from conftest import PASSWORD, create_vault, open_storage, unlocked
+
+
+def test_category_path_text():
+    assert format_category_path(("工作", "邮箱")) == "工作/邮箱"
+    assert split_category_path("工作/邮箱", json_list=True) == ("工作", "邮箱")
+    for path in [("工作", "a/b"), ("a\\b",), ("[草稿]", "x")]:
+        assert split_category_path(format_category_path(path), json_list=True) == path
+    # 其他程序导出的 CSV 不按 JSON 解析
+    assert split_category_path('["a/b"]') == ('["a', 'b"]')
+
+
+def test_csv_round_trip_keeps_slash_in_category_names(tmp_path):
+    create_vault(open_storage(tmp_path / "a"), count=3)
+    storage = unlocked(tmp_path / "a")
+    data = storage.load_data()
+    data["categories"] += [{"id": 2, "name": "a/b", "parent_id": 1}, {"id": 3, "name": "邮箱", "parent_id": 1}]
+    data["passwords"][0] = data["passwords"][0].replace(category_id=2)
+    data["passwords"][2] = data["passwords"][2].replace(category_id=3)
+    storage.session.mark_dirty()
+    storage.save_data(data)
+    path = tmp_path / "export.csv"
+    VaultCommands(storage).export(str(path), "csv")
+
+    with open(path, encoding="utf-8", newline="") as f:
+        categories = [row[-1] for row in csv.reader(f)][1:]
+    assert categories == ['["工作", "a/b"]', "工作", "工作/邮箱"]
+
+    create_vault(open_storage(tmp_path / "b"), count=0)
+    commands = VaultCommands(unlocked(tmp_path / "b"))
+    assert commands.import_(str(path))["added"] == 3
+    paths = {entry.name: commands.category_index.path(entry.category_id) for entry in commands.repository.passwords}
+    assert paths == {"条目 0": ("工作", "a/b"), "条目 1": ("工作",), "条目 2": ("工作", "邮箱")}
+
+
+def test_cli_reports_malformed_csv(tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    create_vault(open_storage(tmp_path), count=1)
+    password_file = tmp_path / "pw.txt"
+    password_file.write_text(PASSWORD, encoding="utf-8")
+    bad = tmp_path / "bad.csv"
+    # 字段超过 csv 模块的长度上限，读取时抛出 csv.Error
+    bad.write_text('name,url,username,password,notes,category\n"' + "x" * (csv.field_size_limit() + 1) + '",u,n,p,,\n',
+                   encoding="utf-8")
+
+    code = cli.main(["--vault", str(tmp_path / "passwords.dat"), "--password-file", str(password_file),
+                     "--no-agent", "import", str(bad), "--format", "csv"])
+    assert code == cli.EXIT_ERROR
+    assert "错误: field larger than field limit" in capsys.readouterr().err